@@ -24,7 +24,9 @@ except ImportError as err:
     print("more info: http://click.pocoo.org")
     sys.exit(-1)
 
-from MC6809.core.bechmark import run_benchmark
+from MC6809.core.bechmark import run_benchmark, run_dispatch_benchmark, \
+    run_flag_table_benchmark
+from MC6809.core.benchmark_suite import CPU_CLASSES, run_benchmark_suite
 
 
 @click.group()
@@ -49,9 +51,39 @@ DEFAULT_MULTIPLY = 15
     help="How many benchmark loops should be run? (default: %i)" % DEFAULT_LOOPS)
 @click.option("--multiply", default=DEFAULT_MULTIPLY,
     help="Test data multiplier (default: %i)" % DEFAULT_MULTIPLY)
-def benchmark(loops, multiply):
-    run_benchmark(loops, multiply)
-
+@click.option("--compare-dispatch", is_flag=True,
+    help="Compare opcode_dict lookup against the flat dispatch tables")
+@click.option("--block-cache", is_flag=True,
+    help="Run translated basic blocks instead of single ops")
+@click.option("--decode-cache", is_flag=True,
+    help="Run pre-decoded ops")
+@click.option("--slotted-registers", is_flag=True,
+    help="Use the slotted register classes")
+@click.option("--lazy-flags", is_flag=True,
+    help="Calculate the condition code flags only on demand")
+@click.option("--flag-tables", is_flag=True,
+    help="Compare the flag calculation with and without the precomputed tables")
+def benchmark(loops, multiply, compare_dispatch, block_cache, decode_cache, slotted_registers,
+            lazy_flags, flag_tables):
+    if compare_dispatch:
+        run_dispatch_benchmark(loops, multiply)
+    elif flag_tables:
+        run_flag_table_benchmark(loops * 100)
+    else:
+        run_benchmark(loops, multiply, block_cache, decode_cache, slotted_registers, lazy_flags)
+
+
+@cli.command(name="benchmark-suite", help="Run op code micro and program macro benchmarks")
+@click.option("--runs", default=DEFAULT_LOOPS,
+    help="How many times should every workload run? (default: %i)" % DEFAULT_LOOPS)
+@click.option("--filter", "pattern", default=None,
+    help="Run only workloads with a matching name or family, e.g.: '*ADD*'")
+@click.option("--cpu", default="default", type=click.Choice(sorted(CPU_CLASSES)),
+    help="CPU variant to benchmark")
+@click.option("--json", "json_filename", default=None,
+    help="Save the results into this JSON file")
+def benchmark_suite(runs, pattern, cpu, json_filename):
+    run_benchmark_suite(runs, pattern, json_filename, CPU_CLASSES[cpu])
 
 
 if __name__ == "__main__":
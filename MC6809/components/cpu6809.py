@@ -24,7 +24,10 @@
 from __future__ import absolute_import, division, print_function
 
 import sys
-from MC6809.components.mc6809_cc_register import CPUConditionCodeRegisterMixin
+from MC6809.components.cpu_utils.MC6809_registers import SlottedAccumulator8Bit, \
+    SlottedConcatenatedAccumulator, SlottedRegister16Bit, SlottedRegister8Bit
+from MC6809.components.mc6809_cc_register import CPUConditionCodeRegisterMixin, \
+    LazyConditionCodeRegisterMixin
 from MC6809.components.mc6809_speedlimited import CPUSpeedLimitMixin
 
 if sys.version_info[0] == 3:
@@ -45,6 +48,10 @@ from MC6809.components.mc6809_ops_branches import OpsBranchesMixin
 from MC6809.components.mc6809_ops_logic import OpsLogicalMixin
 from MC6809.components.mc6809_ops_test import OpsTestMixin
 from MC6809.components.mc6809_base import CPUBase
+from MC6809.components.mc6809_block_cache import BlockCacheMixin
+from MC6809.components.mc6809_decode_cache import DecodeCacheMixin
+from MC6809.components.mc6809_snapshot import SnapshotMixin
+from MC6809.components.mc6809_time_travel import TimeTravelMixin
 from MC6809.components.mc6809_tools import CPUThreadedStatusMixin, CPUTypeAssertMixin
 
 log = logging.getLogger("MC6809")
@@ -55,7 +62,8 @@ HTML_TRACE = False
 
 
 class CPU(CPUBase, AddressingMixin, StackMixin, InterruptMixin, OpsLoadStoreMixin, OpsBranchesMixin,
-    OpsTestMixin, OpsLogicalMixin, CPUConditionCodeRegisterMixin, CPUThreadedStatusMixin):
+    OpsTestMixin, OpsLogicalMixin, CPUConditionCodeRegisterMixin, CPUThreadedStatusMixin,
+    SnapshotMixin):
 
     def to_speed_limit(self):
         return change_cpu(self, CPUSpeedLimit)
@@ -75,12 +83,38 @@ class CPUControlServer(CPUControlServerMixin, CPU):
     pass
 
 
+class CPUBlockCache(BlockCacheMixin, CPU):
+    pass
+
+
+class CPUDecodeCache(DecodeCacheMixin, CPU):
+    pass
+
+
+class CPUSlottedRegisters(CPU):
+    REGISTER_8BIT = SlottedRegister8Bit
+    REGISTER_16BIT = SlottedRegister16Bit
+    ACCUMULATOR_8BIT = SlottedAccumulator8Bit
+    ACCUMULATOR_D = SlottedConcatenatedAccumulator
+
+
+class CPULazyFlags(LazyConditionCodeRegisterMixin, CPU):
+    pass
+
+
+class CPUTimeTravel(TimeTravelMixin, CPU):
+    pass
+
+
 def change_cpu(old_cpu, NewCPU):
     old_cpu.running = False
-    cpu_state = old_cpu.get_state()
+    # The memory is shared, so only the registers must be transferred:
+    cpu_state = old_cpu.get_state(ram=False)
 
     new_cpu = NewCPU(memory=old_cpu.memory, cfg=old_cpu.cfg)
     new_cpu.set_state(cpu_state)
+    new_cpu.scheduler = old_cpu.scheduler # keep all sync callbacks
+    new_cpu.interrupt_lines = old_cpu.interrupt_lines
 
     log.critical("Change CPU from %r to %r",
         old_cpu.__class__.__name__,
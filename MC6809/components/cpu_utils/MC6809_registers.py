@@ -119,6 +119,125 @@ class ConcatenatedAccumulator(object):
         return "%s=%04x" % (self.name, self.value)
 
 
+class SlottedRegister8Bit(object):
+    """
+    Register without range check branches: The value will be masked.
+    Same API as ValueStorage8Bit
+
+    >>> dp = SlottedRegister8Bit(name="DP", initial_value=0)
+    >>> dp.set(0x123)
+    >>> dp
+    DP=23
+    >>> dp.decrement(0x24)
+    >>> dp
+    DP=ff
+    """
+    __slots__ = ("name", "value")
+    WIDTH = 8 # 8 Bit
+
+    def __init__(self, name, initial_value):
+        self.name = name
+        self.value = initial_value & 0xff
+
+    def set(self, v):
+        self.value = v & 0xff
+
+    def decrement(self, value=1):
+        self.set(self.value - value)
+
+    def increment(self, value=1):
+        self.set(self.value + value)
+
+    def __str__(self):
+        return "%s=%02x" % (self.name, self.value)
+    __repr__ = __str__
+
+
+class SlottedRegister16Bit(SlottedRegister8Bit):
+    """
+    Same API as ValueStorage16Bit
+
+    >>> x = SlottedRegister16Bit(name="X", initial_value=0xffff)
+    >>> x.increment(2)
+    >>> x
+    X=0001
+    """
+    __slots__ = ()
+    WIDTH = 16 # 16 Bit
+
+    def __init__(self, name, initial_value):
+        self.name = name
+        self.value = initial_value & 0xffff
+
+    def set(self, v):
+        self.value = v & 0xffff
+
+    def increment(self, value=1):
+        self.value = (self.value + value) & 0xffff
+
+    def decrement(self, value=1):
+        self.value = (self.value - value) & 0xffff
+
+    def __str__(self):
+        return "%s=%04x" % (self.name, self.value)
+    __repr__ = __str__
+
+
+class SlottedAccumulator8Bit(SlottedRegister8Bit):
+    """
+    Accumulator A or B: Will update D on every change.
+    """
+    __slots__ = ("accu_d",)
+
+    def __init__(self, name, initial_value):
+        super(SlottedAccumulator8Bit, self).__init__(name, initial_value)
+        self.accu_d = None # will be set in SlottedConcatenatedAccumulator()
+
+    def set(self, v):
+        self.value = v & 0xff
+        accu_d = self.accu_d
+        accu_d.value = accu_d.accu_a.value << 8 | accu_d.accu_b.value
+
+
+class SlottedConcatenatedAccumulator(object):
+    """
+    6809 has register D - 16 bit concatenated reg. (A + B)
+    'value' is a plain attribute and not a property: A, B and D are
+    always updated together.
+
+    >>> a = SlottedAccumulator8Bit(name="A", initial_value=0x12)
+    >>> b = SlottedAccumulator8Bit(name="B", initial_value=0x34)
+    >>> d = SlottedConcatenatedAccumulator("D", a, b)
+    >>> hex(d.value)
+    '0x1234'
+    >>> a.set(0x100 - 1)
+    >>> hex(d.value)
+    '0xff34'
+    >>> d.set(0xabcd)
+    >>> a, b
+    (A=ab, B=cd)
+    """
+    __slots__ = ("name", "value", "accu_a", "accu_b")
+    WIDTH = 16 # 16 Bit
+
+    def __init__(self, name, a, b):
+        self.name = name
+        self.accu_a = a
+        self.accu_b = b
+        a.accu_d = self
+        b.accu_d = self
+        self.value = a.value << 8 | b.value
+
+    def set(self, value):
+        value = value & 0xffff
+        self.value = value
+        self.accu_a.value = value >> 8
+        self.accu_b.value = value & 0xff
+
+    def __str__(self):
+        return "%s=%04x" % (self.name, self.value)
+
+
 def convert_differend_width(src_reg, dst_reg):
     """
     e.g.:
@@ -10,6 +10,7 @@
 
 from __future__ import absolute_import, division, print_function
 
+import array
 import inspect
 
 from MC6809.components.MC6809data.MC6809_data_utils import MC6809OP_DATA_DICT
@@ -30,11 +31,15 @@ class OpCollection(object):
     def __init__(self, cpu):
         self.cpu = cpu
         self.opcode_dict = {}
+        self.instr_func_dict = {} # opcode -> not prepaged op method
         self.collect_ops()
 
     def get_opcode_dict(self):
         return self.opcode_dict
 
+    def get_instr_func_dict(self):
+        return self.instr_func_dict
+
     def collect_ops(self):
         # Get the members not from class instance, so that's possible to
         # exclude properties without "activate" them.
@@ -77,6 +82,50 @@ class OpCollection(object):
                 raise AttributeError("%s (op code: $%02x)" % (err, op_code))
 
             self.opcode_dict[op_code] = (op_code_data["cycles"], func)
+            self.instr_func_dict[op_code] = instr_func
+
+
+PAGE_PREFIXES = (
+    0x00, # page 0: all one byte opcodes
+    0x10, # page 1: $10xx opcodes
+    0x11, # page 2: $11xx opcodes
+)
+
+
+def build_dispatch_tables(opcode_dict, unknown_op_func):
+    """
+    Build flat lookup tables from a opcode dict, indexed by the raw opcode
+    byte. So the CPU needs no hashing and no tuple unpacking per op call.
+
+    Returns a dict with the page prefix as key (0x00, 0x10, 0x11) and
+    a (functions, cycles) tuple as value.
+    functions is a list with 256 bound op methods (unknown_op_func for
+    every undefined opcode) and cycles a array('b') with 256 cycle counts.
+    (signed, because the undocumented RESET op has -1 cycles in op data)
+
+    >>> def op(opcode): pass
+    >>> def unknown(opcode): pass
+    >>> tables = build_dispatch_tables({0x12: (2, op), 0x103f: (20, op)}, unknown)
+    >>> funcs, cycles = tables[0x00]
+    >>> len(funcs), len(cycles)
+    (256, 256)
+    >>> funcs[0x12] is op, cycles[0x12], funcs[0x13] is unknown, cycles[0x13]
+    (True, 2, True, 0)
+    >>> funcs, cycles = tables[0x10]
+    >>> funcs[0x3f] is op, cycles[0x3f]
+    (True, 20)
+    """
+    tables = {}
+    for prefix in PAGE_PREFIXES:
+        tables[prefix] = ([unknown_op_func] * 256, array.array("b", [0] * 256))
+
+    for op_code, (cycles, func) in opcode_dict.items():
+        prefix, op_byte = divmod(op_code, 256)
+        funcs, cycles_array = tables[prefix]
+        funcs[op_byte] = func
+        cycles_array[op_byte] = cycles
+
+    return tables
 
 
 if __name__ == "__main__":
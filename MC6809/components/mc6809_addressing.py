@@ -30,6 +30,72 @@ from MC6809.components.MC6809data.MC6809_op_data import (
     REG_S, REG_U, REG_X, REG_Y
 )
 
+
+# The register attribute names, index is: (postbyte >> 5) & 3
+INDEX_REGISTER_NAMES = ("index_x", "index_y", "user_stack_pointer", "system_stack_pointer")
+
+# Indexed mode if bit 7 of the postbyte is clear: EA = n, R with 5-bit offset
+INDEX_MODE_5BIT = 0x10
+
+
+def decode_indexed_postbyte(mem, address):
+    """
+    Pre-parse the indexed postbyte at 'address' and the following offset
+    bytes (like AddressingMixin.get_ea_indexed() but without executing it).
+
+    returns a tuple: (register name, mode, offset, length, cycles, indirect)
+
+    mode is the low nibble of the postbyte or INDEX_MODE_5BIT.
+    offset is the signed offset for the modes 5-bit, 0x8 and 0x9. For the
+    program counter relative modes 0xc, 0xd and the extended indirect mode
+    0xf it's the complete address. Otherwise None.
+    length is the number of bytes with the postbyte.
+    cycles are the cycles for reading the bytes and the extra mode cycles.
+
+    Returns None for the illegal mode 0x7.
+
+    >>> decode_indexed_postbyte([0x1f], 0) # -1,X
+    ('index_x', 16, -1, 1, 1, False)
+    >>> decode_indexed_postbyte([0xb1], 0) # [,Y++]
+    ('index_y', 1, None, 1, 3, True)
+    >>> decode_indexed_postbyte([0x00, 0x00, 0xc9, 0xff, 0xfe], 2) # -2,U
+    ('user_stack_pointer', 9, -2, 3, 5, False)
+    >>> decode_indexed_postbyte([0x8c, 0x10], 0) # $12,PCR
+    ('index_x', 12, 18, 2, 3, False)
+    """
+    postbyte = mem[address]
+    register_name = INDEX_REGISTER_NAMES[(postbyte >> 5) & 3]
+
+    if not postbyte & 0x80: # bit 7 == 0
+        return register_name, INDEX_MODE_5BIT, signed5(postbyte & 0x1f), 1, 1, False
+
+    mode = postbyte & 0x0f
+    indirect = bool(postbyte & 0x10)
+    offset = None
+    length = 1
+    cycles = 2
+    if mode == 0x8 or mode == 0xc: # 8 bit offset
+        offset = signed8(mem[address + 1])
+        length += 1
+        cycles += 1
+        if mode == 0xc: # from program counter
+            offset += address + length
+    elif mode == 0x9 or mode == 0xd or mode == 0xf: # 16 bit offset/address
+        offset = mem[address + 1] << 8 | mem[address + 2]
+        length += 2
+        cycles += 2
+        if mode != 0xf:
+            offset = signed16(offset)
+            cycles += 1
+            if mode == 0xd: # from program counter
+                offset += address + length
+    elif mode == 0x1 or mode == 0x3 or mode == 0xb: # ,R++ ,--R D,R
+        cycles += 1
+    elif mode == 0x7:
+        return None
+    return register_name, mode, offset, length, cycles, indirect
+
+
 class AddressingMixin(object):
 
     def get_m_immediate(self):
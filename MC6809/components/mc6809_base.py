@@ -26,6 +26,12 @@ from __future__ import absolute_import, division, print_function
 import sys
 import time
 from MC6809.components.mc6809_tools import calc_new_count
+from MC6809.components.mc6809_call_graph import CallGraphProfiler
+from MC6809.components.mc6809_idle_loop import IdleLoopDetector
+from MC6809.components.mc6809_interrupt import WaitForInterrupt
+from MC6809.components.mc6809_op_profiler import OpProfiler
+from MC6809.components.mc6809_sampling_profiler import SamplingProfiler, SymbolTable
+from MC6809.components.mc6809_scheduler import CycleScheduler
 
 if sys.version_info[0] == 3:
     # Python 3
@@ -42,13 +48,24 @@ from MC6809.components.cpu_utils.MC6809_registers import (
     ValueStorage8Bit, ConcatenatedAccumulator,
     ValueStorage16Bit, UndefinedRegister,
     convert_differend_width)
-from MC6809.components.cpu_utils.instruction_caller import OpCollection
+from MC6809.components.cpu_utils.instruction_caller import OpCollection, build_dispatch_tables
+from MC6809.components.mc6809_cc_register import ADD8_TABLE, DEC8_TABLE, INC8_TABLE, SUB8_TABLE
 from MC6809.utils.bits import is_bit_set, get_bit
 from MC6809.utils.byte_word_values import signed8, signed16, signed5
 from MC6809.components.MC6809data.MC6809_op_data import (
     REG_A, REG_B, REG_CC, REG_D, REG_DP, REG_PC,
     REG_S, REG_U, REG_X, REG_Y
 )
+from MC6809.components.MC6809data.MC6809_data_utils import MC6809OP_DATA_DICT
+
+
+# The most cycles of one op in the op data:
+MAX_OP_DATA_CYCLES = max(op_data["cycles"] for op_data in MC6809OP_DATA_DICT.values())
+
+# The interpreter counts every memory access as one cycle on top of the op
+# data cycles: fetching the op (max. 5 Bytes), stacking the entire state
+# (1 + 12 Bytes) and reading a interrupt vector (2 Bytes)
+MAX_OP_MEMORY_CYCLES = 5 + 1 + 12 + 2
 
 
 log = logging.getLogger("MC6809")
@@ -77,6 +94,12 @@ class CPUBase(object):
     min_burst_count = 10 # minimum outer op count per burst
     max_burst_count = 10000 # maximum outer op count per burst
 
+    # Register classes, see: MC6809_registers
+    REGISTER_8BIT = ValueStorage8Bit
+    REGISTER_16BIT = ValueStorage16Bit
+    ACCUMULATOR_8BIT = ValueStorage8Bit
+    ACCUMULATOR_D = ConcatenatedAccumulator
+
     def __init__(self, memory, cfg):
         self.memory = memory
         self.memory.cpu = self # FIXME
@@ -86,30 +109,34 @@ class CPUBase(object):
         self.cycles = 0
         self.last_op_address = 0 # Store the current run opcode memory address
         self.outer_burst_op_count = self.STARTUP_BURST_COUNT
+        self.scheduler = CycleScheduler() # CPU cycle triggered callbacks
+        self.idle_loop_detector = None
+        self.op_profiler = None
+        self.sampling_profiler = None
+        self.call_graph_profiler = None
 
         #start_http_control_server(self, cfg) # TODO: Move into seperate Class
 
-        self.index_x = ValueStorage16Bit(REG_X, 0) # X - 16 bit index register
-        self.index_y = ValueStorage16Bit(REG_Y, 0) # Y - 16 bit index register
+        self.index_x = self.REGISTER_16BIT(REG_X, 0) # X - 16 bit index register
+        self.index_y = self.REGISTER_16BIT(REG_Y, 0) # Y - 16 bit index register
 
-        self.user_stack_pointer = ValueStorage16Bit(REG_U, 0) # U - 16 bit user-stack pointer
-        self.user_stack_pointer.counter = 0
+        self.user_stack_pointer = self.REGISTER_16BIT(REG_U, 0) # U - 16 bit user-stack pointer
 
         # S - 16 bit system-stack pointer:
         # Position will be set by ROM code after detection of total installed RAM
-        self.system_stack_pointer = ValueStorage16Bit(REG_S, 0)
+        self.system_stack_pointer = self.REGISTER_16BIT(REG_S, 0)
 
         # PC - 16 bit program counter register
-        self.program_counter = ValueStorage16Bit(REG_PC, 0)
+        self.program_counter = self.REGISTER_16BIT(REG_PC, 0)
 
-        self.accu_a = ValueStorage8Bit(REG_A, 0) # A - 8 bit accumulator
-        self.accu_b = ValueStorage8Bit(REG_B, 0) # B - 8 bit accumulator
+        self.accu_a = self.ACCUMULATOR_8BIT(REG_A, 0) # A - 8 bit accumulator
+        self.accu_b = self.ACCUMULATOR_8BIT(REG_B, 0) # B - 8 bit accumulator
 
         # D - 16 bit concatenated reg. (A + B)
-        self.accu_d = ConcatenatedAccumulator(REG_D, self.accu_a, self.accu_b)
+        self.accu_d = self.ACCUMULATOR_D(REG_D, self.accu_a, self.accu_b)
 
         # DP - 8 bit direct page register
-        self.direct_page = ValueStorage8Bit(REG_DP, 0)
+        self.direct_page = self.REGISTER_8BIT(REG_DP, 0)
 
         super(CPUBase, self).__init__()
 
@@ -133,7 +160,10 @@ class CPUBase(object):
         }
 
 #         log.debug("Add opcode functions:")
-        self.opcode_dict = OpCollection(self).get_opcode_dict()
+        op_collection = OpCollection(self)
+        self.opcode_dict = op_collection.get_opcode_dict()
+        self.instr_func_dict = op_collection.get_instr_func_dict()
+        self.build_dispatch_tables()
 
 #         log.debug("illegal ops: %s" % ",".join(["$%x" % c for c in ILLEGAL_OPS]))
         # add illegal instruction
@@ -141,11 +171,11 @@ class CPUBase(object):
 #             self.opcode_dict[opcode] = IllegalInstruction(self, opcode)
 
 
-    def get_state(self):
+    def get_state(self, ram=True):
         """
         used in unittests
         """
-        return {
+        state = {
             REG_X: self.index_x.value,
             REG_Y: self.index_y.value,
 
@@ -161,8 +191,10 @@ class CPUBase(object):
             REG_CC: self.get_cc_value(),
 
             "cycles": self.cycles,
-            "RAM": tuple(self.memory._mem) # copy of array.array() values,
         }
+        if ram:
+            state["RAM"] = self.memory.get_image().tobytes() # copy of the memory
+        return state
 
     def set_state(self, state):
         """
@@ -183,7 +215,8 @@ class CPUBase(object):
         self.set_cc(state[REG_CC])
 
         self.cycles = state["cycles"]
-        self.memory.load(address=0x0000, data=state["RAM"])
+        if "RAM" in state:
+            self.memory.set_image(state["RAM"])
 
     ####
 
@@ -221,77 +254,247 @@ class CPUBase(object):
 
     ####
 
+    def build_dispatch_tables(self):
+        """
+        (Re-)Build the flat op lookup tables from self.opcode_dict
+        Must be called after self.opcode_dict entries are changed.
+        """
+        tables = build_dispatch_tables(self.opcode_dict, self.unknown_op)
+        self.op_funcs, self.op_cycles = tables[0x00]
+        self.paged_dispatch_tables = {
+            0x10: tables[0x10], # PAGE 2 instructions
+            0x11: tables[0x11], # PAGE 3 instructions
+        }
+
     def get_and_call_next_op(self):
         op_address, opcode = self.read_pc_byte()
-        # try:
-        self.call_instruction_func(op_address, opcode)
-        # except Exception as err:
-        #     try:
-        #         msg = "%s - op address: $%04x - opcode: $%02x" % (err, op_address, opcode)
-        #     except TypeError: # e.g: op_address or opcode is None
-        #         msg = "%s - op address: %r - opcode: %r" % (err, op_address, opcode)
-        #     exception = err.__class__ # Use origin Exception class, e.g.: KeyError
-        #     raise exception(msg)
+        self.last_op_address = op_address
+        self.op_funcs[opcode](opcode)
+        self.cycles += self.op_cycles[opcode]
 
     def quit(self):
         log.critical("CPU quit() called.")
         self.running = False
 
     def call_instruction_func(self, op_address, opcode):
+        """
+        Call a op via self.opcode_dict
+        The run loop use the flat dispatch tables, see: get_and_call_next_op()
+        """
         self.last_op_address = op_address
         try:
             cycles, instr_func = self.opcode_dict[opcode]
         except KeyError:
-            msg = "$%x *** UNKNOWN OP $%x" % (op_address, opcode)
-            log.error(msg)
-            sys.exit(msg)
+            self.unknown_op(opcode)
 
         instr_func(opcode)
         self.cycles += cycles
 
+    def unknown_op(self, opcode):
+        msg = "$%x *** UNKNOWN OP $%x" % (self.last_op_address, opcode)
+        log.error(msg)
+        sys.exit(msg)
+
 
     ####
 
-    # TODO: Move to __init__
-    quickest_sync_callback_cycles = None
-    sync_callbacks_cyles = {}
-    sync_callbacks = []
     def add_sync_callback(self, callback_cycles, callback):
-        """ Add a CPU cycle triggered callback """
-        self.sync_callbacks_cyles[callback] = 0
-        self.sync_callbacks.append([callback_cycles, callback])
-        if self.quickest_sync_callback_cycles is None or \
-                        self.quickest_sync_callback_cycles > callback_cycles:
-            self.quickest_sync_callback_cycles = callback_cycles
+        """
+        Add a CPU cycle triggered callback, called every 'callback_cycles'
+        with the CPU cycles since the last call.
+        returns the CycleEvent, e.g. to cancel it.
+        """
+        return self.scheduler.add(
+            self.cycles + callback_cycles, callback,
+            interval=callback_cycles, start_cycles=self.cycles
+        )
+
+    def add_cycle_event(self, delay_cycles, callback):
+        """
+        Call 'callback' one time, 'delay_cycles' CPU cycles from now.
+        The callback can reschedule the returned CycleEvent.
+        """
+        return self.scheduler.add(
+            self.cycles + delay_cycles, callback, start_cycles=self.cycles
+        )
 
     def call_sync_callbacks(self):
-        """ Call every sync callback with CPU cycles trigger """
-        current_cycles = self.cycles
-        for callback_cycles, callback in self.sync_callbacks:
-            # get the CPU cycles count of the last call
-            last_call_cycles = self.sync_callbacks_cyles[callback]
+        """ Call every due sync callback/cycle event """
+        if self.cycles >= self.scheduler.next_deadline:
+            self.scheduler.run_due(self.cycles)
 
-            if current_cycles - last_call_cycles > callback_cycles:
-                # this callback should be called
+    # TODO: Move to __init__
+    inner_burst_op_count = 100 # How many ops calls, before next sync call
 
-                # Save the current cycles, to trigger the next call
-                self.sync_callbacks_cyles[callback] = self.cycles
+    # The run loop calls the ops via the dispatch tables, build from
+    # self.opcode_dict: Wrapped entries (e.g. by the profilers) will be
+    # called. False for CPUs that call the op methods directly.
+    dispatch_via_opcode_dict = True
 
-                # Call the callback function
-                callback(current_cycles - last_call_cycles)
+    # Upper bound of CPU cycles of one get_and_call_next_op() call
+    # e.g.: CWAI with a pending IRQ needs 38 cycles incl. all memory accesses
+    max_op_cycles = MAX_OP_DATA_CYCLES + MAX_OP_MEMORY_CYCLES
 
-    # TODO: Move to __init__
-    inner_burst_op_count = 100 # How many ops calls, before next sync call
     def burst_run(self):
-        """ Run CPU as fast as Python can... """
+        """
+        Run CPU as fast as Python can...
+
+        Runs outer_burst_op_count * inner_burst_op_count ops. The ops are
+        called in chunks that can't run over the next scheduler deadline:
+        So every due event is called at the first op boundary at/after
+        its cycle, without a check after every op.
+        Pending interrupts are serviced after every chunk.
+        While SYNC/CWAI waits, the cycles jump from event to event.
+        With idle loop detection, the chunks are shorter and idle loop
+        passes will be skipped, see: enable_idle_loop_detection()
+        """
         # https://wiki.python.org/moin/PythonSpeed/PerformanceTips#Avoiding_dots...
+        run_chunk = self.run_chunk
+        scheduler = self.scheduler
+        max_op_cycles = self.max_op_cycles
+        idle_loop_detector = self.idle_loop_detector
+
+        op_count = self.outer_burst_op_count * self.inner_burst_op_count
+        while op_count > 0:
+            if self.waiting:
+                # SYNC/CWAI: no ops, jump to the next event
+                op_count -= 1
+                if not self.wait_for_interrupt():
+                    break # nothing can end the wait state in this burst
+                continue
+
+            count = (scheduler.next_deadline - self.cycles) // max_op_cycles
+            if count < 1:
+                count = 1
+            elif count > op_count:
+                count = op_count
+            if idle_loop_detector is not None and count > idle_loop_detector.next_chunk_ops:
+                count = idle_loop_detector.next_chunk_ops
+            op_count -= count
+
+            run_chunk(count)
+            if idle_loop_detector is not None and not self.waiting:
+                op_count = idle_loop_detector.check(op_count)
+
+    def run_chunk(self, count):
+        """
+        Call 'count' ops, then call the due events and service pending
+        interrupts. SYNC/CWAI drops the rest of the chunk.
+        The caller must limit 'count', so the ops can't run over the next
+        scheduler deadline, see: burst_run()
+        """
         get_and_call_next_op = self.get_and_call_next_op
-
-        for __ in range(self.outer_burst_op_count):
-            for __ in range(self.inner_burst_op_count):
+        try:
+            for __ in range(count):
                 get_and_call_next_op()
+        except WaitForInterrupt:
+            pass # self.waiting is set
 
-            self.call_sync_callbacks()
+        scheduler = self.scheduler
+        if self.cycles >= scheduler.next_deadline:
+            scheduler.run_due(self.cycles)
+        if self.interrupt_lines:
+            self.check_interrupts()
+
+    def enable_idle_loop_detection(self, status_addresses=()):
+        """
+        Skip the passes of idle loops in burst_run(), see: IdleLoopDetector
+        Note: The skipped ops will not be executed, e.g.: the op count of
+        the time travel CPU will be wrong.
+        """
+        self.idle_loop_detector = IdleLoopDetector(self, status_addresses)
+        return self.idle_loop_detector
+
+    def disable_idle_loop_detection(self):
+        self.idle_loop_detector = None
+
+    def _check_opcode_dict_dispatch(self, profiler_name):
+        if not self.dispatch_via_opcode_dict:
+            raise RuntimeError("The %s needs a CPU that calls the ops via opcode_dict, not: %s" % (
+                profiler_name, self.__class__.__name__
+            ))
+
+    def enable_op_profiler(self):
+        """
+        Count calls, cycles and host time per opcode, see: OpProfiler
+        """
+        if self.op_profiler is None:
+            self._check_opcode_dict_dispatch("op profiler")
+            self.op_profiler = OpProfiler(self)
+            self.op_profiler.install()
+        return self.op_profiler
+
+    def disable_op_profiler(self):
+        """
+        Restore the origin op methods. Returns the profiler with the results.
+        """
+        op_profiler = self.op_profiler
+        if op_profiler is not None:
+            op_profiler.uninstall()
+            self.op_profiler = None
+        return op_profiler
+
+    def enable_sampling_profiler(self, interval_cycles=10000, symbol_file=None):
+        """
+        Sample the guest PC and call stack every 'interval_cycles' cycles,
+        see: SamplingProfiler
+        symbol_file -- optional file with 'address name' lines, otherwise
+            the addresses are symbolized via cfg.mem_info
+        """
+        if self.sampling_profiler is None:
+            self._check_opcode_dict_dispatch("sampling profiler")
+            symbol_table = None
+            if symbol_file is not None:
+                symbol_table = SymbolTable()
+                symbol_table.load_file(symbol_file)
+            self.sampling_profiler = SamplingProfiler(self, interval_cycles, symbol_table)
+            self.sampling_profiler.install()
+        return self.sampling_profiler
+
+    def disable_sampling_profiler(self):
+        """
+        Stop sampling. Returns the profiler with the samples.
+        """
+        sampling_profiler = self.sampling_profiler
+        if sampling_profiler is not None:
+            sampling_profiler.uninstall()
+            self.sampling_profiler = None
+        return sampling_profiler
+
+    def enable_call_graph_profiler(self, symbol_file=None):
+        """
+        Count calls and inclusive/exclusive cycles per subroutine,
+        see: CallGraphProfiler
+        symbol_file -- optional file with 'address name' lines
+        """
+        if self.call_graph_profiler is None:
+            self._check_opcode_dict_dispatch("call graph profiler")
+            symbol_table = None
+            if symbol_file is not None:
+                symbol_table = SymbolTable()
+                symbol_table.load_file(symbol_file)
+            self.call_graph_profiler = CallGraphProfiler(self, symbol_table)
+            self.call_graph_profiler.install()
+        return self.call_graph_profiler
+
+    def disable_call_graph_profiler(self):
+        """
+        End all open subroutine calls. Returns the profiler with the results.
+        """
+        call_graph_profiler = self.call_graph_profiler
+        if call_graph_profiler is not None:
+            call_graph_profiler.uninstall()
+            self.call_graph_profiler = None
+        return call_graph_profiler
+
+    def skip_idle_loop(self, count, loop_cycles):
+        """
+        Skip 'count' passes of a idle loop with 'loop_cycles' per pass.
+        Returns the number of skipped passes.
+        Without a speed limit the cycles jump to the next deadline.
+        """
+        self.cycles += count * loop_cycles
+        return count
 
     def run(self, max_run_time=0.1, target_cycles_per_sec=None):
         now = time.time
@@ -327,7 +530,14 @@ class CPUBase(object):
         for __ in range(max_ops):
             if program_counter.value == end:
                 return
-            get_and_call_next_op()
+            try:
+                get_and_call_next_op()
+            except WaitForInterrupt:
+                while self.waiting:
+                    if not self.wait_for_interrupt():
+                        raise RuntimeError("$%04x waits for a interrupt, but no event is scheduled!" % (
+                            self.last_op_address
+                        ))
         log.critical("Max ops %i arrived!", max_ops)
         raise RuntimeError("Max ops %i arrived!" % max_ops)
 
@@ -393,7 +603,10 @@ class CPUBase(object):
 #        log.debug("$%x *** call paged opcode $%x" % (
 #            self.program_counter, paged_opcode
 #        ))
-        self.call_instruction_func(op_address - 1, paged_opcode)
+        funcs, cycles = self.paged_dispatch_tables[opcode]
+        self.last_op_address = op_address - 1
+        funcs[opcode2](paged_opcode)
+        self.cycles += cycles[opcode2]
 
     @opcode(# Add B accumulator to X (unsigned)
         0x3a, # ABX (inherent)
@@ -422,14 +635,14 @@ class CPUBase(object):
         CC bits "HNZVC": aaaaa
         """
         a = register.value
-        r = a + m + self.C
+        carry = self.C
+        r = a + m + carry
         register.set(r)
 #        log.debug("$%x %02x ADC %s: %i + %i + %i = %i (=$%x)" % (
 #            self.program_counter, opcode, register.name,
-#            a, m, self.C, r, r
+#            a, m, carry, r, r
 #        ))
-        self.clear_HNZVC()
-        self.update_HNZVC_8(a, m, r)
+        self.assign_HNZVC(ADD8_TABLE[carry << 16 | a << 8 | m])
 
     @opcode(# Add memory to D accumulator
         0xc3, 0xd3, 0xe3, 0xf3, # ADDD (immediate, direct, indexed, extended)
@@ -475,8 +688,7 @@ class CPUBase(object):
 #             register.name,
 #             old, m, r
 #         ))
-        self.clear_HNZVC()
-        self.update_HNZVC_8(old, m, r)
+        self.assign_HNZVC(ADD8_TABLE[old << 8 | m])
 
     @opcode(0xf, 0x6f, 0x7f) # CLR (direct, indexed, extended)
     def instruction_CLR_memory(self, opcode, ea):
@@ -609,12 +821,8 @@ class CPUBase(object):
 
         CC bits "HNZVC": -aaa-
         """
-        r = a - 1
-        self.clear_NZV()
-        self.update_NZ_8(r)
-        if r == 0x7f:
-            self.V = 1
-        return r
+        self.assign_NZV(DEC8_TABLE[a])
+        return a - 1
 
     @opcode(0xa, 0x6a, 0x7a) # DEC (direct, indexed, extended)
     def instruction_DEC_memory(self, opcode, ea, m):
@@ -639,12 +847,8 @@ class CPUBase(object):
         register.set(r)
 
     def INC(self, a):
-        r = a + 1
-        self.clear_NZV()
-        self.update_NZ_8(r)
-        if r == 0x80:
-            self.V = 1
-        return r
+        self.assign_NZV(INC8_TABLE[a])
+        return a + 1
 
     @opcode(# Increment accumulator
         0x4c, # INCA (inherent)
@@ -785,8 +989,7 @@ class CPUBase(object):
 #        log.debug("$%04x NEG %s $%02x to $%02x" % (
 #            self.program_counter, register.name, x, r,
 #        ))
-        self.clear_NZVC()
-        self.update_NZVC_8(0, x, r)
+        self.assign_NZVC(SUB8_TABLE[x]) # 0 - x
 
     _wrong_NEG = 0
     @opcode(0x0, 0x60, 0x70) # NEG (direct, indexed, extended)
@@ -804,8 +1007,7 @@ class CPUBase(object):
 #        log.debug("$%04x NEG $%02x from %04x to $%02x" % (
 #             self.program_counter, m, ea, r,
 #         ))
-        self.clear_NZVC()
-        self.update_NZVC_8(0, m, r)
+        self.assign_NZVC(SUB8_TABLE[m]) # 0 - m
         return ea, r & 0xff
 
     @opcode(0x12) # NOP (inherent)
@@ -836,14 +1038,14 @@ class CPUBase(object):
         CC bits "HNZVC": uaaaa
         """
         a = register.value
-        r = a - m - self.C
+        carry = self.C
+        r = a - m - carry
         register.set(r)
 #        log.debug("$%x %02x SBC %s: %i - %i - %i = %i (=$%x)" % (
 #            self.program_counter, opcode, register.name,
-#            a, m, self.C, r, r
+#            a, m, carry, r, r
 #        ))
-        self.clear_NZVC()
-        self.update_NZVC_8(a, m, r)
+        self.assign_NZVC(SUB8_TABLE[carry << 16 | a << 8 | m])
 
     @opcode(# Sign Extend B accumulator into A accumulator
         0x1d, # SEX (inherent)
@@ -903,10 +1105,10 @@ class CPUBase(object):
 #            r, m, r_new,
 #            r, m, r_new,
 #        ))
-        self.clear_NZVC()
         if register.WIDTH == 8:
-            self.update_NZVC_8(r, m, r_new)
+            self.assign_NZVC(SUB8_TABLE[r << 8 | m])
         else:
+            self.clear_NZVC()
             assert register.WIDTH == 16
             self.update_NZVC_16(r, m, r_new)
 
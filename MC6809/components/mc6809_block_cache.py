@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+    MC6809 - 6809 CPU emulator in Python
+    =======================================
+
+    Basic block translation cache:
+
+    A straight-line run of ops (up to the next op that may change the
+    program counter, e.g.: branch, JMP, JSR, RTS, PULS) will be decoded
+    only one time and translated into one Python function. All operands
+    and addressing modes are resolved while translating.
+    The functions are cached by start address and dropped if the
+    memory with the translated code will be changed.
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import inspect
+import logging
+
+from MC6809.components.MC6809data.MC6809_data_utils import MC6809OP_DATA_DICT
+from MC6809.components.MC6809data.MC6809_op_data import BYTE, WORD
+from MC6809.components.cpu_utils.Instruction_generator import REGISTER_DICT
+from MC6809.components.mc6809_addressing import INDEX_MODE_5BIT, decode_indexed_postbyte
+from MC6809.utils.byte_word_values import signed8, signed16
+
+
+log = logging.getLogger("MC6809")
+
+
+# Ops that may change the program counter: They are always the last op of a block
+BLOCK_END_MNEMONICS = frozenset((
+    "JMP", "JSR", "RTS", "RTI", "SWI", "SWI2", "SWI3", "SYNC", "CWAI",
+    "PULS", "PULU", # may pull PC
+    "TFR", "EXG", # may use PC as destination
+    "ANDCC", # may service a pending interrupt
+))
+
+# Ops that change memory in the op method itself:
+# Check after them if the current block was invalidated.
+MEMORY_WRITE_MNEMONICS = frozenset(("PSHS", "PSHU"))
+
+
+def get_arg_names(func):
+    """
+    >>> class Foo(object):
+    ...     def bar(self, opcode, m, register): pass
+    >>> get_arg_names(Foo().bar)
+    ['opcode', 'm', 'register']
+    """
+    try:
+        arg_names = inspect.getfullargspec(func).args
+    except AttributeError: # Python 2
+        arg_names = inspect.getargspec(func).args
+    if inspect.ismethod(func):
+        arg_names = arg_names[1:] # remove 'self'
+    return arg_names
+
+
+class BlockCompiler(object):
+    """
+    Translate 6809 code into Python functions.
+    The code is read directly from memory, so only code in pages without
+    read callbacks/middlewares will be translated.
+    """
+    max_block_ops = 32
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.memory = cpu.memory
+        self._arg_names_cache = {}
+
+        try:
+            self.page_cycles = cpu.opcode_dict[0x10][0]
+        except KeyError:
+            self.page_cycles = 0
+
+    def _get_arg_names(self, instr_func):
+        try:
+            return self._arg_names_cache[instr_func]
+        except KeyError:
+            arg_names = get_arg_names(instr_func)
+            self._arg_names_cache[instr_func] = arg_names
+            return arg_names
+
+    def _indexed_code(self, address, length, lines):
+        """
+        Generate the code to calculate 'ea' for all indexed addressing modes.
+        Like AddressingMixin.get_ea_indexed(), but with a pre-parsed postbyte.
+
+        return new length and the number of cycles before the op call
+        or None if the postbyte is illegal.
+        """
+        decoded = decode_indexed_postbyte(self.memory._mem, address + length)
+        if decoded is None:
+            return None
+        register, mode, offset, postbyte_length, cycles, indirect = decoded
+
+        if mode == INDEX_MODE_5BIT:
+            # EA = n, R - use 5-bit offset from post-byte
+            lines.append("ea = %s.value + %i" % (register, offset))
+            return length + postbyte_length, cycles
+
+        if mode == 0x0: # ,R+
+            lines.append("ea = %s.value" % register)
+            lines.append("%s.increment(1)" % register)
+        elif mode == 0x1: # ,R++
+            lines.append("ea = %s.value" % register)
+            lines.append("%s.increment(2)" % register)
+        elif mode == 0x2: # ,-R
+            lines.append("%s.decrement(1)" % register)
+            lines.append("ea = %s.value" % register)
+        elif mode == 0x3: # ,--R
+            lines.append("%s.decrement(2)" % register)
+            lines.append("ea = %s.value" % register)
+        elif mode == 0x4: # ,R
+            lines.append("ea = %s.value" % register)
+        elif mode == 0x5: # B,R
+            lines.append("ea = %s.value + signed8(accu_b.value)" % register)
+        elif mode == 0x6: # A,R
+            lines.append("ea = %s.value + signed8(accu_a.value)" % register)
+        elif mode == 0x8 or mode == 0x9: # n,R - 8/16 bit offset
+            lines.append("ea = %s.value + %i" % (register, offset))
+        elif mode == 0xa: # illegal
+            lines.append("ea = 0")
+        elif mode == 0xb: # D,R
+            lines.append("ea = %s.value + signed16(accu_d.value)" % register)
+        elif mode == 0xe: # illegal
+            lines.append("ea = 0xffff")
+        else: # n,PCR and [n]: the address is known
+            lines.append("ea = 0x%x" % offset)
+
+        lines.append("ea = ea & 0xffff")
+        if indirect:
+            lines.append("ea = read_word(ea)")
+        return length + postbyte_length, cycles
+
+    def _translate_op(self, address, args):
+        """
+        Generate the code for the op at address.
+        Return (code lines, next address, ends block) or None if the op
+        can't be translated.
+        """
+        memory = self.memory
+        mem = memory._mem
+
+        if address + 5 > 0x10000:
+            return None
+        read_word_pages = memory._read_word_pages
+        if read_word_pages[address >> 8] or read_word_pages[(address + 4) >> 8]:
+            # Reading the op will call callbacks/middlewares
+            return None
+
+        op = mem[address]
+        length = 1
+        cycles_before = 1 # op fetch
+        cycles_after = 0
+        if op in (0x10, 0x11): # PAGE 2/3 instructions
+            opcode = op << 8 | mem[address + 1]
+            length += 1
+            cycles_before += 1
+            cycles_after += self.page_cycles
+        else:
+            opcode = op
+
+        try:
+            instr_func = self.cpu.instr_func_dict[opcode]
+        except KeyError:
+            return None # unknown op
+
+        op_data = MC6809OP_DATA_DICT[opcode]
+        addr_mode = op_data["addr_mode"]
+        if addr_mode is None:
+            # RESET
+            return None
+        mnemonic = op_data["mnemonic"]
+        cycles_after += op_data["cycles"]
+        read = op_data["read_from_memory"]
+        write = op_data["write_to_memory"]
+
+        lines = []
+        kwargs = {"opcode": "0x%x" % opcode}
+        if addr_mode in ("IMMEDIATE", "IMMEDIATE_WORD"):
+            if addr_mode == "IMMEDIATE":
+                kwargs["m"] = "0x%02x" % mem[address + length]
+                length += 1
+                cycles_before += 1
+            else:
+                kwargs["m"] = "0x%04x" % (mem[address + length] << 8 | mem[address + length + 1])
+                length += 2
+                cycles_before += 2
+        elif addr_mode in ("RELATIVE", "RELATIVE_WORD"):
+            if addr_mode == "RELATIVE":
+                ea = address + length + 1 + signed8(mem[address + length])
+                length += 1
+                cycles_before += 1
+            else:
+                ea = address + length + 2 + (mem[address + length] << 8 | mem[address + length + 1])
+                length += 2
+                cycles_before += 2
+            kwargs["ea"] = "0x%x" % ea
+        elif addr_mode != "INHERENT":
+            if addr_mode in ("DIRECT", "DIRECT_WORD"):
+                lines.append("ea = direct_page.value << 8 | 0x%02x" % mem[address + length])
+                length += 1
+                cycles_before += 1
+            elif addr_mode in ("EXTENDED", "EXTENDED_WORD"):
+                lines.append("ea = 0x%04x" % (mem[address + length] << 8 | mem[address + length + 1]))
+                length += 2
+                cycles_before += 2
+            else:
+                assert addr_mode in ("INDEXED", "INDEXED_WORD"), addr_mode
+                result = self._indexed_code(address, length, lines)
+                if result is None:
+                    return None
+                length, indexed_cycles = result
+                cycles_before += indexed_cycles
+
+            if op_data["needs_ea"]:
+                kwargs["ea"] = "ea"
+            if read == BYTE:
+                lines.append("m = read_byte(ea)")
+                kwargs["m"] = "m"
+            elif read == WORD:
+                lines.append("m = read_word(ea)")
+                kwargs["m"] = "m"
+
+        register = op_data["register"]
+        if register is not None:
+            register_name = REGISTER_DICT[register]
+            args[register_name] = getattr(self.cpu, register_name)
+            kwargs["register"] = register_name
+
+        arg_names = self._get_arg_names(instr_func)
+        if set(arg_names) != set(kwargs):
+            log.debug("Can't translate $%04x: %s", opcode, mnemonic)
+            return None
+        func_name = "op_%x" % opcode
+        args[func_name] = instr_func
+        call = "%s(%s)" % (func_name, ", ".join([kwargs[name] for name in arg_names]))
+
+        next_address = address + length
+        code = [
+            "# $%04x: %s (%s)" % (address, mnemonic, addr_mode),
+            "cpu.last_op_address = 0x%04x" % address,
+            "program_counter.value = 0x%04x" % next_address,
+            "cpu.cycles += %i" % cycles_before,
+        ]
+        code += lines
+        if write == BYTE:
+            code.append("ea, value = %s" % call)
+            code.append("write_byte(ea, value)")
+        elif write == WORD:
+            code.append("ea, value = %s" % call)
+            code.append("write_word(ea, value)")
+        else:
+            code.append(call)
+        code.append("cpu.cycles += %i" % cycles_after)
+
+        ends_block = mnemonic in BLOCK_END_MNEMONICS or addr_mode.startswith("RELATIVE")
+        if not ends_block and (write or mnemonic in MEMORY_WRITE_MNEMONICS):
+            code.append("if not valid[0]: return # code changed")
+
+        return code, next_address, ends_block
+
+    def translate(self, start, stop_address=None):
+        """
+        Translate the block starting at 'start', never run into 'stop_address'
+        Returns (block function, end address, valid) or None if the op at
+        'start' can't be translated.
+        'valid' is a list, set valid[0] = False to stop a running block
+        if the code was changed.
+        """
+        valid = [True]
+        args = {
+            "cpu": self.cpu,
+            "program_counter": self.cpu.program_counter,
+            "direct_page": self.cpu.direct_page,
+            "accu_a": self.cpu.accu_a,
+            "accu_b": self.cpu.accu_b,
+            "accu_d": self.cpu.accu_d,
+            "index_x": self.cpu.index_x,
+            "index_y": self.cpu.index_y,
+            "user_stack_pointer": self.cpu.user_stack_pointer,
+            "system_stack_pointer": self.cpu.system_stack_pointer,
+            "read_byte": self.memory.read_byte,
+            "read_word": self.memory.read_word,
+            "write_byte": self.memory.write_byte,
+            "write_word": self.memory.write_word,
+            "signed8": signed8,
+            "signed16": signed16,
+            "valid": valid,
+        }
+        code = []
+        address = start
+        op_count = 0
+        while op_count < self.max_block_ops:
+            if op_count and address == stop_address:
+                break
+            result = self._translate_op(address, args)
+            if result is None:
+                break
+            op_code, address, ends_block = result
+            code += op_code
+            op_count += 1
+            if ends_block:
+                break
+
+        if not op_count:
+            return None
+
+        arg_names = sorted(args)
+        source = "def factory(%s):\n" % ", ".join(arg_names)
+        source += "    def block_%04x():\n" % start
+        source += "".join(["        %s\n" % line for line in code])
+        source += "    return block_%04x\n" % start
+
+        namespace = {}
+        exec(compile(source, "<6809 block $%04x>" % start, "exec"), namespace)
+        block_func = namespace["factory"](*[args[name] for name in arg_names])
+        block_func.source = source
+        block_func.op_count = op_count
+        return block_func, address - 1, valid
+
+
+class BlockCacheMixin(object):
+    """
+    Run translated basic blocks instead of single ops.
+
+    Sync callbacks are called between blocks, so a burst with
+    n "ops" will run n blocks.
+    Ops in pages with read callbacks/middlewares and the trace mode are
+    not supported: They run in the normal interpreter.
+    """
+    # The op methods are called directly, see: CPUBase.dispatch_via_opcode_dict
+    dispatch_via_opcode_dict = False
+
+    def __init__(self, *args, **kwargs):
+        super(BlockCacheMixin, self).__init__(*args, **kwargs)
+        self.block_compiler = BlockCompiler(self)
+        # One "op" call runs a whole block:
+        self.max_op_cycles *= self.block_compiler.max_block_ops
+        self.block_stop_address = None
+        self.memory.add_code_write_listener(self.invalidate_blocks)
+        self.flush_block_cache()
+
+    def flush_block_cache(self):
+        for end, valid, pages in getattr(self, "_block_info", {}).values():
+            valid[0] = False
+        self.block_cache = {} # start address -> block function or None
+        self._block_info = {} # start address -> (end address, valid, pages)
+        self._page_blocks = {} # page -> set of block start addresses
+
+    def translate_block(self, start):
+        if self.cfg.trace:
+            result = None
+        else:
+            result = self.block_compiler.translate(start, self.block_stop_address)
+
+        if result is None:
+            # Remember that, but drop it, if the code will be changed.
+            block_func, end, valid = None, start, [True]
+        else:
+            block_func, end, valid = result
+
+        pages = range(start >> 8, (end >> 8) + 1)
+        for page in pages:
+            self._page_blocks.setdefault(page, set()).add(start)
+        self.memory.add_code_pages(start >> 8, end >> 8)
+
+        self.block_cache[start] = block_func
+        self._block_info[start] = (end, valid, pages)
+        return block_func
+
+    def invalidate_blocks(self, start, end):
+        """ Called from memory, if the code between start and end was changed """
+        for page in range(start >> 8, (end >> 8) + 1):
+            for block_start in list(self._page_blocks.get(page, ())):
+                block_end, valid, pages = self._block_info[block_start]
+                if block_start <= end and block_end >= start:
+                    valid[0] = False
+                    del self.block_cache[block_start]
+                    del self._block_info[block_start]
+                    for block_page in pages:
+                        self._page_blocks[block_page].discard(block_start)
+
+    def get_and_call_next_op(self):
+        address = self.program_counter.value
+        try:
+            block_func = self.block_cache[address]
+        except KeyError:
+            block_func = self.translate_block(address)
+
+        if block_func is None:
+            super(BlockCacheMixin, self).get_and_call_next_op()
+        else:
+            block_func()
+
+    def test_run(self, start, end, max_ops=1000000):
+        if end != self.block_stop_address:
+            # The blocks must stop at the end address
+            self.flush_block_cache()
+            self.block_stop_address = end
+        return super(BlockCacheMixin, self).test_run(start, end, max_ops)
+
+    def test_run2(self, start, count):
+        # count is the number of single ops: use the interpreter
+        self.get_and_call_next_op = super(BlockCacheMixin, self).get_and_call_next_op
+        try:
+            super(BlockCacheMixin, self).test_run2(start, count)
+        finally:
+            del self.get_and_call_next_op
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+    MC6809 - 6809 CPU emulator in Python
+    =======================================
+
+    Deterministic call graph profiler
+
+    Wraps the BSR/LBSR/JSR, RTS and RTI ops and the interrupt entry and
+    counts per subroutine (keyed by the entry address): the calls, the
+    inclusive and the exclusive emulated CPU cycles. And per caller ->
+    callee edge: the calls and the inclusive cycles.
+    The memory usage depends only on the number of subroutines, not on
+    the number of calls.
+
+    Every frame stores the S register after the return address was pushed.
+    A frame ends, if S is above it. So subroutines that leave without RTS
+    (e.g.: LEAS 2,S or PULS PC) will end with the next call, return or
+    interrupt entry, that sees the higher S.
+    The ops are wrapped in cpu.opcode_dict, so the block and decode cache
+    CPUs can't be profiled, see: CPUBase.enable_call_graph_profiler()
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+
+from MC6809.components.mc6809_sampling_profiler import CALL_OPCODES, RTS_OPCODE
+
+
+log = logging.getLogger("MC6809")
+
+
+RTI_OPCODE = 0x3b
+
+# Indexes of a frame list:
+FRAME_ENTRY = 0
+FRAME_STACK_POINTER = 1
+FRAME_START_CYCLES = 2
+FRAME_CHILD_CYCLES = 3
+
+
+class CallGraphProfiler(object):
+    max_depth = 256 # max. frames, the oldest frames will be dropped
+
+    def __init__(self, cpu, symbol_table=None):
+        self.cpu = cpu
+        self.symbol_table = symbol_table
+
+        self.frames = [] # [entry address, S register, start cycles, child cycles]
+        self.functions = {} # entry address -> [calls, inclusive cycles, exclusive cycles]
+        self.edges = {} # caller entry address -> {callee entry address: [calls, inclusive cycles]}
+
+        self.installed_ops = None # op code -> (origin entry, wrapped entry)
+        self.service_interrupt = None # the wrapped cpu._service_interrupt
+        self.origin_service_interrupt = None # a instance attribute before install()
+
+    def reset(self):
+        self.functions.clear()
+        self.edges.clear()
+
+    #---------------------------------------------------------------------------
+
+    def _enter(self, entry, stack_pointer, cycles):
+        frames = self.frames
+        if frames and frames[-1][FRAME_STACK_POINTER] <= stack_pointer:
+            # The return address of a frame was overwritten
+            self._leave(stack_pointer + 1, cycles)
+        frames.append([entry, stack_pointer, cycles, 0])
+        if len(frames) > self.max_depth:
+            del frames[0]
+
+    def _leave(self, stack_pointer, cycles):
+        """
+        End all frames below the given S register value
+        """
+        frames = self.frames
+        functions = self.functions
+        edges = self.edges
+        while frames and frames[-1][FRAME_STACK_POINTER] < stack_pointer:
+            entry, __, start_cycles, child_cycles = frames.pop()
+            inclusive = cycles - start_cycles
+            try:
+                stats = functions[entry]
+            except KeyError:
+                stats = functions[entry] = [0, 0, 0]
+            stats[0] += 1
+            stats[1] += inclusive
+            stats[2] += inclusive - child_cycles
+
+            if frames:
+                parent = frames[-1]
+                parent[FRAME_CHILD_CYCLES] += inclusive
+                caller = parent[FRAME_ENTRY]
+            else:
+                caller = None # called before profiling started
+            callees = edges.setdefault(caller, {})
+            try:
+                edge = callees[entry]
+            except KeyError:
+                edge = callees[entry] = [0, 0]
+            edge[0] += 1
+            edge[1] += inclusive
+
+    def _wrap_call(self, cycles, func):
+        cpu = self.cpu
+        program_counter = cpu.program_counter
+        system_stack_pointer = cpu.system_stack_pointer
+        enter = self._enter
+
+        def call_op(opcode):
+            func(opcode)
+            # The call op cycles belongs to the caller:
+            enter(program_counter.value, system_stack_pointer.value, cpu.cycles + cycles)
+
+        call_op.__name__ = func.__name__
+        return call_op
+
+    def _wrap_return(self, cycles, func):
+        cpu = self.cpu
+        system_stack_pointer = cpu.system_stack_pointer
+        frames = self.frames
+        leave = self._leave
+
+        def return_op(opcode):
+            func(opcode)
+            stack_pointer = system_stack_pointer.value
+            if frames and frames[-1][FRAME_STACK_POINTER] < stack_pointer:
+                # The return op cycles belongs to the callee:
+                leave(stack_pointer, cpu.cycles + cycles)
+
+        return_op.__name__ = func.__name__
+        return return_op
+
+    def _wrap_service_interrupt(self, func):
+        cpu = self.cpu
+        enter = self._enter
+
+        def service_interrupt(*args, **kwargs):
+            func(*args, **kwargs)
+            enter(cpu.program_counter.value, cpu.system_stack_pointer.value, cpu.cycles)
+
+        return service_interrupt
+
+    def install(self):
+        cpu = self.cpu
+        opcode_dict = cpu.opcode_dict
+        self.installed_ops = {}
+        for op_code in CALL_OPCODES + (RTS_OPCODE, RTI_OPCODE):
+            entry = opcode_dict[op_code]
+            cycles, func = entry
+            if op_code in CALL_OPCODES:
+                wrapped_entry = (cycles, self._wrap_call(cycles, func))
+            else:
+                wrapped_entry = (cycles, self._wrap_return(cycles, func))
+            opcode_dict[op_code] = wrapped_entry
+            self.installed_ops[op_code] = (entry, wrapped_entry)
+        cpu.build_dispatch_tables()
+
+        # Interrupts, incl. the ones serviced by RTI, ANDCC, SYNC and CWAI:
+        self.origin_service_interrupt = cpu.__dict__.get("_service_interrupt")
+        self.service_interrupt = self._wrap_service_interrupt(cpu._service_interrupt)
+        cpu._service_interrupt = self.service_interrupt
+
+    def uninstall(self):
+        """
+        End all open frames and restore the origin ops. Raise RuntimeError
+        (and change nothing), if a other profiler has wrapped the ops or
+        the interrupt entry after this one.
+        """
+        cpu = self.cpu
+        opcode_dict = cpu.opcode_dict
+        for op_code, (__, wrapped_entry) in self.installed_ops.items():
+            if opcode_dict.get(op_code) is not wrapped_entry:
+                raise RuntimeError(
+                    "Op $%02x was wrapped after the call graph profiler: uninstall the other profiler first" % op_code
+                )
+        if cpu.__dict__.get("_service_interrupt") is not self.service_interrupt:
+            raise RuntimeError(
+                "_service_interrupt was wrapped after the call graph profiler: uninstall the other profiler first"
+            )
+
+        self._leave(0x10000, cpu.cycles)
+
+        if self.origin_service_interrupt is None:
+            del cpu._service_interrupt
+        else:
+            cpu._service_interrupt = self.origin_service_interrupt
+        self.service_interrupt = self.origin_service_interrupt = None
+
+        for op_code, (entry, __) in self.installed_ops.items():
+            opcode_dict[op_code] = entry
+        cpu.build_dispatch_tables()
+        self.installed_ops = None
+
+    #---------------------------------------------------------------------------
+
+    def symbolize(self, address):
+        if address is None:
+            return "<root>"
+        if self.symbol_table is not None:
+            name = self.symbol_table.lookup(address)
+            if name is not None:
+                return name
+        return "$%04x" % address
+
+    def get_report(self, key="inclusive"):
+        """
+        Returns a list of dicts per subroutine, sorted by the given key:
+        "inclusive", "exclusive" or "calls"
+        """
+        report = []
+        callers = {}
+        for caller, callees in self.edges.items():
+            for callee, (calls, inclusive) in callees.items():
+                callers.setdefault(callee, []).append({
+                    "caller": self.symbolize(caller),
+                    "calls": calls,
+                    "inclusive": inclusive,
+                })
+
+        for entry, (calls, inclusive, exclusive) in self.functions.items():
+            callees = []
+            for callee, (callee_calls, callee_inclusive) in self.edges.get(entry, {}).items():
+                callees.append({
+                    "callee": self.symbolize(callee),
+                    "calls": callee_calls,
+                    "inclusive": callee_inclusive,
+                })
+            callees.sort(key=lambda edge: edge["inclusive"], reverse=True)
+            entry_callers = sorted(callers.get(entry, []), key=lambda edge: edge["inclusive"], reverse=True)
+            report.append({
+                "entry": "$%04x" % entry,
+                "name": self.symbolize(entry),
+                "calls": calls,
+                "inclusive": inclusive,
+                "exclusive": exclusive,
+                "callers": entry_callers,
+                "callees": callees,
+            })
+        report.sort(key=lambda entry: entry[key], reverse=True)
+        return report
+
+    def print_report(self, max_lines=20, key="inclusive"):
+        print("%-7s %-20s %8s %12s %12s" % ("entry", "name", "calls", "inclusive", "exclusive"))
+        for entry in self.get_report(key)[:max_lines]:
+            print("%(entry)-7s %(name)-20s %(calls)8i %(inclusive)12i %(exclusive)12i" % entry)
+            for edge in entry["callees"]:
+                print("        -> %(callee)-17s %(calls)8i %(inclusive)12i" % edge)
@@ -30,6 +30,100 @@ import logging
 log=logging.getLogger("MC6809")
 
 
+# The flag bits in the CC register:
+CC_C = 0x01
+CC_V = 0x02
+CC_Z = 0x04
+CC_N = 0x08
+CC_H = 0x20
+
+CC_NZ = CC_N | CC_Z
+CC_NZC = CC_N | CC_Z | CC_C
+CC_NZV = CC_N | CC_Z | CC_V
+CC_NZVC = CC_N | CC_Z | CC_V | CC_C
+CC_HNZVC = CC_H | CC_N | CC_Z | CC_V | CC_C
+
+
+def flags_NZ_8(a, b, r):
+    """
+    Calculate the flags as CC register bits.
+    a and b are the operands and r the unmasked result.
+
+    >>> flags_NZ_8(None, None, 0x100) == CC_Z
+    True
+    """
+    return (r & 0x80) >> 4 | (0 if r & 0xff else CC_Z)
+
+
+def flags_NZ_16(a, b, r):
+    return (r & 0x8000) >> 12 | (0 if r & 0xffff else CC_Z)
+
+
+def flags_NZC_8(a, b, r):
+    return (r & 0x80) >> 4 | (0 if r & 0xff else CC_Z) | (r & 0x100) >> 8
+
+
+def flags_NZVC_8(a, b, r):
+    """
+    >>> flags_NZVC_8(0x7f, 0x01, 0x80) == CC_N | CC_V
+    True
+    """
+    return (r & 0x80) >> 4 | (0 if r & 0xff else CC_Z) | \
+        ((a ^ b ^ r ^ (r >> 1)) & 0x80) >> 6 | (r & 0x100) >> 8
+
+
+def flags_NZVC_16(a, b, r):
+    return (r & 0x8000) >> 12 | (0 if r & 0xffff else CC_Z) | \
+        ((a ^ b ^ r ^ (r >> 1)) & 0x8000) >> 14 | (r & 0x10000) >> 16
+
+
+def flags_HNZVC_8(a, b, r):
+    return ((a ^ b ^ r) & 0x10) << 1 | flags_NZVC_8(a, b, r)
+
+
+# Precomputed flags as CC register bits for 8-bit ops.
+# Same results as the flags_*() functions, but without function calls,
+# because the tables will be build on import.
+
+# N, Z of a 8-bit result: index is the result & 0xff
+NZ8_TABLE = bytes(bytearray([
+    (r & 0x80) >> 4 | (0 if r else CC_Z)
+    for r in range(0x100)
+]))
+# INC: N, Z, V - index is the old value
+INC8_TABLE = bytes(bytearray([
+    NZ8_TABLE[(a + 1) & 0xff] | (CC_V if a == 0x7f else 0)
+    for a in range(0x100)
+]))
+# DEC: N, Z, V - index is the old value
+DEC8_TABLE = bytes(bytearray([
+    NZ8_TABLE[(a - 1) & 0xff] | (CC_V if a == 0x80 else 0)
+    for a in range(0x100)
+]))
+# LSL/ASL: N, Z, V, C - index is the old value
+LSL8_TABLE = bytes(bytearray([
+    NZ8_TABLE[(a << 1) & 0xff] | ((a ^ (a >> 1)) & 0x40) >> 5 | a >> 7
+    for a in range(0x100)
+]))
+# ROR: N, Z, C - index is: carry << 8 | old value
+ROR8_TABLE = bytes(bytearray([
+    NZ8_TABLE[a >> 1 | c << 7] | a & 1
+    for c in (0, 1) for a in range(0x100)
+]))
+# ADD/ADC: H, N, Z, V, C - index is: carry << 16 | a << 8 | b
+ADD8_TABLE = bytes(bytearray([
+    ((a ^ b ^ r) & 0x10) << 1 | (r & 0x80) >> 4 | (0 if r & 0xff else CC_Z) |
+    ((a ^ b ^ r ^ (r >> 1)) & 0x80) >> 6 | (r & 0x100) >> 8
+    for c in (0, 1) for a in range(0x100) for b in range(0x100) for r in (a + b + c,)
+]))
+# SUB/SBC/CMP/NEG: N, Z, V, C - index is: carry << 16 | a << 8 | b
+SUB8_TABLE = bytes(bytearray([
+    (r & 0x80) >> 4 | (0 if r & 0xff else CC_Z) |
+    ((a ^ b ^ r ^ (r >> 1)) & 0x80) >> 6 | (r & 0x100) >> 8
+    for c in (0, 1) for a in range(0x100) for b in range(0x100) for r in (a - b - c,)
+]))
+
+
 class ConditionCodeRegister(object):
     """
     Imitate the normal register API
@@ -207,6 +301,39 @@ class CPUConditionCodeRegisterMixin(object):
 
     ####
 
+    def assign_NZ(self, bits):
+        """
+        Set the flags to the precomputed CC bits from the *_TABLE
+        No clear_*() call is needed before.
+        """
+        self.N = (bits >> 3) & 1
+        self.Z = (bits >> 2) & 1
+
+    def assign_NZC(self, bits):
+        self.N = (bits >> 3) & 1
+        self.Z = (bits >> 2) & 1
+        self.C = bits & 1
+
+    def assign_NZV(self, bits):
+        self.N = (bits >> 3) & 1
+        self.Z = (bits >> 2) & 1
+        self.V = (bits >> 1) & 1
+
+    def assign_NZVC(self, bits):
+        self.N = (bits >> 3) & 1
+        self.Z = (bits >> 2) & 1
+        self.V = (bits >> 1) & 1
+        self.C = bits & 1
+
+    def assign_HNZVC(self, bits):
+        self.H = (bits >> 5) & 1
+        self.N = (bits >> 3) & 1
+        self.Z = (bits >> 2) & 1
+        self.V = (bits >> 1) & 1
+        self.C = bits & 1
+
+    ####
+
     def update_NZ_8(self, r):
         self.set_N8(r)
         self.set_Z8(r)
@@ -262,3 +389,199 @@ class CPUConditionCodeRegisterMixin(object):
         self.set_V8(a, b, r)
         self.set_C8(r)
 
+
+
+class LazyConditionCodeRegisterMixin(CPUConditionCodeRegisterMixin):
+    """
+    Calculate the N, Z, V, C and H flags only if they are needed.
+
+    The update_*() methods store only the operands, the result and a
+    function to calculate the flags. Most ops clear the flags before the
+    update, so a not used pending update will be dropped without any
+    calculation. The flags will be calculated on read access, e.g.:
+    branches, get_cc_value() via PSHS, TFR, EXG.
+    """
+    _lazy_func = None # function to calculate the pending flags
+    _lazy_mask = 0 # flags that will be changed by _lazy_func
+
+    def __init__(self, *args, **kwargs):
+        self._N = self._Z = self._V = self._C = self._H = 0
+        super(LazyConditionCodeRegisterMixin, self).__init__(*args, **kwargs)
+
+    def materialize_flags(self):
+        """
+        Calculate the pending flags. Set a flag only to 1 and never to 0,
+        same as the eager set_*() methods.
+        """
+        func = self._lazy_func
+        if func is None:
+            return
+        self._lazy_func = None
+        bits = func(*self._lazy_args)
+        if bits & CC_N:
+            self._N = 1
+        if bits & CC_Z:
+            self._Z = 1
+        if bits & CC_V:
+            self._V = 1
+        if bits & CC_C:
+            self._C = 1
+        if bits & CC_H:
+            self._H = 1
+
+    def _defer(self, mask, func, a, b, r):
+        if self._lazy_func is not None:
+            self.materialize_flags()
+        self._lazy_func = func
+        self._lazy_mask = mask
+        self._lazy_args = (a, b, r)
+
+    def _clear(self, mask):
+        if self._lazy_func is not None:
+            if self._lazy_mask & ~mask:
+                # The pending update changes more than the cleared flags
+                self.materialize_flags()
+            else:
+                # All pending flags will be cleared: drop the update
+                self._lazy_func = None
+
+    ####
+
+    def _get_N(self):
+        if self._lazy_func is not None:
+            self.materialize_flags()
+        return self._N
+
+    def _set_N(self, value):
+        if self._lazy_func is not None:
+            self.materialize_flags()
+        self._N = value
+    N = property(_get_N, _set_N)
+
+    def _get_Z(self):
+        if self._lazy_func is not None:
+            self.materialize_flags()
+        return self._Z
+
+    def _set_Z(self, value):
+        if self._lazy_func is not None:
+            self.materialize_flags()
+        self._Z = value
+    Z = property(_get_Z, _set_Z)
+
+    def _get_V(self):
+        if self._lazy_func is not None:
+            self.materialize_flags()
+        return self._V
+
+    def _set_V(self, value):
+        if self._lazy_func is not None:
+            self.materialize_flags()
+        self._V = value
+    V = property(_get_V, _set_V)
+
+    def _get_C(self):
+        if self._lazy_func is not None:
+            self.materialize_flags()
+        return self._C
+
+    def _set_C(self, value):
+        if self._lazy_func is not None:
+            self.materialize_flags()
+        self._C = value
+    C = property(_get_C, _set_C)
+
+    def _get_H(self):
+        if self._lazy_func is not None:
+            self.materialize_flags()
+        return self._H
+
+    def _set_H(self, value):
+        if self._lazy_func is not None:
+            self.materialize_flags()
+        self._H = value
+    H = property(_get_H, _set_H)
+
+    ####
+
+    def clear_NZ(self):
+        self._clear(CC_NZ)
+        self._N = self._Z = 0
+
+    def clear_NZC(self):
+        self._clear(CC_NZC)
+        self._N = self._Z = self._C = 0
+
+    def clear_NZV(self):
+        self._clear(CC_NZV)
+        self._N = self._Z = self._V = 0
+
+    def clear_NZVC(self):
+        self._clear(CC_NZVC)
+        self._N = self._Z = self._V = self._C = 0
+
+    def clear_HNZVC(self):
+        self._clear(CC_HNZVC)
+        self._H = self._N = self._Z = self._V = self._C = 0
+
+    ####
+
+    def assign_NZ(self, bits):
+        self._clear(CC_NZ)
+        self._N = (bits >> 3) & 1
+        self._Z = (bits >> 2) & 1
+
+    def assign_NZC(self, bits):
+        self._clear(CC_NZC)
+        self._N = (bits >> 3) & 1
+        self._Z = (bits >> 2) & 1
+        self._C = bits & 1
+
+    def assign_NZV(self, bits):
+        self._clear(CC_NZV)
+        self._N = (bits >> 3) & 1
+        self._Z = (bits >> 2) & 1
+        self._V = (bits >> 1) & 1
+
+    def assign_NZVC(self, bits):
+        self._clear(CC_NZVC)
+        self._N = (bits >> 3) & 1
+        self._Z = (bits >> 2) & 1
+        self._V = (bits >> 1) & 1
+        self._C = bits & 1
+
+    def assign_HNZVC(self, bits):
+        self._clear(CC_HNZVC)
+        self._H = (bits >> 5) & 1
+        self._N = (bits >> 3) & 1
+        self._Z = (bits >> 2) & 1
+        self._V = (bits >> 1) & 1
+        self._C = bits & 1
+
+    ####
+
+    def update_NZ_8(self, r):
+        self._defer(CC_NZ, flags_NZ_8, None, None, r)
+
+    def update_NZ_16(self, r):
+        self._defer(CC_NZ, flags_NZ_16, None, None, r)
+
+    def update_NZ0_8(self, r):
+        self.V = 0
+        self._defer(CC_NZ, flags_NZ_8, None, None, r)
+
+    def update_NZ0_16(self, r):
+        self.V = 0
+        self._defer(CC_NZ, flags_NZ_16, None, None, r)
+
+    def update_NZC_8(self, r):
+        self._defer(CC_NZC, flags_NZC_8, None, None, r)
+
+    def update_NZVC_8(self, a, b, r):
+        self._defer(CC_NZVC, flags_NZVC_8, a, b, r)
+
+    def update_NZVC_16(self, a, b, r):
+        self._defer(CC_NZVC, flags_NZVC_16, a, b, r)
+
+    def update_HNZVC_8(self, a, b, r):
+        self._defer(CC_HNZVC, flags_HNZVC_8, a, b, r)
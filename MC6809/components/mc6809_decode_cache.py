@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+    MC6809 - 6809 CPU emulator in Python
+    =======================================
+
+    Pre-decoded instruction cache:
+
+    Every op will be decoded only one time into a DecodedInstruction
+    record: op code, length, addressing mode, the register object and all
+    constant operands (incl. a pre-parsed indexed postbyte).
+    The records are cached by address and dropped if the memory with the
+    decoded bytes will be changed.
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+
+from MC6809.components.MC6809data.MC6809_data_utils import MC6809OP_DATA_DICT
+from MC6809.components.MC6809data.MC6809_op_data import BYTE, WORD
+from MC6809.components.cpu_utils.Instruction_generator import REGISTER_DICT
+from MC6809.components.mc6809_addressing import INDEX_MODE_5BIT, decode_indexed_postbyte
+from MC6809.components.mc6809_block_cache import get_arg_names
+from MC6809.utils.byte_word_values import signed8, signed16
+
+
+log = logging.getLogger("MC6809")
+
+
+# max. length of one op: page prefix + op + postbyte + 16 bit offset
+MAX_OP_LENGTH = 5
+
+
+class DecodedInstruction(object):
+    """
+    One pre-decoded op.
+
+    'args' are the positional arguments for the op method: opcode, register
+    and 'm' or 'ea' if they are known while decoding (immediate and relative
+    addressing). For the memory addressing modes 'get_ea' calculates the
+    effective address and 'ea_index'/'m_index' are the argument positions
+    for the effective address and the memory content.
+    """
+    __slots__ = (
+        "address", "opcode", "length", "next_address",
+        "addr_mode", "mnemonic",
+        "fetch_cycles", # cycles before the op call: op fetch, operands and indexed extra cycles
+        "cycles", # cycles after the op call: from the op table incl. the page prefix
+        "instr_func", "args", "ea_index", "m_index", "register",
+        "operand", # immediate value, extended address, direct page offset or relative ea
+        "get_ea", "needs_ea", "read", "write",
+        # Pre-parsed indexed postbyte:
+        "index_register", "index_mode", "index_offset", "indirect",
+    )
+
+    def __repr__(self):
+        return "<DecodedInstruction $%04x: $%02x %s %s (%i Bytes)>" % (
+            self.address, self.opcode, self.mnemonic, self.addr_mode, self.length
+        )
+
+
+class DecodeCacheMixin(object):
+    """
+    Execute pre-decoded ops instead of fetching and parsing the op code
+    and operand bytes on every op.
+
+    Ops in pages with read callbacks/middlewares and the trace mode are
+    not supported: They run in the normal interpreter.
+    """
+    # The op methods are called directly, see: CPUBase.dispatch_via_opcode_dict
+    dispatch_via_opcode_dict = False
+
+    def __init__(self, *args, **kwargs):
+        super(DecodeCacheMixin, self).__init__(*args, **kwargs)
+        self.decode_cache = {} # address -> DecodedInstruction or None (not decodable)
+        self._decode_arg_names = {} # op method -> argument names
+        try:
+            self._decode_page_cycles = self.opcode_dict[0x10][0]
+        except KeyError:
+            self._decode_page_cycles = 0
+        self.memory.add_code_write_listener(self.invalidate_decoded)
+
+    def flush_decode_cache(self):
+        self.decode_cache = {}
+
+    def invalidate_decoded(self, start, end):
+        """ Called from memory, if the bytes between start and end are changed """
+        decode_cache = self.decode_cache
+        for address in range(max(start - MAX_OP_LENGTH + 1, 0), end + 1):
+            try:
+                record = decode_cache[address]
+            except KeyError:
+                continue
+            # None: not decodable, the length is unknown
+            if record is None or address + record.length > start:
+                del decode_cache[address]
+
+    def decode_instruction(self, address):
+        """
+        Decode the op at 'address'
+        returns a DecodedInstruction or None, if it can't be decoded.
+        """
+        memory = self.memory
+        if self.cfg.trace or address + MAX_OP_LENGTH > 0x10000:
+            return None
+        read_word_pages = memory._read_word_pages
+        if read_word_pages[address >> 8] or read_word_pages[(address + MAX_OP_LENGTH - 1) >> 8]:
+            # Reading the op will call callbacks/middlewares
+            return None
+        mem = memory._mem
+
+        op = mem[address]
+        length = 1
+        extra_cycles = 0
+        cycles = 0
+        if op in (0x10, 0x11): # PAGE 2/3 instructions
+            opcode = op << 8 | mem[address + 1]
+            length += 1
+            cycles += self._decode_page_cycles
+        else:
+            opcode = op
+
+        try:
+            instr_func = self.instr_func_dict[opcode]
+        except KeyError:
+            return None # unknown op
+        op_data = MC6809OP_DATA_DICT[opcode]
+        addr_mode = op_data["addr_mode"]
+        if addr_mode is None:
+            # RESET
+            return None
+
+        record = DecodedInstruction()
+        record.address = address
+        record.opcode = opcode
+        record.addr_mode = addr_mode
+        record.mnemonic = op_data["mnemonic"]
+        record.instr_func = instr_func
+        record.needs_ea = op_data["needs_ea"]
+        record.read = op_data["read_from_memory"]
+        record.write = op_data["write_to_memory"]
+        record.get_ea = None
+        record.operand = None
+        record.index_register = None
+        record.index_mode = None
+        record.index_offset = None
+        record.indirect = False
+
+        kwargs = {"opcode": opcode}
+        if addr_mode == "IMMEDIATE":
+            kwargs["m"] = record.operand = mem[address + length]
+            length += 1
+        elif addr_mode == "IMMEDIATE_WORD":
+            kwargs["m"] = record.operand = mem[address + length] << 8 | mem[address + length + 1]
+            length += 2
+        elif addr_mode == "RELATIVE":
+            kwargs["ea"] = record.operand = address + length + 1 + signed8(mem[address + length])
+            length += 1
+        elif addr_mode == "RELATIVE_WORD":
+            kwargs["ea"] = record.operand = (
+                address + length + 2 + (mem[address + length] << 8 | mem[address + length + 1])
+            )
+            length += 2
+        elif addr_mode in ("DIRECT", "DIRECT_WORD"):
+            record.operand = mem[address + length]
+            record.get_ea = self._decoded_ea_direct
+            length += 1
+        elif addr_mode in ("EXTENDED", "EXTENDED_WORD"):
+            record.operand = mem[address + length] << 8 | mem[address + length + 1]
+            record.get_ea = self._decoded_ea_extended
+            length += 2
+        elif addr_mode in ("INDEXED", "INDEXED_WORD"):
+            decoded = decode_indexed_postbyte(mem, address + length)
+            if decoded is None:
+                return None
+            register_name, mode, offset, postbyte_length, index_cycles, indirect = decoded
+            record.index_register = getattr(self, register_name)
+            record.index_mode = mode
+            record.index_offset = offset
+            record.indirect = indirect
+            record.get_ea = self._decoded_ea_indexed
+            length += postbyte_length
+            extra_cycles = index_cycles - postbyte_length
+        else:
+            assert addr_mode == "INHERENT", addr_mode
+
+        register = op_data["register"]
+        if register is None:
+            record.register = None
+        else:
+            record.register = kwargs["register"] = getattr(self, REGISTER_DICT[register])
+
+        if record.get_ea is not None:
+            if record.needs_ea:
+                kwargs["ea"] = None
+            if record.read:
+                kwargs["m"] = None
+
+        try:
+            arg_names = self._decode_arg_names[instr_func]
+        except KeyError:
+            arg_names = self._decode_arg_names[instr_func] = get_arg_names(instr_func)
+        if set(arg_names) != set(kwargs):
+            log.debug("Can't decode $%04x: %s", opcode, record.mnemonic)
+            return None
+        record.args = tuple([kwargs[name] for name in arg_names])
+        record.ea_index = record.m_index = None
+        if record.get_ea is not None:
+            if record.needs_ea:
+                record.ea_index = arg_names.index("ea")
+            if record.read:
+                record.m_index = arg_names.index("m")
+
+        record.length = length
+        record.next_address = address + length
+        record.fetch_cycles = length + extra_cycles # every fetched byte costs one cycle
+        record.cycles = cycles + op_data["cycles"]
+
+        memory.add_code_pages(address >> 8, (address + length - 1) >> 8)
+        self.decode_cache[address] = record
+        return record
+
+    def _decoded_ea_direct(self, record):
+        return self.direct_page.value << 8 | record.operand
+
+    def _decoded_ea_extended(self, record):
+        return record.operand
+
+    def _decoded_ea_indexed(self, record):
+        """
+        Like AddressingMixin.get_ea_indexed() with a pre-parsed postbyte.
+        The extra cycles are in record.fetch_cycles
+        """
+        mode = record.index_mode
+        register = record.index_register
+        if mode == INDEX_MODE_5BIT:
+            # EA = n, R - use 5-bit offset from post-byte
+            return register.value + record.index_offset
+
+        if mode == 0x8 or mode == 0x9: # n,R - 8/16 bit offset
+            ea = register.value + record.index_offset
+        elif mode == 0x4: # ,R
+            ea = register.value
+        elif mode == 0x0: # ,R+
+            ea = register.value
+            register.increment(1)
+        elif mode == 0x1: # ,R++
+            ea = register.value
+            register.increment(2)
+        elif mode == 0x2: # ,-R
+            register.decrement(1)
+            ea = register.value
+        elif mode == 0x3: # ,--R
+            register.decrement(2)
+            ea = register.value
+        elif mode == 0x5: # B,R
+            ea = register.value + signed8(self.accu_b.value)
+        elif mode == 0x6: # A,R
+            ea = register.value + signed8(self.accu_a.value)
+        elif mode == 0xb: # D,R
+            ea = register.value + signed16(self.accu_d.value)
+        elif mode == 0xa: # illegal
+            ea = 0
+        elif mode == 0xe: # illegal
+            ea = 0xffff
+        else: # n,PCR and [n]: the address is known
+            ea = record.index_offset
+
+        ea = ea & 0xffff
+        if record.indirect:
+            ea = self.memory.read_word(ea)
+        return ea
+
+    def call_decoded_instruction(self, record):
+        self.last_op_address = record.address
+        self.program_counter.value = record.next_address
+        self.cycles += record.fetch_cycles
+
+        get_ea = record.get_ea
+        if get_ea is None:
+            # inherent, immediate or relative: all arguments are known
+            record.instr_func(*record.args)
+        else:
+            args = list(record.args)
+            ea = get_ea(record)
+            if record.ea_index is not None:
+                args[record.ea_index] = ea
+            read = record.read
+            if read == BYTE:
+                args[record.m_index] = self.memory.read_byte(ea)
+            elif read == WORD:
+                args[record.m_index] = self.memory.read_word(ea)
+
+            write = record.write
+            if write is None:
+                record.instr_func(*args)
+            else:
+                ea, value = record.instr_func(*args)
+                if write == BYTE:
+                    self.memory.write_byte(ea, value)
+                else:
+                    self.memory.write_word(ea, value)
+
+        self.cycles += record.cycles
+
+    def get_and_call_next_op(self):
+        address = self.program_counter.value
+        try:
+            record = self.decode_cache[address]
+        except KeyError:
+            record = self.decode_instruction(address)
+            if record is None:
+                # Don't decode it again, until the code is changed:
+                self.memory.add_code_pages(address >> 8, min(address + MAX_OP_LENGTH - 1, 0xffff) >> 8)
+                self.decode_cache[address] = None
+        if record is None:
+            return super(DecodeCacheMixin, self).get_and_call_next_op()
+        self.call_decoded_instruction(record)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+    MC6809 - 6809 CPU emulator in Python
+    =======================================
+
+    Idle loop detection
+
+    Guest programs often wait in tight polling loops, e.g.:
+
+        loop    BRA loop
+
+        loop    LDA $0100 ; wait for a flag, set by the IRQ handler
+                BEQ loop
+
+    If one pass of a loop doesn't write memory, reads only plain RAM (or
+    status addresses, that only change via sync callbacks/interrupts) and
+    ends with the same registers as it started, all following passes are
+    the same, until a scheduled event or an interrupt changes something.
+    So the CPU can skip whole passes: only the cycles are added.
+
+    The detector runs between the op chunks of burst_run(): If the PC
+    stays in a small area, it executes one probe pass with watched memory
+    accesses. The probe ops are real ops, they are not executed twice.
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+
+from MC6809.components.mc6809_interrupt import WaitForInterrupt
+from MC6809.components.mc6809_scheduler import NO_DEADLINE
+from MC6809.components.memory import PAGE_HOOKED
+
+
+log = logging.getLogger("MC6809")
+
+
+# Translation table for the page tables: set PAGE_HOOKED in every page
+WATCH_PAGES = bytes(bytearray(flags | PAGE_HOOKED for flags in range(256)))
+
+HOOKED_METHODS = ("_read_byte_hooked", "_read_word_hooked", "_write_byte_hooked", "_write_word_hooked")
+
+
+class IdleLoopDetector(object):
+    max_loop_ops = 16 # max. ops of one loop pass
+    max_loop_size = 64 # Bytes: only probe if the PC stays in this area
+    chunk_ops = 1000 # max. ops between two checks
+    max_backoff = 64 # max. skipped checks after a failed probe
+
+    def __init__(self, cpu, status_addresses=()):
+        """
+        status_addresses -- addresses with read callbacks/middlewares, that
+            may be polled in a idle loop, because their value only changes
+            via sync callbacks or interrupts.
+        """
+        self.cpu = cpu
+        self.memory = cpu.memory
+        self.status_addresses = frozenset(status_addresses)
+
+        self.last_pc = None
+        # max. ops of the next chunk in burst_run(): short after a idle
+        # loop was found, because it will be probably idle again
+        self.next_chunk_ops = self.chunk_ops
+        self.backoff = 1
+        self.skip_checks = 0
+
+        self.idle_cycles = 0 # Statistics: skipped cycles
+        self.idle_ops = 0 # Statistics: skipped ops
+
+    def get_registers(self):
+        cpu = self.cpu
+        return (
+            cpu.program_counter.value,
+            cpu.system_stack_pointer.value,
+            cpu.user_stack_pointer.value,
+            cpu.index_x.value,
+            cpu.index_y.value,
+            cpu.accu_a.value,
+            cpu.accu_b.value,
+            cpu.direct_page.value,
+            cpu.get_cc_value(),
+        )
+
+    #---------------------------------------------------------------------------
+    # Watch all memory accesses while probing:
+
+    def _install_watch(self):
+        memory = self.memory
+        self._saved_page_tables = [
+            table[:] for table in (
+                memory._read_byte_pages, memory._write_byte_pages,
+                memory._read_word_pages, memory._write_word_pages,
+            )
+        ]
+        self._saved_methods = dict(
+            (name, memory.__dict__[name]) for name in HOOKED_METHODS if name in memory.__dict__
+        )
+        self._hooked = [getattr(memory, name) for name in HOOKED_METHODS]
+        memory._read_byte_hooked = self._read_byte_hooked
+        memory._read_word_hooked = self._read_word_hooked
+        memory._write_byte_hooked = self._write_byte_hooked
+        memory._write_word_hooked = self._write_word_hooked
+        # Every access should leave the fast path:
+        for table in (
+            memory._read_byte_pages, memory._write_byte_pages,
+            memory._read_word_pages, memory._write_word_pages,
+        ):
+            table[:] = table.translate(WATCH_PAGES)
+
+    def _uninstall_watch(self):
+        memory = self.memory
+        tables = (
+            memory._read_byte_pages, memory._write_byte_pages,
+            memory._read_word_pages, memory._write_word_pages,
+        )
+        for table, saved_table in zip(tables, self._saved_page_tables):
+            table[:] = saved_table
+        for name in HOOKED_METHODS:
+            if name in self._saved_methods:
+                setattr(memory, name, self._saved_methods[name])
+            else:
+                delattr(memory, name)
+
+    def _read_byte_hooked(self, address):
+        memory = self.memory
+        if address not in self.status_addresses and (
+            memory._read_byte_callbacks.get(address) is not None
+            or memory._read_byte_middleware.get(address) is not None
+        ):
+            self.busy = True # reads a device
+        return self._hooked[0](address)
+
+    def _read_word_hooked(self, address):
+        if address not in self.status_addresses and self.memory._read_word_callbacks.get(address) is not None:
+            self.busy = True # reads a device
+        return self._hooked[1](address)
+
+    def _write_byte_hooked(self, address, value):
+        self.busy = True
+        return self._hooked[2](address, value)
+
+    def _write_word_hooked(self, address, word):
+        self.busy = True
+        return self._hooked[3](address, word)
+
+    #---------------------------------------------------------------------------
+
+    def probe(self):
+        """
+        Execute ops until the PC and all registers are the same as before.
+        Returns (executed ops, loop ops, loop cycles), loop ops and cycles
+        are None, if it's not a idle loop.
+        """
+        cpu = self.cpu
+        start_registers = self.get_registers()
+        start_pc = start_registers[0]
+        start_cycles = cpu.cycles
+        deadline = cpu.scheduler.next_deadline
+        program_counter = cpu.program_counter
+
+        self.busy = False
+        self._install_watch()
+        try:
+            for ops in range(1, self.max_loop_ops + 1):
+                # Interpret single ops (not e.g. translated blocks),
+                # see: CPUBase.get_and_call_next_op()
+                op_address, opcode = cpu.read_pc_byte()
+                cpu.last_op_address = op_address
+                cpu.op_funcs[opcode](opcode)
+                cpu.cycles += cpu.op_cycles[opcode]
+                if self.busy:
+                    break
+                if program_counter.value == start_pc:
+                    if self.get_registers() == start_registers:
+                        return ops, ops, cpu.cycles - start_cycles
+                    break
+                if cpu.cycles >= deadline:
+                    break
+        except WaitForInterrupt:
+            pass # SYNC/CWAI: the run loop handles the wait state
+        finally:
+            self._uninstall_watch()
+        return ops, None, None
+
+    def check(self, op_count):
+        """
+        Called between two op chunks in burst_run().
+        Skip idle loop passes and returns the remaining op count.
+        """
+        pc = self.cpu.program_counter.value
+        last_pc, self.last_pc = self.last_pc, pc
+        if last_pc is None or abs(pc - last_pc) > self.max_loop_size:
+            self.next_chunk_ops = self.chunk_ops
+            return op_count
+        if self.skip_checks:
+            self.skip_checks -= 1
+            return op_count
+
+        cpu = self.cpu
+        executed_ops, loop_ops, loop_cycles = self.probe()
+        op_count -= executed_ops
+        if loop_ops is None:
+            if cpu.cycles >= cpu.scheduler.next_deadline:
+                return op_count # probe stopped at the deadline: check again
+            self.next_chunk_ops = self.chunk_ops
+            self.skip_checks = self.backoff
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            return op_count
+        self.next_chunk_ops = self.max_loop_ops
+        self.backoff = 1
+
+        count = op_count // loop_ops
+        deadline = cpu.scheduler.next_deadline
+        if deadline != NO_DEADLINE:
+            # Run the last passes until the deadline:
+            count = min(count, (deadline - cpu.cycles) // loop_cycles)
+        if count > 0:
+            count = cpu.skip_idle_loop(count, loop_cycles)
+            self.idle_cycles += count * loop_cycles
+            self.idle_ops += count * loop_ops
+            op_count -= count * loop_ops
+        return op_count
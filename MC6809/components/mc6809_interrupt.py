@@ -23,13 +23,53 @@
 
 from __future__ import absolute_import, division, print_function
 
+import threading
 
 from MC6809.components.cpu_utils.instruction_caller import opcode
+from MC6809.components.mc6809_scheduler import NO_DEADLINE
+
+
+# Bits of InterruptMixin.interrupt_lines:
+IRQ_LINE = 0x01
+FIRQ_LINE = 0x02
+NMI_LINE = 0x04
+
+# InterruptMixin.waiting values:
+WAIT_SYNC = 1
+WAIT_CWAI = 2
+
+
+class WaitForInterrupt(Exception):
+    """
+    Raised by SYNC/CWAI: The CPU waits for a interrupt, the run loop
+    should not call the next op, see: InterruptMixin.wait_for_interrupt()
+    """
+    pass
 
 
 class InterruptMixin(object):
+    """
+    Interrupt input lines:
 
-    # ---- Not Implemented, yet. ----
+    IRQ and FIRQ are level-triggered: A device asserts the line and must
+    clear it, after the interrupt handler has acknowledged the interrupt.
+    NMI is edge-triggered: trigger_nmi() latches one NMI.
+
+    The pending lines are one integer. They are only checked between the
+    op chunks in burst_run() and after ANDCC/RTI, that may unmask them.
+    So asserting a line from a sync callback or an other thread costs
+    nothing per op.
+
+    SYNC and CWAI are wait states: No ops are executed and the cycles
+    jump to the next scheduled event, until a interrupt ends the wait.
+    """
+    def __init__(self, *args, **kwargs):
+        super(InterruptMixin, self).__init__(*args, **kwargs)
+        self.interrupt_lines = 0
+        self._interrupt_lock = threading.Lock()
+        self.waiting = None # WAIT_SYNC/WAIT_CWAI while waiting for a interrupt
+
+    # ---- Wait for interrupt ----
 
     @opcode(# AND condition code register, then wait for interrupt
         0x3c, # CWAI (immediate)
@@ -55,8 +95,62 @@ class InterruptMixin(object):
 
         CC bits "HNZVC": ddddd
         """
-#        log.error("$%x CWAI not implemented, yet!", opcode)
-        # Update CC bits: ddddd
+        self.set_cc(self.get_cc_value() & m)
+        self.E = 1
+        self.push_irq_registers()
+        self.waiting = WAIT_CWAI
+        if self.interrupt_lines and self.check_interrupts():
+            return
+        self.cycles += self.op_cycles[opcode] # the run loop will not add them
+        raise WaitForInterrupt()
+
+    @opcode(# Synchronize with interrupt line
+        0x13, # SYNC (inherent)
+    )
+    def instruction_SYNC(self, opcode):
+        """
+        FAST SYNC WAIT FOR DATA Interrupt! LDA DISC DATA FROM DISC AND CLEAR
+        INTERRUPT STA ,X+ PUT IN BUFFER DECB COUNT IT, DONE? BNE FAST GO AGAIN
+        IF NOT.
+
+        Wait for any interrupt line. A masked interrupt (or one that is
+        already pending) ends the wait with the next op, a unmasked
+        interrupt will be serviced.
+
+        source code forms: SYNC
+
+        CC bits "HNZVC": -----
+        """
+        self.waiting = WAIT_SYNC
+        if self.interrupt_lines:
+            self.check_interrupts() # ends the wait state
+            return
+        self.cycles += self.op_cycles[opcode] # the run loop will not add them
+        raise WaitForInterrupt()
+
+    def wait_for_interrupt(self):
+        """
+        Called by the run loop while self.waiting is set:
+        Jump to the next scheduled event, call it and check the interrupts.
+        Returns False, if no event is scheduled and the CPU still waits:
+        Nothing in this thread can end the wait.
+        """
+        scheduler = self.scheduler
+        deadline = scheduler.next_deadline
+        if deadline == NO_DEADLINE:
+            if self.interrupt_lines:
+                self.check_interrupts() # e.g. asserted by a other thread
+            return self.waiting is None
+        if deadline > self.cycles:
+            # Like a idle loop with one cycle per pass:
+            self.skip_idle_loop(deadline - self.cycles, 1)
+        if self.cycles >= scheduler.next_deadline:
+            scheduler.run_due(self.cycles)
+        if self.interrupt_lines:
+            self.check_interrupts()
+        return True
+
+    # ---- Not Implemented, yet. ----
 
     @opcode(# Undocumented opcode!
         0x3e, # RESET (inherent)
@@ -78,16 +172,19 @@ class InterruptMixin(object):
 
     irq_enabled = False
     def irq(self):
+        """
+        Service a IRQ now, if it's not masked.
+        Devices should better use assert_irq()/clear_irq()
+        """
         if not self.irq_enabled or self.I == 1:
             # log.critical("$%04x *** IRQ, ignore!\t%s" % (
             #     self.program_counter.value, self.get_cc_info()
             # ))
             return
 
-        if self.E:
-            self.push_irq_registers()
-        else:
-            self.push_firq_registers()
+        self.E = 1
+        self.push_irq_registers()
+        self.I = 1
 
         ea = self.memory.read_word(self.IRQ_VECTOR)
         # log.critical("$%04x *** IRQ, set PC to $%04x\t%s" % (
@@ -96,6 +193,63 @@ class InterruptMixin(object):
         self.program_counter.set(ea)
 
 
+    def set_interrupt_line(self, line, asserted=True):
+        with self._interrupt_lock:
+            if asserted:
+                self.interrupt_lines |= line
+            else:
+                self.interrupt_lines &= ~line
+
+    def assert_irq(self):
+        self.set_interrupt_line(IRQ_LINE)
+
+    def clear_irq(self):
+        self.set_interrupt_line(IRQ_LINE, False)
+
+    def assert_firq(self):
+        self.set_interrupt_line(FIRQ_LINE)
+
+    def clear_firq(self):
+        self.set_interrupt_line(FIRQ_LINE, False)
+
+    def trigger_nmi(self):
+        self.set_interrupt_line(NMI_LINE)
+
+    def check_interrupts(self):
+        """
+        Service the highest priority, not masked, pending interrupt.
+        Returns True if a interrupt was serviced.
+        """
+        lines = self.interrupt_lines
+        if lines & NMI_LINE:
+            self.set_interrupt_line(NMI_LINE, False) # edge-triggered
+            self._service_interrupt(self.NMI_VECTOR, entire=True, mask_firq=True)
+        elif lines & FIRQ_LINE and not self.F:
+            self._service_interrupt(self.FIRQ_VECTOR, entire=False, mask_firq=True)
+        elif lines & IRQ_LINE and not self.I:
+            self._service_interrupt(self.IRQ_VECTOR, entire=True, mask_firq=False)
+        else:
+            if lines and self.waiting == WAIT_SYNC:
+                self.waiting = None # a masked interrupt ends SYNC, too
+            return False
+        return True
+
+    def _service_interrupt(self, vector, entire, mask_firq):
+        if self.waiting == WAIT_CWAI:
+            pass # CWAI has stacked the entire state
+        elif entire:
+            self.E = 1
+            self.push_irq_registers()
+        else:
+            self.E = 0
+            self.push_firq_registers()
+        self.waiting = None
+
+        self.I = 1
+        if mask_firq:
+            self.F = 1
+        self.program_counter.set(self.memory.read_word(vector))
+
     def push_irq_registers(self):
         """
         push PC, U, Y, X, DP, B, A, CC on System stack pointer
@@ -160,6 +314,9 @@ class InterruptMixin(object):
             self.pull_word(self.system_stack_pointer) # PC
         )
 #         log.critical("RTI to $%04x", self.program_counter.value)
+        if self.interrupt_lines:
+            # The restored CC may unmask a pending interrupt
+            self.check_interrupts()
 
 
     @opcode(# Software interrupt (absolute indirect)
@@ -210,19 +367,3 @@ class InterruptMixin(object):
         CC bits "HNZVC": -----
         """
         raise NotImplementedError("$%x SWI3" % opcode)
-
-    @opcode(# Synchronize with interrupt line
-        0x13, # SYNC (inherent)
-    )
-    def instruction_SYNC(self, opcode):
-        """
-        FAST SYNC WAIT FOR DATA Interrupt! LDA DISC DATA FROM DISC AND CLEAR
-        INTERRUPT STA ,X+ PUT IN BUFFER DECB COUNT IT, DONE? BNE FAST GO AGAIN
-        IF NOT.
-
-        source code forms: SYNC
-
-        CC bits "HNZVC": -----
-        """
-        raise NotImplementedError("$%x SYNC" % opcode)
-
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+    MC6809 - 6809 CPU emulator in Python
+    =======================================
+
+    Per opcode profiler
+
+    Wraps every cpu.opcode_dict entry and counts per opcode: the calls,
+    the emulated CPU cycles and the host time in nanoseconds.
+    The counters are flat arrays, indexed by the opcode (incl. the page
+    prefix, e.g.: $10ce), so a call costs no dict lookups.
+
+    The PAGE 2/3 prefix ops are not wrapped: The paged op is recorded with
+    its own opcode and all cycles, incl. the opcode fetch and the prefix.
+    The block and decode cache CPUs call the op methods directly and not
+    via cpu.opcode_dict: They can't be profiled, see: CPUBase.enable_op_profiler()
+
+    Profilers wrap the opcode_dict entries of each other: They must be
+    uninstalled in the reverse order.
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import array
+import csv
+import json
+import logging
+import time
+
+from MC6809.components.MC6809data.MC6809_data_utils import MC6809OP_DATA_DICT
+from MC6809.components.mc6809_interrupt import WaitForInterrupt
+
+
+log = logging.getLogger("MC6809")
+
+
+try:
+    from time import perf_counter_ns
+except ImportError: # Python < 3.7
+    def perf_counter_ns():
+        return int(time.time() * 1000000000)
+
+try:
+    array.array("q")
+except ValueError: # Python 2
+    COUNTER_TYPECODE = "d"
+else:
+    COUNTER_TYPECODE = "q"
+
+OPCODE_COUNT = 0x1200 # all opcodes up to page 3: $11xx
+PAGE_PREFIXES = (0x10, 0x11)
+
+CSV_FIELDS = ("opcode", "mnemonic", "addr_mode", "count", "cycles", "host_ns")
+
+
+class OpProfiler(object):
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.counts = array.array(COUNTER_TYPECODE, [0] * OPCODE_COUNT)
+        self.cycles = array.array(COUNTER_TYPECODE, [0] * OPCODE_COUNT)
+        self.host_ns = array.array(COUNTER_TYPECODE, [0] * OPCODE_COUNT)
+        self.installed_ops = None # op code -> (origin entry, profiled entry)
+
+    def reset(self):
+        for counters in (self.counts, self.cycles, self.host_ns):
+            counters[:] = array.array(COUNTER_TYPECODE, [0] * OPCODE_COUNT)
+
+    def _wrap(self, op_code, cycles, func):
+        cpu = self.cpu
+        # The opcode fetch (one memory read per byte) is done before the call:
+        prefix = op_code >> 8
+        if prefix:
+            fetch_cycles = 2 + self.cpu.opcode_dict[prefix][0]
+        else:
+            fetch_cycles = 1
+        op_cycles = cycles + fetch_cycles
+        counts = self.counts
+        cycles_counts = self.cycles
+        host_ns = self.host_ns
+
+        def profiled_op(opcode):
+            start_cycles = cpu.cycles
+            start_ns = perf_counter_ns()
+            try:
+                func(opcode)
+            except WaitForInterrupt:
+                # SYNC/CWAI have added their cycles
+                host_ns[op_code] += perf_counter_ns() - start_ns
+                counts[op_code] += 1
+                cycles_counts[op_code] += cpu.cycles - start_cycles + fetch_cycles
+                raise
+            host_ns[op_code] += perf_counter_ns() - start_ns
+            counts[op_code] += 1
+            # The run loop adds the op cycles after the call:
+            cycles_counts[op_code] += cpu.cycles - start_cycles + op_cycles
+
+        profiled_op.__name__ = func.__name__
+        return profiled_op
+
+    def install(self):
+        cpu = self.cpu
+        opcode_dict = cpu.opcode_dict
+        self.installed_ops = {}
+        for op_code, entry in list(opcode_dict.items()):
+            if op_code in PAGE_PREFIXES:
+                continue
+            cycles, func = entry
+            profiled_entry = opcode_dict[op_code] = (cycles, self._wrap(op_code, cycles, func))
+            self.installed_ops[op_code] = (entry, profiled_entry)
+        cpu.build_dispatch_tables()
+
+    def uninstall(self):
+        """
+        Restore the origin ops. Raise RuntimeError (and change nothing), if
+        a other profiler has wrapped the ops after this one.
+        """
+        cpu = self.cpu
+        opcode_dict = cpu.opcode_dict
+        for op_code, (__, profiled_entry) in self.installed_ops.items():
+            if opcode_dict.get(op_code) is not profiled_entry:
+                raise RuntimeError(
+                    "Op $%02x was wrapped after the op profiler: uninstall the other profiler first" % op_code
+                )
+        for op_code, (entry, __) in self.installed_ops.items():
+            opcode_dict[op_code] = entry
+        cpu.build_dispatch_tables()
+        self.installed_ops = None
+
+    #---------------------------------------------------------------------------
+
+    def get_stats(self):
+        """
+        Returns a list of dicts for all called opcodes, sorted by host time.
+        """
+        stats = []
+        counts = self.counts
+        for op_code in range(OPCODE_COUNT):
+            count = counts[op_code]
+            if not count:
+                continue
+            op_data = MC6809OP_DATA_DICT[op_code]
+            stats.append({
+                "opcode": "$%02x" % op_code,
+                "mnemonic": op_data["mnemonic"],
+                "addr_mode": op_data["addr_mode"],
+                "count": int(count),
+                "cycles": int(self.cycles[op_code]),
+                "host_ns": int(self.host_ns[op_code]),
+            })
+        stats.sort(key=lambda entry: entry["host_ns"], reverse=True)
+        return stats
+
+    def as_dict(self):
+        """
+        The stats as nested dict: mnemonic -> addressing mode -> counters
+        """
+        result = {}
+        for entry in self.get_stats():
+            result.setdefault(entry["mnemonic"], {})[entry["addr_mode"]] = {
+                "opcode": entry["opcode"],
+                "count": entry["count"],
+                "cycles": entry["cycles"],
+                "host_ns": entry["host_ns"],
+            }
+        return result
+
+    def export_json(self, fileobj):
+        json.dump(self.as_dict(), fileobj, indent=4, sort_keys=True)
+
+    def export_csv(self, fileobj):
+        writer = csv.DictWriter(fileobj, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for entry in self.get_stats():
+            writer.writerow(entry)
+
+    def print_stats(self, max_lines=20):
+        total_ns = sum(self.host_ns) or 1
+        print("%-7s %-7s %-10s %10s %12s %8s" % (
+            "opcode", "mnem.", "mode", "count", "cycles", "host %"
+        ))
+        for entry in self.get_stats()[:max_lines]:
+            print("%-7s %-7s %-10s %10i %12i %7.1f%%" % (
+                entry["opcode"], entry["mnemonic"], entry["addr_mode"],
+                entry["count"], entry["cycles"],
+                entry["host_ns"] / total_ns * 100,
+            ))
@@ -25,6 +25,7 @@ from __future__ import absolute_import, division, print_function
 
 
 from MC6809.components.cpu_utils.instruction_caller import opcode
+from MC6809.components.mc6809_cc_register import LSL8_TABLE, NZ8_TABLE, ROR8_TABLE
 from MC6809.utils.bits import get_bit
 
 
@@ -49,8 +50,7 @@ class OpsLogicalMixin(object):
         a = register.value
         r = a & m
         register.set(r)
-        self.clear_NZV()
-        self.update_NZ_8(r)
+        self.assign_NZV(NZ8_TABLE[r])
 #        log.debug("\tAND %s: %i & %i = %i",
 #            register.name, a, m, r
 #        )
@@ -71,8 +71,7 @@ class OpsLogicalMixin(object):
         a = register.value
         r = a ^ m
         register.set(r)
-        self.clear_NZV()
-        self.update_NZ_8(r)
+        self.assign_NZV(NZ8_TABLE[r])
 #        log.debug("\tEOR %s: %i ^ %i = %i",
 #            register.name, a, m, r
 #        )
@@ -121,6 +120,9 @@ class OpsLogicalMixin(object):
         old_cc = self.get_cc_value()
         new_cc = old_cc & m
         self.set_cc(new_cc)
+        if self.interrupt_lines:
+            # I/F may be cleared: service a pending interrupt
+            self.check_interrupts()
 #        log.debug("\tANDCC: $%x AND $%x = $%x | set CC to %s",
 #             old_cc, m, new_cc, self.get_cc_info()
 #         )
@@ -163,10 +165,8 @@ class OpsLogicalMixin(object):
 
         CC bits "HNZVC": naaas
         """
-        r = a << 1
-        self.clear_NZVC()
-        self.update_NZVC_8(a, a, r)
-        return r
+        self.assign_NZVC(LSL8_TABLE[a])
+        return a << 1
 
     @opcode(0x8, 0x68, 0x78) # LSL/ASL (direct, indexed, extended)
     def instruction_LSL_memory(self, opcode, ea, m):
@@ -322,11 +322,9 @@ class OpsLogicalMixin(object):
 
         CC bits "HNZVC": -aa-s
         """
-        r = (a >> 1) | (self.C << 7)
-        self.clear_NZ()
-        self.update_NZ_8(r)
-        self.C = get_bit(a, bit=0) # same as: self.C = (a & 1)
-        return r
+        carry = self.C
+        self.assign_NZC(ROR8_TABLE[carry << 8 | a])
+        return (a >> 1) | (carry << 7)
 
     @opcode(0x6, 0x66, 0x76) # ROR (direct, indexed, extended)
     def instruction_ROR_memory(self, opcode, ea, m):
@@ -25,6 +25,7 @@ from __future__ import absolute_import, division, print_function
 
 
 from MC6809.components.cpu_utils.instruction_caller import opcode
+from MC6809.components.mc6809_cc_register import SUB8_TABLE
 
 
 class OpsTestMixin(object):
@@ -78,14 +79,7 @@ class OpsTestMixin(object):
         CC bits "HNZVC": uaaaa
         """
         r = register.value
-        r_new = r - m
-#         log.warning("$%x CMP8 %s $%x - $%x = $%x" % (
-#             self.program_counter,
-#             register.name,
-#             r, m, r_new,
-#         ))
-        self.clear_NZVC()
-        self.update_NZVC_8(r, m, r_new)
+        self.assign_NZVC(SUB8_TABLE[r << 8 | m])
 
 
     @opcode(# Bit test memory with accumulator
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+    MC6809 - 6809 CPU emulator in Python
+    =======================================
+
+    Guest PC sampling profiler
+
+    A periodic cycle event (see: CPUBase.add_sync_callback()) samples
+    the PC and a shadow call stack. So the sampling costs depend only on
+    the sample interval, not on the executed ops.
+    The PC (the next op) is used and not cpu.last_op_address: After a
+    BSR/JSR or RTS op the shadow call stack belongs to the next op.
+
+    The shadow call stack is maintained by wrapped BSR/LBSR/JSR and RTS
+    ops. Every frame stores the address of the call op, so a stack is
+    symbolized as the calling functions plus the function of the sampled
+    op. And the S register after the return address was pushed: A frame
+    is dropped, if S is above it, so stack tricks (e.g.: LEAS 2,S or
+    PULS PC) will not corrupt the stack.
+    The ops are wrapped in cpu.opcode_dict, so the block and decode cache
+    CPUs can't be profiled, see: CPUBase.enable_sampling_profiler()
+
+    The samples can be written as collapsed stack lines, e.g.:
+
+        MAIN;PRINT_STRING;OUTPUT_CHAR 42
+
+    for flamegraph tools.
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import bisect
+import logging
+
+
+log = logging.getLogger("MC6809")
+
+
+CALL_OPCODES = (
+    0x8d, # BSR (relative)
+    0x17, # LBSR (relative)
+    0x9d, 0xad, 0xbd, # JSR (direct, indexed, extended)
+)
+RTS_OPCODE = 0x39
+
+
+class SymbolTable(object):
+    """
+    Map addresses to the nearest symbol below.
+
+    >>> symbols = SymbolTable()
+    >>> symbols.load([
+    ...     "; address name",
+    ...     "$4000 MAIN",
+    ...     "0x4100 PRINT_STRING",
+    ... ])
+    >>> symbols.lookup(0x4000), symbols.lookup(0x40ff), symbols.lookup(0x4100)
+    ('MAIN', 'MAIN', 'PRINT_STRING')
+    >>> symbols.lookup(0x3fff) is None
+    True
+    """
+    def __init__(self, symbols=None):
+        self.symbols = {} # address -> name
+        if symbols is not None:
+            self.symbols.update(symbols)
+        self._addresses = None
+
+    def add(self, address, name):
+        self.symbols[address] = name
+        self._addresses = None
+
+    def load(self, lines):
+        """
+        Load lines with 'address name', the address in hex, e.g.:
+            $c000 START
+            0xc010 MAIN_LOOP
+            c020 OUTPUT_CHAR
+        Empty lines and comments (starts with ; or #) are ignored.
+        """
+        for line in lines:
+            line = line.strip()
+            if not line or line[0] in ";#":
+                continue
+            address, name = line.split(None, 1)
+            address = address.lower()
+            if address.startswith("$"):
+                address = address[1:]
+            self.add(int(address, 16), name.strip())
+
+    def load_file(self, filename):
+        with open(filename, "r") as f:
+            self.load(f)
+
+    def lookup(self, address):
+        if self._addresses is None:
+            self._addresses = sorted(self.symbols)
+        index = bisect.bisect_right(self._addresses, address)
+        if index == 0:
+            return None
+        return self.symbols[self._addresses[index - 1]]
+
+
+class SamplingProfiler(object):
+    max_depth = 64 # max. frames of the shadow call stack
+
+    def __init__(self, cpu, interval_cycles=10000, symbol_table=None):
+        self.cpu = cpu
+        self.interval_cycles = interval_cycles
+        self.symbol_table = symbol_table
+        self.mem_info = getattr(cpu.cfg, "mem_info", None)
+
+        self.frames = [] # shadow call stack: (call op address, S register)
+        self.samples = {} # tuple of addresses -> sample count
+        self.sample_count = 0
+        self._symbol_cache = {}
+
+        self.event = None
+        self.installed_ops = None # op code -> (origin entry, wrapped entry)
+
+    def reset(self):
+        self.samples.clear()
+        self.sample_count = 0
+
+    #---------------------------------------------------------------------------
+    # Shadow call stack:
+
+    def _wrap_call(self, func):
+        cpu = self.cpu
+        frames = self.frames
+        system_stack_pointer = cpu.system_stack_pointer
+        max_depth = self.max_depth
+
+        def call_op(opcode):
+            func(opcode)
+            stack_pointer = system_stack_pointer.value
+            while frames and frames[-1][1] <= stack_pointer:
+                frames.pop() # return address overwritten, e.g.: after LEAS 2,S
+            frames.append((cpu.last_op_address, stack_pointer))
+            if len(frames) > max_depth:
+                del frames[0]
+
+        call_op.__name__ = func.__name__
+        return call_op
+
+    def _wrap_return(self, func):
+        frames = self.frames
+        system_stack_pointer = self.cpu.system_stack_pointer
+
+        def return_op(opcode):
+            func(opcode)
+            stack_pointer = system_stack_pointer.value
+            while frames and frames[-1][1] < stack_pointer:
+                frames.pop()
+
+        return_op.__name__ = func.__name__
+        return return_op
+
+    def install(self):
+        cpu = self.cpu
+        opcode_dict = cpu.opcode_dict
+        self.installed_ops = {}
+        for op_code in CALL_OPCODES + (RTS_OPCODE,):
+            entry = opcode_dict[op_code]
+            cycles, func = entry
+            if op_code == RTS_OPCODE:
+                wrapped_entry = (cycles, self._wrap_return(func))
+            else:
+                wrapped_entry = (cycles, self._wrap_call(func))
+            opcode_dict[op_code] = wrapped_entry
+            self.installed_ops[op_code] = (entry, wrapped_entry)
+        cpu.build_dispatch_tables()
+
+        self.event = cpu.add_sync_callback(self.interval_cycles, self.sample)
+
+    def uninstall(self):
+        """
+        Stop sampling and restore the origin ops. Raise RuntimeError (and
+        change nothing), if a other profiler has wrapped the ops after this one.
+        """
+        cpu = self.cpu
+        opcode_dict = cpu.opcode_dict
+        for op_code, (__, wrapped_entry) in self.installed_ops.items():
+            if opcode_dict.get(op_code) is not wrapped_entry:
+                raise RuntimeError(
+                    "Op $%02x was wrapped after the sampling profiler: uninstall the other profiler first" % op_code
+                )
+
+        self.event.cancel()
+        self.event = None
+
+        for op_code, (entry, __) in self.installed_ops.items():
+            opcode_dict[op_code] = entry
+        cpu.build_dispatch_tables()
+        self.installed_ops = None
+        del self.frames[:]
+
+    #---------------------------------------------------------------------------
+
+    def sample(self, cycles):
+        frames = self.frames
+        stack_pointer = self.cpu.system_stack_pointer.value
+        while frames and frames[-1][1] < stack_pointer:
+            frames.pop() # returned without RTS
+        key = tuple([address for address, __ in frames]) + (self.cpu.program_counter.value,)
+        self.samples[key] = self.samples.get(key, 0) + 1
+        self.sample_count += 1
+
+    def symbolize(self, address):
+        try:
+            return self._symbol_cache[address]
+        except KeyError:
+            pass
+
+        name = None
+        if self.symbol_table is not None:
+            name = self.symbol_table.lookup(address)
+        if name is None:
+            try:
+                area = self.mem_info.get_shortest_area(address)
+            except AttributeError: # e.g.: DummyMemInfo
+                area = None
+            if area is not None:
+                name = area[2]
+        if name is None:
+            name = "$%04x" % address
+        else:
+            name = name.replace(";", ",")
+
+        self._symbol_cache[address] = name
+        return name
+
+    def get_collapsed_stacks(self):
+        """
+        Returns a dict: "frame;frame;leaf" -> sample count
+        """
+        stacks = {}
+        symbolize = self.symbolize
+        for addresses, count in self.samples.items():
+            stack = ";".join([symbolize(address) for address in addresses])
+            stacks[stack] = stacks.get(stack, 0) + count
+        return stacks
+
+    def write_collapsed(self, fileobj):
+        for stack, count in sorted(self.get_collapsed_stacks().items()):
+            fileobj.write("%s %i\n" % (stack, count))
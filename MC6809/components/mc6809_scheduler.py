@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+    MC6809 - 6809 CPU emulator in Python
+    =======================================
+
+    Cycle event scheduler
+
+    All CPU cycle triggered callbacks (e.g.: timers of devices) are stored
+    in a min-heap, sorted by the cycle they are due. The run loop only
+    compares the CPU cycles with the cached 'next_deadline', so the
+    overhead doesn't grow with the number of events.
+
+    Events are cancelled lazy: A cancelled or rescheduled event stays in
+    the heap and will be skipped if it pops up. The heap is compacted, if
+    there are more dead than live entries.
+
+    Periodic events are rescheduled from their due cycle, not from the
+    (later) cycle of the call, so they don't drift. Periods that are
+    completely missed (e.g. the callback was called too late) are skipped.
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import heapq
+import itertools
+import logging
+import weakref
+
+
+log = logging.getLogger("MC6809")
+
+
+# 'next_deadline' if no event is scheduled:
+NO_DEADLINE = 2 ** 63
+
+
+class CycleEvent(object):
+    """
+    A scheduled callback. The callback will be called with the CPU cycles
+    since the event was added or called the last time.
+
+    interval -- if not None: reschedule the event after every call
+    event_id -- numbered in the order the events are added, identifies
+        the event in snapshots, see: CycleScheduler.get_event()
+    """
+    __slots__ = (
+        "scheduler", "event_id", "callback", "interval", "due_cycles", "last_cycles", "sequence",
+        "__weakref__",
+    )
+
+    def __init__(self, scheduler, event_id, callback, interval, last_cycles):
+        self.scheduler = scheduler
+        self.event_id = event_id
+        self.callback = callback
+        self.interval = interval
+        self.last_cycles = last_cycles
+        self.due_cycles = None # None -> not scheduled
+        self.sequence = None # identify the current heap entry
+
+    @property
+    def scheduled(self):
+        return self.due_cycles is not None
+
+    def reschedule(self, due_cycles):
+        """ (Re-)schedule this event to the given absolute CPU cycle """
+        self.scheduler._push(self, due_cycles)
+
+    def cancel(self):
+        if self.sequence is not None:
+            self.scheduler._discard(self)
+
+    def __repr__(self):
+        return "<CycleEvent %r due:%r interval:%r>" % (
+            getattr(self.callback, "__name__", self.callback), self.due_cycles, self.interval
+        )
+
+
+class CycleScheduler(object):
+    def __init__(self):
+        self._heap = []
+        self._sequence = itertools.count()
+        self.next_deadline = NO_DEADLINE
+        self._event_ids = itertools.count()
+        self._events = weakref.WeakValueDictionary() # event_id -> CycleEvent
+        self._dead_entries = 0 # cancelled or rescheduled entries in the heap
+        self._run_cycles = None # the cycles of the current run_due() call
+
+    def __len__(self):
+        """ number of scheduled events """
+        return len(self._heap) - self._dead_entries
+
+    def _push(self, event, due_cycles):
+        run_cycles = self._run_cycles
+        if run_cycles is not None and due_cycles <= run_cycles:
+            # The event would be called again and again in run_due()
+            raise ValueError("Can't schedule %r at cycle %i from a event at cycle %i" % (
+                event, due_cycles, run_cycles
+            ))
+        if event.sequence is not None:
+            self._dead_entries += 1 # the old heap entry
+        event.due_cycles = due_cycles
+        event.sequence = next(self._sequence)
+        heapq.heappush(self._heap, (due_cycles, event.sequence, event))
+        if due_cycles < self.next_deadline:
+            self.next_deadline = due_cycles
+        self._check_compact()
+
+    def _discard(self, event):
+        event.due_cycles = None
+        event.sequence = None
+        self._dead_entries += 1
+        self._check_compact()
+
+    def _check_compact(self):
+        heap = self._heap
+        if self._dead_entries * 2 > len(heap):
+            # In place: run_due() holds a reference
+            heap[:] = [entry for entry in heap if entry[2].sequence == entry[1]]
+            heapq.heapify(heap)
+            self._dead_entries = 0
+
+    def add(self, due_cycles, callback, interval=None, start_cycles=None):
+        """
+        Add a new event that will be due at the absolute CPU cycle 'due_cycles'
+        returns the CycleEvent instance, e.g. to cancel the event.
+
+        start_cycles -- count the cycles for the first callback from here
+        """
+        if interval is not None and interval < 1:
+            raise ValueError("Event interval must be at least one cycle, not: %r" % interval)
+        if start_cycles is None:
+            start_cycles = due_cycles - interval if interval else due_cycles
+        event = CycleEvent(self, next(self._event_ids), callback, interval, start_cycles)
+        self._events[event.event_id] = event
+        self._push(event, due_cycles)
+        return event
+
+    def get_event(self, event_id):
+        """
+        returns the event with the given id or None, if it doesn't exist anymore
+        """
+        return self._events.get(event_id)
+
+    def _update_next_deadline(self):
+        heap = self._heap
+        while heap:
+            due_cycles, sequence, event = heap[0]
+            if event.sequence == sequence:
+                self.next_deadline = due_cycles
+                return
+            heapq.heappop(heap) # cancelled or rescheduled
+            self._dead_entries -= 1
+        self.next_deadline = NO_DEADLINE
+
+    def run_due(self, cycles):
+        """ Call all events that are due at the given CPU cycles """
+        heap = self._heap
+        self._run_cycles = cycles
+        try:
+            while heap and heap[0][0] <= cycles:
+                due_cycles, sequence, event = heapq.heappop(heap)
+                if event.sequence != sequence:
+                    self._dead_entries -= 1
+                    continue # cancelled or rescheduled
+
+                last_cycles = event.last_cycles
+                event.last_cycles = cycles
+                event.sequence = None # popped, no dead entry
+                interval = event.interval
+                if interval is None:
+                    event.due_cycles = None
+                else:
+                    # Schedule the next call before the callback, so it
+                    # can cancel or reschedule the event. From the due
+                    # cycles, without the missed periods:
+                    due_cycles += interval
+                    if due_cycles <= cycles:
+                        due_cycles += ((cycles - due_cycles) // interval + 1) * interval
+                    self._push(event, due_cycles)
+
+                event.callback(cycles - last_cycles)
+        finally:
+            self._run_cycles = None
+
+        self._update_next_deadline()
+
+    def get_state(self):
+        """
+        returns the scheduled events in heap order, see: set_state()
+        """
+        return [
+            (event, due_cycles, event.last_cycles, event.interval)
+            for due_cycles, sequence, event in sorted(self._heap)
+            if event.sequence == sequence
+        ]
+
+    def set_state(self, state):
+        """
+        Schedule exactly the events from get_state() again, with the stored
+        cycles. All other events will be cancelled.
+        """
+        self.clear()
+        for event, due_cycles, last_cycles, interval in state:
+            event.last_cycles = last_cycles
+            event.interval = interval
+            self._push(event, due_cycles)
+
+    def clear(self):
+        for __, __, event in self._heap:
+            event.due_cycles = None
+            event.sequence = None
+        del self._heap[:] # in place: run_due() holds a reference
+        self._dead_entries = 0
+        self.next_deadline = NO_DEADLINE
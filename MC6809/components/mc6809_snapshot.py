@@ -0,0 +1,457 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+    MC6809 - 6809 CPU emulator in Python
+    =======================================
+
+    Binary machine snapshots
+
+    Store the registers, the cycle counter, the interrupt state, the raw
+    64KB memory, the state of registered devices and the scheduled cycle
+    events in a compact, versioned binary format.
+    All multi byte values are Big-Endian (like the 6809).
+
+    Layout (version 2):
+
+        header:     magic (8 Bytes), version (word)
+        registers:  X, Y, U, S, PC (words), A, B, DP, CC (bytes),
+                    cycles (8 Bytes), interrupt lines (byte, incl. the
+                    latched NMI), wait state (byte, 0 = not waiting),
+                    event count (word), memory size (4 Bytes),
+                    device count (word)
+        memory:     the raw memory bytes
+        devices:    name length (word), data length (4 Bytes), name, data
+        events:     event id (4 Bytes), due cycles, last cycles,
+                    interval (8 Bytes each, interval 0 = one-shot)
+
+    Devices are objects with get_snapshot_state() -> bytes and
+    set_snapshot_state(data), see: SnapshotMixin.add_snapshot_device()
+    Callbacks and middlewares are not part of a snapshot: A scheduled
+    event is stored with its CycleEvent.event_id and restored, if the
+    scheduler of the CPU has a event with the same id. So the events must
+    be added in the same order as on the saved machine. All other events
+    will be cancelled.
+
+    Delta snapshots (if Memory.start_dirty_tracking() is active) contain
+    only the pages changed since the last (delta) snapshot. Layout is the
+    same as above, but with a other magic and instead of the raw memory:
+
+        memory:     dirty pages bitmap (256 Bytes), the changed pages
+
+    Register snapshots (e.g. for external memory stores) contains no memory.
+
+    A snapshot is completely parsed and validated, before the state is
+    changed: A invalid snapshot raises ValueError and leaves the CPU as is.
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import struct
+
+from MC6809.components.mc6809_interrupt import WAIT_CWAI, WAIT_SYNC
+
+
+log = logging.getLogger("MC6809")
+
+
+SNAPSHOT_MAGIC = b"MC6809SS"
+DELTA_SNAPSHOT_MAGIC = b"MC6809SD"
+REGISTER_SNAPSHOT_MAGIC = b"MC6809SR"
+SNAPSHOT_VERSION = 2
+
+HEADER = struct.Struct(">8sH")
+REGISTERS = struct.Struct(">HHHHHBBBBQBBHIH")
+DEVICE_HEADER = struct.Struct(">HI")
+EVENT = struct.Struct(">IQQQ")
+
+MEMORY_OFFSET = HEADER.size + REGISTERS.size
+PAGE_BITMAP_SIZE = 256
+
+# Indexes in the unpacked REGISTERS tuple:
+INTERRUPT_LINES_INDEX = 10
+WAITING_INDEX = 11
+EVENT_COUNT_INDEX = 12
+MEMORY_SIZE_INDEX = 13
+DEVICE_COUNT_INDEX = 14
+
+WAIT_STATES = (0, WAIT_SYNC, WAIT_CWAI)
+
+
+def _check_header(data, expected_magic):
+    if len(data) < MEMORY_OFFSET:
+        raise ValueError("Truncated snapshot: %i Bytes instead of %i" % (len(data), MEMORY_OFFSET))
+    magic, version = HEADER.unpack_from(data)
+    if magic != expected_magic:
+        raise ValueError("No MC6809 snapshot (magic: %r)" % magic)
+    if version != SNAPSHOT_VERSION:
+        raise ValueError("Unsupported snapshot version %i (expected: %i)" % (
+            version, SNAPSHOT_VERSION
+        ))
+
+
+def _check_size(view, size):
+    if len(view) < size:
+        raise ValueError("Truncated snapshot: %i Bytes instead of %i" % (len(view), size))
+
+
+def _parse_devices(view, offset, device_count):
+    """
+    returns the (name, data) list and the offset after the devices
+    """
+    devices = []
+    for __ in range(device_count):
+        _check_size(view, offset + DEVICE_HEADER.size)
+        name_length, data_length = DEVICE_HEADER.unpack_from(view, offset)
+        offset += DEVICE_HEADER.size
+        _check_size(view, offset + name_length + data_length)
+        name = view[offset:offset + name_length].tobytes()
+        offset += name_length
+        devices.append((name, view[offset:offset + data_length].tobytes()))
+        offset += data_length
+    return devices, offset
+
+
+def _parse_events(view, offset, event_count):
+    """
+    returns a list of (event id, due cycles, last cycles, interval) tuples
+    """
+    end = offset + event_count * EVENT.size
+    _check_size(view, end)
+    if len(view) != end:
+        raise ValueError("Snapshot has %i Bytes after the end" % (len(view) - end))
+    return [EVENT.unpack_from(view, index) for index in range(offset, end, EVENT.size)]
+
+
+def _parse_snapshot(data, magic):
+    """
+    Parse and validate a complete snapshot.
+    returns the REGISTERS tuple, a memoryview of the memory part,
+    the devices and the events
+    """
+    view = memoryview(data)
+    _check_header(view, magic)
+    registers = REGISTERS.unpack_from(view, HEADER.size)
+    if registers[WAITING_INDEX] not in WAIT_STATES:
+        raise ValueError("Unknown wait state %i" % registers[WAITING_INDEX])
+    offset = MEMORY_OFFSET + registers[MEMORY_SIZE_INDEX]
+    _check_size(view, offset)
+    devices, offset = _parse_devices(view, offset, registers[DEVICE_COUNT_INDEX])
+    events = _parse_events(view, offset, registers[EVENT_COUNT_INDEX])
+    return registers, view[MEMORY_OFFSET:MEMORY_OFFSET + registers[MEMORY_SIZE_INDEX]], devices, events
+
+
+def _pack_body(snapshot, offset, devices, events):
+    for name, data in devices:
+        DEVICE_HEADER.pack_into(snapshot, offset, len(name), len(data))
+        offset += DEVICE_HEADER.size
+        snapshot[offset:offset + len(name)] = name
+        offset += len(name)
+        snapshot[offset:offset + len(data)] = data
+        offset += len(data)
+    for event in events:
+        EVENT.pack_into(snapshot, offset, *event)
+        offset += EVENT.size
+
+
+def _body_size(devices, events):
+    return sum([DEVICE_HEADER.size + len(name) + len(data) for name, data in devices]) \
+        + len(events) * EVENT.size
+
+
+def _dirty_page_list(bitmap):
+    return [page for page, is_dirty in enumerate(bytearray(bitmap)) if is_dirty]
+
+
+def _check_pages(pages, memory):
+    if len(memory) != PAGE_BITMAP_SIZE + (len(pages) << 8):
+        raise ValueError("Delta snapshot with %i pages has %i Bytes page data" % (
+            len(pages), len(memory) - PAGE_BITMAP_SIZE
+        ))
+
+
+def merge_delta_snapshots(snapshot, delta_snapshots):
+    """
+    Build a full snapshot from a full snapshot and a chain of delta
+    snapshots, without a CPU instance.
+    The registers, devices and events are from the last delta snapshot.
+    """
+    registers, memory, devices, events = _parse_snapshot(snapshot, SNAPSHOT_MAGIC)
+    image = bytearray(memory)
+
+    for delta in delta_snapshots:
+        registers, memory, devices, events = _parse_snapshot(delta, DELTA_SNAPSHOT_MAGIC)
+        pages = _dirty_page_list(memory[:PAGE_BITMAP_SIZE])
+        _check_pages(pages, memory)
+        for index, page in enumerate(pages, 1):
+            image[page << 8:(page + 1) << 8] = memory[index << 8:(index + 1) << 8]
+
+    registers = list(registers)
+    registers[MEMORY_SIZE_INDEX] = len(image)
+    merged = bytearray(MEMORY_OFFSET + len(image) + _body_size(devices, events))
+    HEADER.pack_into(merged, 0, SNAPSHOT_MAGIC, SNAPSHOT_VERSION)
+    REGISTERS.pack_into(merged, HEADER.size, *registers)
+    merged[MEMORY_OFFSET:MEMORY_OFFSET + len(image)] = image
+    _pack_body(merged, MEMORY_OFFSET + len(image), devices, events)
+    return merged
+
+
+def diff(snapshot_a, snapshot_b):
+    """
+    returns the changed memory ranges between two full snapshots
+    as a list of (start, end) tuples (incl. end address)
+    """
+    memory_a, memory_b = [
+        _parse_snapshot(snapshot, SNAPSHOT_MAGIC)[1].tobytes()
+        for snapshot in (snapshot_a, snapshot_b)
+    ]
+    if len(memory_a) != len(memory_b):
+        raise ValueError("Memory size $%x != $%x" % (len(memory_a), len(memory_b)))
+
+    ranges = []
+    start = None
+    for page_start in range(0, len(memory_a), 0x100):
+        page_end = page_start + 0x100
+        if memory_a[page_start:page_end] == memory_b[page_start:page_end]:
+            if start is not None:
+                ranges.append((start, page_start - 1))
+                start = None
+            continue
+        for address in range(page_start, page_end):
+            if memory_a[address] != memory_b[address]:
+                if start is None:
+                    start = address
+            elif start is not None:
+                ranges.append((start, address - 1))
+                start = None
+    if start is not None:
+        ranges.append((start, len(memory_a) - 1))
+    return ranges
+
+
+class SnapshotMixin(object):
+    """
+    save_snapshot() / load_snapshot() for snapshots in memory and
+    write_snapshot() / read_snapshot() to stream them from/to files.
+    """
+    snapshot_devices = None
+
+    def add_snapshot_device(self, name, device):
+        if self.snapshot_devices is None:
+            self.snapshot_devices = {}
+        self.snapshot_devices[name] = device
+
+    def _get_snapshot_devices(self):
+        if not self.snapshot_devices:
+            return []
+        return [
+            (name.encode("ASCII"), device.get_snapshot_state())
+            for name, device in sorted(self.snapshot_devices.items())
+        ]
+
+    def _get_snapshot_events(self):
+        return [
+            (event.event_id, due_cycles, last_cycles, interval or 0)
+            for event, due_cycles, last_cycles, interval in self.scheduler.get_state()
+        ]
+
+    def _pack_snapshot_head(self, memory_size, device_count, event_count, magic=SNAPSHOT_MAGIC):
+        return HEADER.pack(magic, SNAPSHOT_VERSION) + REGISTERS.pack(
+            self.index_x.value, self.index_y.value,
+            self.user_stack_pointer.value, self.system_stack_pointer.value,
+            self.program_counter.value,
+            self.accu_a.value, self.accu_b.value,
+            self.direct_page.value, self.get_cc_value(),
+            self.cycles, self.interrupt_lines, self.waiting or 0,
+            event_count, memory_size, device_count,
+        )
+
+    def _parse_snapshot(self, data, magic=SNAPSHOT_MAGIC):
+        """
+        Parse and validate a snapshot, without changing the CPU state.
+        returns the REGISTERS tuple, the memory part, the devices and the
+        scheduler state.
+        """
+        registers, memory, devices, events = _parse_snapshot(data, magic)
+        if magic == SNAPSHOT_MAGIC:
+            memory_size = len(self.memory.get_image())
+            if len(memory) != memory_size:
+                raise ValueError("Snapshot memory size $%x doesn't match $%x" % (
+                    len(memory), memory_size
+                ))
+        elif magic == DELTA_SNAPSHOT_MAGIC:
+            _check_pages(_dirty_page_list(memory[:PAGE_BITMAP_SIZE]), memory)
+
+        scheduler = self.scheduler
+        scheduler_state = []
+        for event_id, due_cycles, last_cycles, interval in events:
+            event = scheduler.get_event(event_id)
+            if event is None:
+                log.error("Ignore unknown cycle event %i (due at cycle %i)", event_id, due_cycles)
+                continue
+            scheduler_state.append((event, due_cycles, last_cycles, interval or None))
+        return registers, memory, devices, scheduler_state
+
+    def _set_snapshot_state(self, registers, devices, scheduler_state):
+        """
+        set the registers, devices and scheduled events from a parsed snapshot
+        """
+        (
+            x, y, u, s, pc, a, b, dp, cc, cycles, interrupt_lines, waiting,
+            __, __, __
+        ) = registers
+        self.index_x.set(x)
+        self.index_y.set(y)
+        self.user_stack_pointer.set(u)
+        self.system_stack_pointer.set(s)
+        self.program_counter.set(pc)
+        self.accu_a.set(a)
+        self.accu_b.set(b)
+        self.direct_page.set(dp)
+        self.set_cc(cc)
+        self.cycles = cycles
+        self.interrupt_lines = interrupt_lines
+        self.waiting = waiting or None
+        for name, data in devices:
+            self._set_snapshot_device(name, data)
+        self.scheduler.set_state(scheduler_state)
+
+    def _set_snapshot_device(self, name, data):
+        name = name.decode("ASCII")
+        try:
+            device = self.snapshot_devices[name]
+        except (TypeError, KeyError):
+            log.error("Ignore state of unknown snapshot device %r", name)
+        else:
+            device.set_snapshot_state(data)
+
+    def _snapshot_checkpoint(self):
+        """ A snapshot is the new base for the next delta snapshot """
+        if self.memory.dirty_tracking:
+            self.memory.reset_dirty_pages()
+
+    def _build_snapshot(self, memory_size, magic):
+        """
+        returns the snapshot buffer with the head and the devices/events,
+        the caller must fill in the memory part.
+        """
+        devices = self._get_snapshot_devices()
+        events = self._get_snapshot_events()
+        snapshot = bytearray(MEMORY_OFFSET + memory_size + _body_size(devices, events))
+        snapshot[:MEMORY_OFFSET] = self._pack_snapshot_head(
+            memory_size, len(devices), len(events), magic=magic
+        )
+        _pack_body(snapshot, MEMORY_OFFSET + memory_size, devices, events)
+        return snapshot
+
+    def save_snapshot(self):
+        """
+        returns the current state as a bytearray
+        """
+        image = self.memory.get_image()
+        snapshot = self._build_snapshot(len(image), SNAPSHOT_MAGIC)
+        snapshot[MEMORY_OFFSET:MEMORY_OFFSET + len(image)] = image
+        self._snapshot_checkpoint()
+        return snapshot
+
+    def load_snapshot(self, snapshot):
+        """
+        restore the state from a save_snapshot() buffer
+        """
+        registers, memory, devices, scheduler_state = self._parse_snapshot(snapshot)
+        self.memory.set_image(memory)
+        self._set_snapshot_state(registers, devices, scheduler_state)
+        self._snapshot_checkpoint()
+
+    def save_delta_snapshot(self):
+        """
+        returns a snapshot with only the pages that are changed since the
+        last (delta) snapshot. Needs Memory.start_dirty_tracking()
+        """
+        memory = self.memory
+        if not memory.dirty_tracking:
+            raise RuntimeError("Delta snapshots needs memory.start_dirty_tracking()")
+        bitmap = memory.reset_dirty_pages()
+        pages = _dirty_page_list(bitmap)
+        pages_size = PAGE_BITMAP_SIZE + (len(pages) << 8)
+
+        snapshot = self._build_snapshot(pages_size, DELTA_SNAPSHOT_MAGIC)
+        snapshot[MEMORY_OFFSET:MEMORY_OFFSET + PAGE_BITMAP_SIZE] = bitmap
+        snapshot[MEMORY_OFFSET + PAGE_BITMAP_SIZE:MEMORY_OFFSET + pages_size] = memory.get_pages(pages)
+        return snapshot
+
+    def load_delta_snapshot(self, snapshot):
+        """
+        apply a delta snapshot to the current state. This is only valid,
+        if the current state is the state from the previous (delta) snapshot.
+        """
+        registers, memory, devices, scheduler_state = self._parse_snapshot(
+            snapshot, magic=DELTA_SNAPSHOT_MAGIC
+        )
+        pages = _dirty_page_list(memory[:PAGE_BITMAP_SIZE])
+        self.memory.set_pages(pages, memory[PAGE_BITMAP_SIZE:])
+        self._set_snapshot_state(registers, devices, scheduler_state)
+        self._snapshot_checkpoint()
+
+    def save_register_snapshot(self):
+        """
+        returns the registers, devices and events, without the memory
+        """
+        return bytes(self._build_snapshot(0, REGISTER_SNAPSHOT_MAGIC))
+
+    def load_register_snapshot(self, snapshot):
+        registers, __, devices, scheduler_state = self._parse_snapshot(
+            snapshot, magic=REGISTER_SNAPSHOT_MAGIC
+        )
+        self._set_snapshot_state(registers, devices, scheduler_state)
+
+    def load_snapshot_chain(self, snapshot, delta_snapshots):
+        """
+        restore a full snapshot and apply all delta snapshots
+        """
+        self.load_snapshot(snapshot)
+        for delta_snapshot in delta_snapshots:
+            self.load_delta_snapshot(delta_snapshot)
+
+    def write_snapshot(self, fileobj):
+        """
+        write the snapshot into a binary file object
+        """
+        image = self.memory.get_image()
+        devices = self._get_snapshot_devices()
+        events = self._get_snapshot_events()
+        fileobj.write(self._pack_snapshot_head(len(image), len(devices), len(events)))
+        fileobj.write(image)
+        for name, data in devices:
+            fileobj.write(DEVICE_HEADER.pack(len(name), len(data)))
+            fileobj.write(name)
+            fileobj.write(data)
+        for event in events:
+            fileobj.write(EVENT.pack(*event))
+        self._snapshot_checkpoint()
+
+    def read_snapshot(self, fileobj):
+        """
+        restore the state from a binary file object
+        """
+        head = self._read_snapshot_bytes(fileobj, MEMORY_OFFSET)
+        _check_header(head, SNAPSHOT_MAGIC)
+        registers = REGISTERS.unpack_from(head, HEADER.size)
+        chunks = [head, self._read_snapshot_bytes(fileobj, registers[MEMORY_SIZE_INDEX])]
+        for __ in range(registers[DEVICE_COUNT_INDEX]):
+            device_header = self._read_snapshot_bytes(fileobj, DEVICE_HEADER.size)
+            name_length, data_length = DEVICE_HEADER.unpack(device_header)
+            chunks.append(device_header)
+            chunks.append(self._read_snapshot_bytes(fileobj, name_length + data_length))
+        chunks.append(self._read_snapshot_bytes(fileobj, registers[EVENT_COUNT_INDEX] * EVENT.size))
+        self.load_snapshot(b"".join(chunks))
+
+    def _read_snapshot_bytes(self, fileobj, size):
+        data = fileobj.read(size)
+        if len(data) != size:
+            raise ValueError("Truncated snapshot: %i Bytes instead of %i" % (len(data), size))
+        return data
@@ -26,13 +26,23 @@ from __future__ import absolute_import, division, print_function
 
 import time
 
+from MC6809.components.mc6809_scheduler import NO_DEADLINE
+
 
 class CPUSpeedLimitMixin(object):
     max_delay = 0.01 # maximum time.sleep() value per burst run
     delay = 0 # the current time.sleep() value per burst run
+    target_cycles_per_sec = None # speedlimit of the current burst run
 
     def delayed_burst_run(self, target_cycles_per_sec):
         """ Run CPU not faster than given speedlimit """
+        self.target_cycles_per_sec = target_cycles_per_sec
+        try:
+            self._delayed_burst_run(target_cycles_per_sec)
+        finally:
+            self.target_cycles_per_sec = None
+
+    def _delayed_burst_run(self, target_cycles_per_sec):
         old_cycles = self.cycles
         start_time = time.time()
 
@@ -56,3 +66,32 @@ class CPUSpeedLimitMixin(object):
                 time.sleep(self.delay)
 
         self.call_sync_callbacks()
+
+    def skip_idle_loop(self, count, loop_cycles):
+        """
+        Sleep instead of running the idle loop passes in real time.
+        Sleep max. 'max_delay' seconds, so interrupts from other threads
+        will be recognized.
+        """
+        target_cycles_per_sec = self.target_cycles_per_sec
+        if target_cycles_per_sec is None:
+            return super(CPUSpeedLimitMixin, self).skip_idle_loop(count, loop_cycles)
+
+        max_count = int(self.max_delay * target_cycles_per_sec // loop_cycles)
+        count = max(1, min(count, max_count))
+        time.sleep(count * loop_cycles / target_cycles_per_sec)
+        self.cycles += count * loop_cycles
+        return count
+
+    def wait_for_interrupt(self):
+        """
+        Without a scheduled event, only a other thread can assert a
+        interrupt line: sleep a moment, like the real CPU, and end the
+        current burst, if the CPU still waits.
+        """
+        if self.target_cycles_per_sec is not None and self.scheduler.next_deadline == NO_DEADLINE:
+            self.skip_idle_loop(int(self.max_delay * self.target_cycles_per_sec), 1)
+            if self.interrupt_lines:
+                self.check_interrupts()
+            return self.waiting is None
+        return super(CPUSpeedLimitMixin, self).wait_for_interrupt()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+    MC6809 - 6809 CPU emulator in Python
+    =======================================
+
+    Time travel: Go back to any past cycle/op
+
+    Checkpoints are cheap: only the registers (a register snapshot), the
+    interrupt lines and wait state, the scheduled cycle events and the
+    current position in the memory write journal. The journal holds the
+    address and the old byte of every memory write. To go back, all
+    journal entries after the nearest checkpoint will be undone, the
+    state restored and the ops executed again until the target is hit.
+    The ops are executed in the same chunks as in burst_run(), so the
+    events are called and the interrupts serviced at the same ops again.
+
+    The run must be deterministic: e.g. values from read callbacks of
+    devices will not be recorded. Call add_checkpoint() after registers,
+    events or memory are changed from outside, e.g. after loading code
+    and set the PC. The first checkpoint is added before the first op.
+    set_image()/set_pages() of the memory (e.g. via load_snapshot())
+    drop all checkpoints.
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import bisect
+import logging
+
+
+log = logging.getLogger("MC6809")
+
+
+class Checkpoint(object):
+    __slots__ = (
+        "cycles", "op_count", "registers", "journal_position",
+        "interrupt_lines", "waiting", "scheduler_state",
+    )
+
+    def __init__(self, cycles, op_count, registers, journal_position,
+                interrupt_lines, waiting, scheduler_state):
+        self.cycles = cycles
+        self.op_count = op_count
+        self.registers = registers
+        self.journal_position = journal_position
+        self.interrupt_lines = interrupt_lines
+        self.waiting = waiting
+        self.scheduler_state = scheduler_state
+
+    def __repr__(self):
+        return "<Checkpoint cycles:%i ops:%i journal:%i>" % (
+            self.cycles, self.op_count, self.journal_position
+        )
+
+
+class TimeTravelMixin(object):
+    """
+    seek(cycle) and step_back(ops) via checkpoints and the memory write journal.
+    """
+    # Add a checkpoint after this count of cycles:
+    checkpoint_interval = 100000
+    # Bound the used memory: The oldest checkpoints will be removed
+    max_checkpoints = 100
+    max_journal_entries = 1000000 # 3 Bytes per entry
+
+    def __init__(self, *args, **kwargs):
+        super(TimeTravelMixin, self).__init__(*args, **kwargs)
+        self.op_count = 0 # Number of executed ops
+        self.checkpoints = []
+        self.memory.start_write_journal()
+        self.memory.add_journal_reset_listener(self.drop_checkpoints)
+        self._next_checkpoint_cycles = -1 # add the first checkpoint before the first op
+
+    def add_checkpoint(self):
+        memory = self.memory
+        self.checkpoints.append(Checkpoint(
+            self.cycles, self.op_count,
+            self.save_register_snapshot(),
+            len(memory.journal_addresses),
+            self.interrupt_lines, self.waiting,
+            self.scheduler.get_state(),
+        ))
+        self._next_checkpoint_cycles = self.cycles + self.checkpoint_interval
+
+        checkpoints = self.checkpoints
+        while len(checkpoints) > 1 and (
+            len(checkpoints) > self.max_checkpoints
+            or len(memory.journal_addresses) > self.max_journal_entries
+        ):
+            # Remove the oldest checkpoint and the journal entries before the next one
+            del checkpoints[0]
+            count = checkpoints[0].journal_position
+            memory.drop_journal(count)
+            for checkpoint in checkpoints:
+                checkpoint.journal_position -= count
+
+    def drop_checkpoints(self):
+        """
+        Forget the past, e.g.: the memory was replaced via set_image()
+        A new checkpoint will be added before the next op.
+        """
+        del self.checkpoints[:]
+        self._next_checkpoint_cycles = -1
+
+    def get_and_call_next_op(self):
+        if self.cycles >= self._next_checkpoint_cycles:
+            self.add_checkpoint()
+        self.op_count += 1
+        super(TimeTravelMixin, self).get_and_call_next_op()
+
+    #---------------------------------------------------------------------------
+
+    def _rewind(self, index):
+        """ Go back to the checkpoint with the given index """
+        checkpoint = self.checkpoints[index]
+        del self.checkpoints[index + 1:]
+        self.memory.undo_journal(checkpoint.journal_position)
+        self.load_register_snapshot(checkpoint.registers)
+        self.op_count = checkpoint.op_count
+        self.interrupt_lines = checkpoint.interrupt_lines
+        self.waiting = checkpoint.waiting
+        # Cancel the events added after the checkpoint, e.g. with deadlines
+        # in the future, and restore the deadlines of the checkpoint:
+        self.scheduler.set_state(checkpoint.scheduler_state)
+        self._next_checkpoint_cycles = self.cycles + self.checkpoint_interval
+
+    def _get_checkpoints(self):
+        if not self.checkpoints:
+            self.add_checkpoint() # e.g. after drop_checkpoints()
+        return self.checkpoints
+
+    def _replay(self, cycle=None, op_count=None):
+        """
+        Execute the ops until the cycle or the op count is reached.
+        Like burst_run(): The ops are called in chunks that can't run over
+        the next scheduler deadline and the interrupts are serviced between
+        the chunks. SYNC/CWAI wait states are handled like in test_run()
+        """
+        scheduler = self.scheduler
+        max_op_cycles = self.max_op_cycles
+        run_chunk = self.run_chunk
+        while True:
+            if cycle is not None:
+                remaining = cycle - self.cycles
+                if remaining <= 0:
+                    break
+                # Don't run over the target cycle:
+                max_count = max(1, remaining // max_op_cycles)
+            else:
+                max_count = op_count - self.op_count
+                if max_count <= 0:
+                    break
+
+            if self.waiting:
+                if not self.wait_for_interrupt():
+                    raise RuntimeError("$%04x waits for a interrupt, but no event is scheduled!" % (
+                        self.last_op_address
+                    ))
+                continue
+
+            count = (scheduler.next_deadline - self.cycles) // max_op_cycles
+            if count < 1:
+                count = 1
+            elif count > max_count:
+                count = max_count
+            run_chunk(count)
+
+    def seek(self, cycle):
+        """
+        Go back (or forward) to the first op boundary at or after 'cycle'
+        """
+        if cycle < self.cycles:
+            checkpoints = self._get_checkpoints()
+            index = bisect.bisect_right([checkpoint.cycles for checkpoint in checkpoints], cycle) - 1
+            if index < 0:
+                raise ValueError("Cycle %i is before the oldest checkpoint at cycle %i" % (
+                    cycle, checkpoints[0].cycles
+                ))
+            self._rewind(index)
+
+        self._replay(cycle=cycle)
+
+    def step_back(self, count=1):
+        """
+        Go back 'count' ops
+        """
+        op_count = self.op_count - count
+        checkpoints = self._get_checkpoints()
+        index = bisect.bisect_right([checkpoint.op_count for checkpoint in checkpoints], op_count) - 1
+        if op_count < 0 or index < 0:
+            raise ValueError("Can't go back %i ops: oldest checkpoint is at op %i" % (
+                count, checkpoints[0].op_count
+            ))
+        self._rewind(index)
+
+        self._replay(op_count=op_count)
@@ -26,6 +26,8 @@ import os
 import sys
 import logging
 
+from MC6809.utils.address_ranges import AddressRangeMap
+
 PY2 = sys.version_info[0] == 2
 if PY2:
     range = xrange
@@ -38,6 +40,15 @@ else:
 log = logging.getLogger("MC6809")
 
 
+# Flags in the 256 entry page tables, indexed by: address >> 8
+PAGE_RAM = 0x00 # plain RAM: read/write the array directly
+PAGE_HOOKED = 0x01 # callbacks or middlewares are registered in this page
+PAGE_ROM = 0x02 # page overlaps the ROM area: writes will be ignored
+PAGE_CODE = 0x04 # page contains decoded code: writes must be reported
+PAGE_TRACK = 0x08 # dirty page tracking: the first write into a clean page must be reported
+PAGE_JOURNAL = 0x10 # write journal is active: every write must be recorded
+
+
 class Memory(object):
     def __init__(self, cfg, read_bus_request_queue=None, read_bus_response_queue=None, write_bus_queue=None):
         self.cfg = cfg
@@ -72,21 +83,47 @@ class Memory(object):
         # array consumes also less RAM than lists and it's a little bit faster:
         self._mem = array.array("B", [0x00] * self.INTERNAL_SIZE) # unsigned char
 
+        self._read_byte_callbacks = AddressRangeMap()
+        self._read_word_callbacks = AddressRangeMap()
+        self._write_byte_callbacks = AddressRangeMap()
+        self._write_word_callbacks = AddressRangeMap()
+
+        # Page tables for the fast path in read/write byte/word methods.
+        # Pages without any flag will be accessed directly in self._mem
+        # All tables will be rebuild in update_page_tables()
+        self._read_byte_pages = bytearray(256)
+        self._write_byte_pages = bytearray(256)
+        self._read_word_pages = bytearray(256)
+        self._write_word_pages = bytearray(256)
+
+        # Pages that contains decoded/translated code, see: add_code_pages()
+        self._code_pages = bytearray(256)
+        # Will be increased on every write into a code page:
+        self.code_generation = 0
+        # (start, end, listener_func) - see: add_code_write_listener()
+        self._code_write_listeners = []
+
+        # Pages changed since the last reset_dirty_pages() call,
+        # only updated if start_dirty_tracking() was called:
+        self.dirty_tracking = False
+        self._dirty_pages = bytearray(256)
+
+        # (address, old byte) of every write, see: start_write_journal()
+        self.journal_addresses = None
+        self.journal_values = None
+        # see: add_journal_reset_listener()
+        self._journal_reset_listeners = []
+
         if cfg and cfg.rom_cfg:
             for romfile in cfg.rom_cfg:
                 self.load_file(romfile)
 
-        self._read_byte_callbacks = {}
-        self._read_word_callbacks = {}
-        self._write_byte_callbacks = {}
-        self._write_word_callbacks = {}
-
         # Memory middlewares are function that called on memory read or write
         # the function can change the value that is read/write
         #
         # init read/write byte middlewares:
-        self._read_byte_middleware = {}
-        self._write_byte_middleware = {}
+        self._read_byte_middleware = AddressRangeMap()
+        self._write_byte_middleware = AddressRangeMap()
         for addr_range, functions in list(cfg.memory_byte_middlewares.items()):
             start_addr, end_addr = addr_range
             read_func, write_func = functions
@@ -98,8 +135,8 @@ class Memory(object):
                 self.add_write_byte_middleware(write_func, start_addr, end_addr)
 
         # init read/write word middlewares:
-        self._read_word_middleware = {}
-        self._write_word_middleware = {}
+        self._read_word_middleware = AddressRangeMap()
+        self._write_word_middleware = AddressRangeMap()
         for addr_range, functions in list(cfg.memory_word_middlewares.items()):
             start_addr, end_addr = addr_range
             read_func, write_func = functions
@@ -110,6 +147,7 @@ class Memory(object):
             if write_func:
                 self.add_write_word_middleware(write_func, start_addr, end_addr)
 
+        self.update_page_tables()
 #         log.critical(
 # #         log.debug(
 #             "memory read middlewares: %s", self._read_byte_middleware
@@ -130,12 +168,76 @@ class Memory(object):
 
     #---------------------------------------------------------------------------
 
-    def _map_address_range(self, callbacks_dict, callback_func, start_addr, end_addr=None):
-        if end_addr is None:
-            callbacks_dict[start_addr] = callback_func
-        else:
-            for addr in range(start_addr, end_addr + 1):
-                callbacks_dict[addr] = callback_func
+    def _map_address_range(self, callbacks_map, callback_func, start_addr, end_addr=None):
+        callbacks_map.add(callback_func, start_addr, end_addr)
+        self.update_page_tables()
+
+    def _get_pages(self, *callbacks_maps):
+        pages = set()
+        for callbacks_map in callbacks_maps:
+            for page, state in enumerate(callbacks_map.pages):
+                if state:
+                    pages.add(page)
+        return pages
+
+    def has_callbacks(self):
+        """
+        True, if any read/write callback or middleware is registered
+        """
+        return bool(self._get_pages(
+            self._read_byte_callbacks, self._read_word_callbacks,
+            self._write_byte_callbacks, self._write_word_callbacks,
+            self._read_byte_middleware, self._read_word_middleware,
+            self._write_byte_middleware, self._write_word_middleware,
+        ))
+
+    def update_page_tables(self):
+        """
+        Mark every 256 Bytes page as plain RAM, ROM or hooked.
+        Must be called after callbacks/middlewares maps are changed.
+        The add_*_callback() and add_*_middleware() methods will do this.
+        """
+        read_byte_pages = bytearray(256)
+        for page in self._get_pages(self._read_byte_callbacks, self._read_byte_middleware):
+            read_byte_pages[page] = PAGE_HOOKED
+
+        write_byte_pages = bytearray(256)
+        for page in self._get_pages(self._write_byte_callbacks, self._write_byte_middleware):
+            write_byte_pages[page] = PAGE_HOOKED
+        for page in range(self.cfg.ROM_START >> 8, (self.cfg.ROM_END >> 8) + 1):
+            write_byte_pages[page] |= PAGE_ROM
+        for page, is_code in enumerate(self._code_pages):
+            if is_code:
+                write_byte_pages[page] |= PAGE_CODE
+        if self.dirty_tracking:
+            for page, is_dirty in enumerate(self._dirty_pages):
+                if not is_dirty:
+                    write_byte_pages[page] |= PAGE_TRACK
+        if self.journal_addresses is not None:
+            for page in range(256):
+                write_byte_pages[page] |= PAGE_JOURNAL
+
+        # A word access touches the bytes at address and address + 1
+        # So the word fast path is only usable, if both byte pages are plain.
+        read_word_pages = bytearray(256)
+        for page in self._get_pages(self._read_word_callbacks):
+            read_word_pages[page] = PAGE_HOOKED
+        write_word_pages = bytearray(256)
+        for page in self._get_pages(self._write_word_callbacks, self._write_word_middleware):
+            write_word_pages[page] = PAGE_HOOKED
+        for page in range(255):
+            read_word_pages[page] |= read_byte_pages[page] | read_byte_pages[page + 1]
+            write_word_pages[page] |= write_byte_pages[page] | write_byte_pages[page + 1]
+        # a word at $ffff is outside the memory: use the slow path for error handling
+        read_word_pages[0xff] = PAGE_HOOKED
+        write_word_pages[0xff] = PAGE_HOOKED
+
+        # Change the existing tables, because bound methods/closures may
+        # be hold references to them:
+        self._read_byte_pages[:] = read_byte_pages
+        self._write_byte_pages[:] = write_byte_pages
+        self._read_word_pages[:] = read_word_pages
+        self._write_word_pages[:] = write_word_pages
 
     #---------------------------------------------------------------------------
 
@@ -167,6 +269,135 @@ class Memory(object):
 
     #---------------------------------------------------------------------------
 
+    def add_code_write_listener(self, listener_func, start_addr=0x0000, end_addr=0xffff):
+        """
+        listener_func(start, end) will be called, if bytes between start_addr
+        and end_addr in pages marked via add_code_pages() are changed.
+        """
+        self._code_write_listeners.append((start_addr, end_addr, listener_func))
+
+    def add_code_pages(self, start_page, end_page):
+        """
+        Mark the pages as 'contains decoded code', so that writes into
+        them will be reported to the code write listeners.
+        Writes into all other pages stay on the fast path.
+        """
+        changed = False
+        for page in range(start_page, end_page + 1):
+            if not self._code_pages[page]:
+                self._code_pages[page] = 1
+                changed = True
+        if changed:
+            self.update_page_tables()
+
+    def start_dirty_tracking(self):
+        """
+        Track the pages that are changed since the last reset_dirty_pages() call.
+        Only the first write into a clean page leaves the fast path.
+        """
+        self.dirty_tracking = True
+        self._dirty_pages[:] = bytearray(256)
+        self.update_page_tables()
+
+    def stop_dirty_tracking(self):
+        self.dirty_tracking = False
+        self.update_page_tables()
+
+    def get_dirty_pages(self):
+        """ returns a copy of the dirty pages bitmap (256 Bytes) """
+        return self._dirty_pages[:]
+
+    def reset_dirty_pages(self):
+        """
+        Mark all pages as clean.
+        returns the dirty pages bitmap before the reset.
+        """
+        dirty_pages = self._dirty_pages[:]
+        self._dirty_pages[:] = bytearray(256)
+        if self.dirty_tracking:
+            for page, is_dirty in enumerate(dirty_pages):
+                if is_dirty:
+                    self._set_track_flag(page, PAGE_TRACK)
+        return dirty_pages
+
+    def _set_track_flag(self, page, flag):
+        self._write_byte_pages[page] = (self._write_byte_pages[page] & ~PAGE_TRACK) | flag
+        # The word table of a page depends on the byte table of the next page:
+        write_byte_pages = self._write_byte_pages
+        write_word_pages = self._write_word_pages
+        for word_page in (page - 1, page):
+            if 0 <= word_page < 0xff:
+                write_word_pages[word_page] = (write_word_pages[word_page] & ~PAGE_TRACK) | (
+                    (write_byte_pages[word_page] | write_byte_pages[word_page + 1]) & PAGE_TRACK
+                )
+
+    def _mark_dirty(self, start, end):
+        dirty_pages = self._dirty_pages
+        for page in range(start >> 8, (end >> 8) + 1):
+            if not dirty_pages[page]:
+                dirty_pages[page] = 1
+                self._set_track_flag(page, 0)
+
+    def start_write_journal(self):
+        """
+        Record the address and the old byte value of every write,
+        so that the writes can be undone via undo_journal().
+        Note: set_image() and set_pages() are not recorded, they clear
+        the journal, see: add_journal_reset_listener()
+        """
+        self.journal_addresses = array.array("H")
+        self.journal_values = array.array("B")
+        self.update_page_tables()
+
+    def stop_write_journal(self):
+        self.journal_addresses = None
+        self.journal_values = None
+        self.update_page_tables()
+
+    def undo_journal(self, position):
+        """
+        Undo all journaled writes after 'position' (in reverse order)
+        """
+        addresses = self.journal_addresses
+        values = self.journal_values
+        mem = self._mem
+        code_pages = self._code_pages
+        for index in range(len(addresses) - 1, position - 1, -1):
+            address = addresses[index]
+            mem[address] = values[index]
+            if self.dirty_tracking:
+                self._mark_dirty(address, address)
+            if code_pages[address >> 8]:
+                self._code_written(address, address)
+        del addresses[position:]
+        del values[position:]
+
+    def drop_journal(self, count):
+        """ Forget the oldest 'count' journal entries """
+        del self.journal_addresses[:count]
+        del self.journal_values[:count]
+
+    def add_journal_reset_listener(self, listener_func):
+        """
+        listener_func() will be called, if set_image() or set_pages() has
+        replaced the memory while the write journal is active: The journal
+        is cleared, the writes before can't be undone.
+        """
+        self._journal_reset_listeners.append(listener_func)
+
+    def _reset_journal(self):
+        del self.journal_addresses[:]
+        del self.journal_values[:]
+        for listener_func in self._journal_reset_listeners:
+            listener_func()
+
+    def _code_written(self, start, end):
+        self.code_generation += 1
+        for listener_start, listener_end, listener_func in self._code_write_listeners:
+            if listener_start <= end and listener_end >= start:
+                listener_func(start, end)
+
+    #---------------------------------------------------------------------------
 
     def load(self, address, data):
         if isinstance(data, string_type):
@@ -175,6 +406,10 @@ class Memory(object):
         log.debug("ROM load at $%04x: %s", address,
             ", ".join(["$%02x" % i for i in data])
         )
+        if self.journal_addresses is not None:
+            for ea in range(address, min(address + len(data), len(self._mem))):
+                self.journal_addresses.append(ea)
+                self.journal_values.append(self._mem[ea])
         for ea, datum in enumerate(data, address):
             try:
                 self._mem[ea] = datum
@@ -184,6 +419,62 @@ class Memory(object):
                 )
                 raise OverflowError(msg)
 
+        end = address + len(data) - 1
+        if data and self.dirty_tracking:
+            self._mark_dirty(address, end)
+        if data and any(self._code_pages[address >> 8:(end >> 8) + 1]):
+            self._code_written(address, end)
+
+    def get_image(self):
+        """
+        returns a zero-copy memoryview of the complete 64KB memory.
+        Read and write callbacks/middlewares are not called.
+        """
+        return memoryview(self._mem)
+
+    def set_image(self, data):
+        """
+        Replace the complete 64KB memory with the buffer 'data' (bytes,
+        bytearray, memoryview...) without calling callbacks/middlewares.
+        """
+        if not isinstance(data, (bytes, bytearray, memoryview, array.array)):
+            data = bytearray(data)
+        memoryview(self._mem)[:] = data
+        if self.dirty_tracking:
+            self._mark_dirty(0x0000, 0xffff)
+        if any(self._code_pages):
+            self._code_written(0x0000, 0xffff)
+        if self.journal_addresses is not None:
+            self._reset_journal()
+
+    def get_pages(self, pages):
+        """
+        returns the content of the 256 Bytes pages (list of page numbers)
+        as one bytearray.
+        """
+        mem_view = memoryview(self._mem)
+        data = bytearray(len(pages) << 8)
+        for index, page in enumerate(pages):
+            data[index << 8:(index + 1) << 8] = mem_view[page << 8:(page + 1) << 8]
+        return data
+
+    def set_pages(self, pages, data):
+        """
+        Replace the 256 Bytes pages (list of page numbers) with the
+        buffer 'data' (the inverse of get_pages())
+        """
+        mem_view = memoryview(self._mem)
+        data = memoryview(data)
+        for index, page in enumerate(pages):
+            start = page << 8
+            mem_view[start:start + 0x100] = data[index << 8:(index + 1) << 8]
+            if self.dirty_tracking:
+                self._mark_dirty(start, start)
+            if self._code_pages[page]:
+                self._code_written(start, start + 0xff)
+        if pages and self.journal_addresses is not None:
+            self._reset_journal()
+
     def load_file(self, romfile):
         data = romfile.get_data()
         self.load(romfile.address, data)
@@ -194,12 +485,19 @@ class Memory(object):
     def read_byte(self, address):
         self.cpu.cycles += 1
 
-        if address in self._read_byte_callbacks:
-            byte = self._read_byte_callbacks[address](
+        if self._read_byte_pages[address >> 8]:
+            return self._read_byte_hooked(address)
+
+        return self._mem[address]
+
+    def _read_byte_hooked(self, address):
+        callback_func = self._read_byte_callbacks.get(address)
+        if callback_func is not None:
+            byte = callback_func(
                 self.cpu.cycles, self.cpu.last_op_address, address
             )
             assert byte is not None, "Error: read byte callback for $%04x func %r has return None!" % (
-                address, self._read_byte_callbacks[address].__name__
+                address, callback_func.__name__
             )
             return byte
 
@@ -213,12 +511,13 @@ class Memory(object):
             # raise RuntimeError(msg2)
             byte = 0x0
 
-        if address in self._read_byte_middleware:
-            byte = self._read_byte_middleware[address](
+        middleware_func = self._read_byte_middleware.get(address)
+        if middleware_func is not None:
+            byte = middleware_func(
                 self.cpu.cycles, self.cpu.last_op_address, address, byte
             )
             assert byte is not None, "Error: read byte middleware for $%04x func %r has return None!" % (
-                address, self._read_byte_middleware[address].__name__
+                address, middleware_func.__name__
             )
 
 #        log.log(5, "%04x| (%i) read byte $%x from $%x",
@@ -228,12 +527,21 @@ class Memory(object):
         return byte
 
     def read_word(self, address):
-        if address in self._read_word_callbacks:
-            word = self._read_word_callbacks[address](
+        if self._read_word_pages[address >> 8]:
+            return self._read_word_hooked(address)
+
+        # 6809 is Big-Endian
+        self.cpu.cycles += 2
+        return (self._mem[address] << 8) + self._mem[address + 1]
+
+    def _read_word_hooked(self, address):
+        callback_func = self._read_word_callbacks.get(address)
+        if callback_func is not None:
+            word = callback_func(
                 self.cpu.cycles, self.cpu.last_op_address, address
             )
             assert word is not None, "Error: read word callback for $%04x func %r has return None!" % (
-                address, self._read_word_callbacks[address].__name__
+                address, callback_func.__name__
             )
             return word
 
@@ -245,6 +553,13 @@ class Memory(object):
     def write_byte(self, address, value):
         self.cpu.cycles += 1
 
+        if self._write_byte_pages[address >> 8]:
+            return self._write_byte_hooked(address, value)
+
+        # array.array() will raise OverflowError on out of range values
+        self._mem[address] = value
+
+    def _write_byte_hooked(self, address, value):
         assert value >= 0, "Write negative byte hex:%00x dez:%i to $%04x" % (value, value, address)
         assert value <= 0xff, "Write out of range byte hex:%02x dez:%i to $%04x" % (value, value, address)
 #         if not (0x0 <= value <= 0xff):
@@ -252,19 +567,28 @@ class Memory(object):
 #             value = value & 0xff
 #             log.error(" ^^^^ wrap around to $%x", value)
 
-        if address in self._write_byte_middleware:
-            value = self._write_byte_middleware[address](
+        middleware_func = self._write_byte_middleware.get(address)
+        if middleware_func is not None:
+            value = middleware_func(
                 self.cpu.cycles, self.cpu.last_op_address, address, value
             )
             assert value is not None, "Error: write byte middleware for $%04x func %r has return None!" % (
-                address, self._write_byte_middleware[address].__name__
+                address, middleware_func.__name__
             )
 
-        if address in self._write_byte_callbacks:
-            return self._write_byte_callbacks[address](
+        callback_func = self._write_byte_callbacks.get(address)
+        if callback_func is not None:
+            return callback_func(
                 self.cpu.cycles, self.cpu.last_op_address, address, value
             )
 
+        return self._store_byte(address, value)
+
+    def _store_byte(self, address, value):
+        """
+        Store a byte into RAM without calling callbacks/middlewares,
+        but with ROM check, journal, dirty page tracking and code invalidation.
+        """
         if self.cfg.ROM_START <= address <= self.cfg.ROM_END:
             msg = "%04x| writing into ROM at $%04x ignored." % (
                 self.cpu.program_counter.value, address
@@ -275,6 +599,10 @@ class Memory(object):
             return
 
         try:
+            old_value = self._mem[address]
+            if self.journal_addresses is not None:
+                self.journal_values.append(old_value)
+                self.journal_addresses.append(address)
             self._mem[address] = value
         except (IndexError, KeyError):
             msg = "%04x| writing to %x is outside RAM/ROM !" % (
@@ -284,21 +612,39 @@ class Memory(object):
             msg2 = "%s: $%x" % (msg, address)
             log.warning(msg2)
 #             raise RuntimeError(msg2)
+            return
+
+        if self._write_byte_pages[address >> 8] & PAGE_TRACK:
+            self._mark_dirty(address, address)
+        if self._code_pages[address >> 8] and old_value != value:
+            # e.g.: a variable in a code page: only changed bytes invalidates
+            self._code_written(address, address)
 
     def write_word(self, address, word):
+        if self._write_word_pages[address >> 8]:
+            return self._write_word_hooked(address, word)
+
+        # 6809 is Big-Endian
+        self.cpu.cycles += 2
+        self._mem[address] = word >> 8
+        self._mem[address + 1] = word & 0xff
+
+    def _write_word_hooked(self, address, word):
         assert word >= 0, "Write negative word hex:%04x dez:%i to $%04x" % (word, word, address)
         assert word <= 0xffff, "Write out of range word hex:%04x dez:%i to $%04x" % (word, word, address)
 
-        if address in self._write_word_middleware:
-            word = self._write_word_middleware[address](
+        middleware_func = self._write_word_middleware.get(address)
+        if middleware_func is not None:
+            word = middleware_func(
                 self.cpu.cycles, self.cpu.last_op_address, address, word
             )
             assert word is not None, "Error: write word middleware for $%04x func %r has return None!" % (
-                address, self._write_word_middleware[address].__name__
+                address, middleware_func.__name__
             )
 
-        if address in self._write_word_callbacks:
-            return self._write_word_callbacks[address](
+        callback_func = self._write_word_callbacks.get(address)
+        if callback_func is not None:
+            return callback_func(
                 self.cpu.cycles, self.cpu.last_op_address, address, word
             )
 
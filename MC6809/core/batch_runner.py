@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# encoding:utf8
+
+"""
+    MC6809 - 6809 CPU emulator in Python
+    =======================================
+
+    Batch runner
+
+    Run many independent guest programs in a pool of worker processes.
+    Every worker creates its CPU/Memory only one time (the OpCollection
+    build is done in the pool initializer) and resets the memory for every
+    job from a image with the ROMs, that are already loaded.
+
+    e.g.:
+
+        with BatchRunner(MyMachineCfg, roms=[(0x8000, rom_data)]) as runner:
+            futures = [
+                runner.submit(BatchJob(code, 0x4000, stop_pc=0x4010, regions=[(0x5000, 0x50ff)]))
+                for code in programs
+            ]
+            results = [future.result() for future in futures]
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import multiprocessing
+import os
+import sys
+
+from MC6809.components.MC6809data.MC6809_op_data import REG_A, REG_B, REG_CC, REG_DP, REG_PC, \
+    REG_S, REG_U, REG_X, REG_Y
+from MC6809.components.cpu6809 import CPU
+from MC6809.components.mc6809_interrupt import WaitForInterrupt
+from MC6809.components.memory import Memory
+
+if sys.version_info >= (3, 7):
+    from concurrent.futures import ProcessPoolExecutor
+else:
+    # The worker 'initializer' is new in Python 3.7
+    ProcessPoolExecutor = None
+
+
+log = logging.getLogger("MC6809")
+
+
+DEFAULT_CFG_DICT = {
+    "verbosity": None,
+    "display_cycle": False,
+    "trace": None,
+    "bus_socket_host": None,
+    "bus_socket_port": None,
+    "ram": None,
+    "rom": None,
+    "max_ops": None,
+    "use_bus": False,
+}
+
+# Registers that will be reset before every job and returned in BatchResult.registers
+RESULT_REGISTERS = (REG_X, REG_Y, REG_U, REG_S, REG_PC, REG_A, REG_B, REG_DP)
+
+STOP_PC = "pc"
+STOP_CYCLES = "cycles"
+STOP_MAX_OPS = "max ops"
+STOP_WAIT = "wait" # SYNC/CWAI, but nothing can end the wait state
+
+
+class BatchJob(object):
+    """
+    One guest program run.
+
+    program     -- the code bytes, loaded at 'load_address'
+    entry       -- start address (default: load_address)
+    stop_pc     -- stop if the PC hits this address
+    max_cycles  -- stop if this cycle budget is used up
+    regions     -- (start, end) address ranges that will be returned
+    registers   -- initial register values, e.g.: {"X": 0x5000, "CC": 0x50}
+    data        -- (address, bytes) tuples, loaded before the run
+    """
+    def __init__(self, program, load_address, entry=None, stop_pc=None, max_cycles=None,
+                regions=(), registers=None, data=(), max_ops=1000000, job_id=None):
+        if stop_pc is None and max_cycles is None:
+            raise ValueError("A job needs 'stop_pc' and/or 'max_cycles'")
+        self.program = bytes(bytearray(program))
+        self.load_address = load_address
+        self.entry = load_address if entry is None else entry
+        self.stop_pc = stop_pc
+        self.max_cycles = max_cycles
+        self.regions = tuple(regions)
+        self.registers = registers or {}
+        self.data = tuple([(address, bytes(bytearray(datum))) for address, datum in data])
+        self.max_ops = max_ops
+        self.job_id = job_id
+
+    def __repr__(self):
+        return "<BatchJob %r: %i Bytes at $%04x>" % (
+            self.job_id, len(self.program), self.load_address
+        )
+
+
+class BatchResult(object):
+    """
+    regions -- dict with (start, end) -> bytes for every BatchJob.regions entry
+    """
+    def __init__(self, job_id, stop_reason, cycles, ops, registers, cc, regions, pid):
+        self.job_id = job_id
+        self.stop_reason = stop_reason
+        self.cycles = cycles
+        self.ops = ops
+        self.registers = registers
+        self.cc = cc
+        self.regions = regions
+        self.pid = pid # worker process ID
+
+    def __repr__(self):
+        return "<BatchResult %r: %s after %i cycles>" % (
+            self.job_id, self.stop_reason, self.cycles
+        )
+
+
+class BatchMachine(object):
+    """
+    A CPU/Memory that will be reused for many jobs.
+
+    cfg_class -- the machine config, a MC6809.core.configs.BaseConfig class
+    """
+    def __init__(self, cfg_class, roms=(), cpu_class=CPU, cfg_dict=None):
+        cfg = cfg_class(dict(cfg_dict or DEFAULT_CFG_DICT))
+        self.cpu = cpu_class(Memory(cfg), cfg)
+        memory = self.cpu.memory
+        for address, data in roms:
+            memory.load(address, bytearray(data))
+        # Memory image with all ROMs, used to reset the memory for every job:
+        self.base_image = memory.get_image().tobytes()
+
+    def reset(self):
+        cpu = self.cpu
+        # Drops all decoded/translated code, too:
+        cpu.memory.set_image(self.base_image)
+
+        for name in RESULT_REGISTERS:
+            cpu.register_str2object[name].set(0)
+        cpu.set_cc(0x00)
+        cpu.cycles = 0
+        cpu.interrupt_lines = 0
+        cpu.waiting = None
+
+    def run(self, job):
+        self.reset()
+        cpu = self.cpu
+        memory = cpu.memory
+
+        memory.load(job.load_address, bytearray(job.program))
+        for address, data in job.data:
+            memory.load(address, bytearray(data))
+        for name, value in job.registers.items():
+            if name == REG_CC:
+                cpu.set_cc(value)
+            else:
+                cpu.register_str2object[name].set(value)
+        cpu.program_counter.set(job.entry)
+
+        # https://wiki.python.org/moin/PythonSpeed/PerformanceTips#Avoiding_dots...
+        get_and_call_next_op = cpu.get_and_call_next_op
+        program_counter = cpu.program_counter
+        stop_pc = job.stop_pc
+        max_cycles = job.max_cycles
+
+        stop_reason = STOP_MAX_OPS
+        ops = 0
+        for ops in range(job.max_ops):
+            if program_counter.value == stop_pc:
+                stop_reason = STOP_PC
+                break
+            if max_cycles is not None and cpu.cycles >= max_cycles:
+                stop_reason = STOP_CYCLES
+                break
+            try:
+                get_and_call_next_op()
+            except WaitForInterrupt:
+                while cpu.waiting:
+                    if not cpu.wait_for_interrupt():
+                        break
+                if cpu.waiting:
+                    # No scheduled event or interrupt line can end the wait
+                    ops += 1
+                    stop_reason = STOP_WAIT
+                    break
+        else:
+            ops = job.max_ops
+            log.error("Job %r: max ops %i arrived!", job.job_id, job.max_ops)
+
+        mem = memory.get_image()
+        return BatchResult(
+            job_id=job.job_id,
+            stop_reason=stop_reason,
+            cycles=cpu.cycles,
+            ops=ops,
+            registers=dict([
+                (name, cpu.register_str2object[name].value) for name in RESULT_REGISTERS
+            ]),
+            cc=cpu.get_cc_value(),
+            regions=dict([
+                ((start, end), mem[start:end + 1].tobytes()) for start, end in job.regions
+            ]),
+            pid=os.getpid(),
+        )
+
+
+# The BatchMachine of the current worker process:
+_worker_machine = None
+
+def _init_worker(cfg_class, roms, cpu_class, cfg_dict):
+    global _worker_machine
+    _worker_machine = BatchMachine(cfg_class, roms, cpu_class, cfg_dict)
+
+def _run_job(job):
+    return _worker_machine.run(job)
+
+def _warm_up():
+    return os.getpid()
+
+
+class BatchRunner(object):
+    """
+    Run BatchJob instances in a process pool.
+
+    The ROMs will be send one time to every worker process and not with
+    every job.
+    """
+    def __init__(self, cfg_class, roms=(), max_workers=None, cpu_class=CPU,
+                cfg_dict=None, warm_up=True):
+        if ProcessPoolExecutor is None:
+            raise RuntimeError("Batch runner needs Python 3.7 or newer (current: %i.%i)" % sys.version_info[:2])
+        if max_workers is None:
+            max_workers = multiprocessing.cpu_count()
+        self.max_workers = max_workers
+        roms = tuple([(address, bytes(bytearray(data))) for address, data in roms])
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(cfg_class, roms, cpu_class, cfg_dict),
+        )
+        if warm_up:
+            self.warm_up()
+
+    def warm_up(self):
+        """
+        Start all worker processes, so the CPU build will be done before
+        the first job is submitted.
+        returns the worker process IDs
+        """
+        futures = [self.executor.submit(_warm_up) for __ in range(self.max_workers)]
+        return set([future.result() for future in futures])
+
+    def submit(self, job):
+        """ returns a concurrent.futures.Future with the BatchResult """
+        return self.executor.submit(_run_job, job)
+
+    def map(self, jobs, chunksize=1):
+        """ returns the BatchResult instances in the same order as the jobs """
+        return self.executor.map(_run_job, jobs, chunksize=chunksize)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
@@ -16,8 +16,13 @@ import sys
 import locale
 import string
 import time
+import timeit
 import logging
 
+from MC6809.components.cpu6809 import CPUBlockCache, CPUDecodeCache, CPULazyFlags, \
+    CPUSlottedRegisters
+from MC6809.components.mc6809_cc_register import ADD8_TABLE, DEC8_TABLE, INC8_TABLE, \
+    LSL8_TABLE, NZ8_TABLE, ROR8_TABLE, SUB8_TABLE
 from MC6809.tests.test_6809_program import Test6809_Program, \
     Test6809_Program_Division2
 from MC6809.utils.humanize import locale_format_number
@@ -53,7 +58,7 @@ class Test6809_Program2(Test6809_Program):
 
         start_time = time.time()
         for __ in range(loops):
-            self._crc32(txt)
+            func(txt)
         duration = time.time() - start_time
 
         print("%s benchmark runs %s CPU cycles in %.2f sec" % (
@@ -68,12 +73,59 @@ class Test6809_Program2(Test6809_Program):
     def crc16_benchmark(self, loops, multiply):
         return self.bench(loops, multiply, self._crc16, "CRC16")
 
+    def use_opcode_dict_dispatch(self):
+        """
+        Call all ops via cpu.opcode_dict lookups, like the origin run loop.
+        Used to compare against the flat dispatch tables.
+        """
+        cpu = self.cpu
+        read_pc_byte = cpu.read_pc_byte
+        call_instruction_func = cpu.call_instruction_func
 
+        def get_and_call_next_op():
+            op_address, opcode = read_pc_byte()
+            call_instruction_func(op_address, opcode)
 
-def run_benchmark(loops, multiply):
+        cpu.get_and_call_next_op = get_and_call_next_op
+
+
+class Test6809_Program_OpcodeDict(Test6809_Program2):
+    def setUp(self):
+        super(Test6809_Program_OpcodeDict, self).setUp()
+        self.use_opcode_dict_dispatch()
+
+
+class Test6809_Program_BlockCache(Test6809_Program2):
+    CPU_CLASS = CPUBlockCache
+
+
+class Test6809_Program_DecodeCache(Test6809_Program2):
+    CPU_CLASS = CPUDecodeCache
+
+
+class Test6809_Program_SlottedRegisters(Test6809_Program2):
+    CPU_CLASS = CPUSlottedRegisters
+
+
+class Test6809_Program_LazyFlags(Test6809_Program2):
+    CPU_CLASS = CPULazyFlags
+
+
+
+def run_benchmark(loops, multiply, block_cache=False, decode_cache=False, slotted_registers=False,
+            lazy_flags=False):
     total_duration = 0
     total_cycles = 0
-    bench_class = Test6809_Program2()
+    if block_cache:
+        bench_class = Test6809_Program_BlockCache()
+    elif decode_cache:
+        bench_class = Test6809_Program_DecodeCache()
+    elif slotted_registers:
+        bench_class = Test6809_Program_SlottedRegisters()
+    elif lazy_flags:
+        bench_class = Test6809_Program_LazyFlags()
+    else:
+        bench_class = Test6809_Program2()
 
     #--------------------------------------------------------------------------
 
@@ -95,6 +147,91 @@ def run_benchmark(loops, multiply):
     print("\tavg.: %s CPU cycles/sec" % locale_format_number(total_cycles / total_duration))
 
 
+def run_dispatch_benchmark(loops, multiply):
+    """
+    Compare the opcode_dict lookup against the flat dispatch tables
+    with the CRC16/CRC32 benchmark.
+    """
+    results = []
+    for txt, bench_class in (
+                ("opcode_dict lookup", Test6809_Program_OpcodeDict()),
+                ("flat dispatch tables", Test6809_Program2()),
+            ):
+        print("\n *** %s ***" % txt)
+        total_duration = 0
+        total_cycles = 0
+        for bench_func in (bench_class.crc16_benchmark, bench_class.crc32_benchmark):
+            duration, cycles = bench_func(loops, multiply)
+            total_duration += duration
+            total_cycles += cycles
+        cycles_per_sec = total_cycles / total_duration
+        results.append(cycles_per_sec)
+        print("%s: %s CPU cycles/sec" % (txt, locale_format_number(cycles_per_sec)))
+
+    print("-"*79)
+    dict_cycles_per_sec, table_cycles_per_sec = results
+    print("\nflat dispatch tables are %.1f%% faster than opcode_dict lookup." % (
+        (table_cycles_per_sec / dict_cycles_per_sec - 1) * 100
+    ))
+
+
+def run_flag_table_benchmark(loops):
+    """
+    Microbenchmark: Compare the flag calculation via the bit test chains
+    against the precomputed flag tables for every 8-bit helper.
+    """
+    bench_class = Test6809_Program2()
+    bench_class.setUp()
+    cpu = bench_class.cpu
+
+    values = range(0x100)
+    def bench(func):
+        return min(timeit.repeat(lambda: [func(a) for a in values], number=loops, repeat=3))
+
+    b = 0x5a
+    helpers = (
+        ("ADD8 HNZVC",
+            lambda a: (cpu.clear_HNZVC(), cpu.update_HNZVC_8(a, b, a + b)),
+            lambda a: cpu.assign_HNZVC(ADD8_TABLE[a << 8 | b]),
+        ),
+        ("SUB8 NZVC",
+            lambda a: (cpu.clear_NZVC(), cpu.update_NZVC_8(a, b, a - b)),
+            lambda a: cpu.assign_NZVC(SUB8_TABLE[a << 8 | b]),
+        ),
+        ("NEG8 NZVC",
+            lambda a: (cpu.clear_NZVC(), cpu.update_NZVC_8(0, a, -a)),
+            lambda a: cpu.assign_NZVC(SUB8_TABLE[a]),
+        ),
+        ("AND/EOR NZ0",
+            lambda a: (cpu.clear_NZV(), cpu.update_NZ_8(a & b)),
+            lambda a: cpu.assign_NZV(NZ8_TABLE[a & b]),
+        ),
+        ("INC8 NZV",
+            lambda a: (cpu.clear_NZV(), cpu.update_NZ_8(a + 1), a + 1 == 0x80 and cpu.set_V8(0, 0, 0x80)),
+            lambda a: cpu.assign_NZV(INC8_TABLE[a]),
+        ),
+        ("DEC8 NZV",
+            lambda a: (cpu.clear_NZV(), cpu.update_NZ_8(a - 1), a - 1 == 0x7f and cpu.set_V8(0, 0, 0x80)),
+            lambda a: cpu.assign_NZV(DEC8_TABLE[a]),
+        ),
+        ("LSL8 NZVC",
+            lambda a: (cpu.clear_NZVC(), cpu.update_NZVC_8(a, a, a << 1)),
+            lambda a: cpu.assign_NZVC(LSL8_TABLE[a]),
+        ),
+        ("ROR8 NZC",
+            lambda a: (cpu.clear_NZ(), cpu.update_NZ_8(a >> 1 | cpu.C << 7), setattr(cpu, "C", a & 1)),
+            lambda a: cpu.assign_NZC(ROR8_TABLE[cpu.C << 8 | a]),
+        ),
+    )
+    print("\n%i x 256 flag calculations:" % loops)
+    for name, chain_func, table_func in helpers:
+        chain_duration = bench(chain_func)
+        table_duration = bench(table_func)
+        print("%-12s bit tests: %.3f sec - table: %.3f sec - %.1fx faster" % (
+            name, chain_duration, table_duration, chain_duration / table_duration
+        ))
+
+
 if __name__ == '__main__':
     from MC6809.utils.logging_utils import setup_logging
 
@@ -111,8 +248,9 @@ if __name__ == '__main__':
     locale.setlocale(locale.LC_ALL, '') # For Formating cycles/sec number
 
     run_benchmark(
-        loops=1
-#        loops=2
-#        loops=10
+        loops=1,
+#        loops=2,
+#        loops=10,
+        multiply=15
     )
     print(" --- END --- ")
@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+# encoding:utf8
+
+"""
+    MC6809 - 6809 CPU emulator in Python
+    =======================================
+
+    Benchmark suite
+
+    Run many small workloads and store the results as JSON, so that
+    regressions can be found per op code family and not only in one
+    aggregate number:
+
+     * micro benchmarks for every op code, generated from MC6809OP_DATA_DICT
+     * micro benchmarks for every addressing mode (incl. all indexed modes)
+     * macro benchmarks: CRC16/CRC32, division, memory clear/copy, JSR/RTS
+
+    More workloads can be added with BenchmarkSuite.add()
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import abc
+import fnmatch
+import json
+import logging
+import platform
+import string
+import time
+
+from MC6809.components.MC6809data.MC6809_data_utils import MC6809OP_DATA_DICT
+from MC6809.components.cpu6809 import CPU, CPUBlockCache, CPUDecodeCache, CPULazyFlags, \
+    CPUSlottedRegisters
+from MC6809.components.memory import Memory
+from MC6809.tests.test_6809_program import Test6809_Program, Test6809_Program_Division2
+from MC6809.tests.test_base import BaseCPUTestCase
+from MC6809.tests.test_config import TestCfg
+
+
+log = logging.getLogger("MC6809")
+
+try:
+    timer = time.perf_counter # new in Python 3.3
+except AttributeError:
+    timer = time.time
+
+
+# CPU variants for the --cpu option:
+CPU_CLASSES = {
+    "default": CPU,
+    "block-cache": CPUBlockCache,
+    "decode-cache": CPUDecodeCache,
+    "slotted-registers": CPUSlottedRegisters,
+    "lazy-flags": CPULazyFlags,
+}
+
+# Start address of all micro benchmark code
+CODE_START = 0x4000
+
+# Register values before every run, so that all memory accesses
+# will go into the RAM:
+INITIAL_REGISTERS = {
+    "index_x": 0x2000,
+    "index_y": 0x2100,
+    "user_stack_pointer": 0x3800,
+    "system_stack_pointer": 0x3000,
+    "direct_page": 0x20,
+    "accu_a": 0x12,
+    "accu_b": 0x34,
+}
+
+# Ops that leave the straight-line code: they are part of the macro workloads
+# or can't run in a loop without setup (e.g.: vectors for SWI)
+NOT_MICRO_BENCHMARKED = (
+    "JMP", "JSR", "RTS", "RTI", "SWI", "SWI2", "SWI3", "SYNC", "CWAI", "RESET",
+    "PAGE 1", "PAGE 2",
+)
+
+# Default operand bytes for the op code micro benchmarks:
+MICRO_OPERANDS = {
+    "INHERENT": [],
+    "IMMEDIATE": [0x01],
+    "IMMEDIATE_WORD": [0x30, 0x00],
+    "DIRECT": [0x10], # $2010
+    "DIRECT_WORD": [0x10],
+    "EXTENDED": [0x20, 0x00], # $2000
+    "EXTENDED_WORD": [0x20, 0x00],
+    "INDEXED": [0x84], # ,X
+    "INDEXED_WORD": [0x84],
+    "RELATIVE": [0x00], # branch to the next op
+    "RELATIVE_WORD": [0x00, 0x00],
+}
+# Special immediate operands:
+MICRO_POSTBYTES = {
+    "TFR": [0x12], # TFR X,Y
+    "EXG": [0x89], # EXG A,B
+    "PSHS": [0x06], # A,B
+    "PSHU": [0x06],
+    "PULS": [0x06],
+    "PULU": [0x06],
+}
+
+# Addressing mode micro benchmarks, all with "LDA":
+ADDRESSING_MODES = (
+    ("immediate", [0x86, 0x01]),
+    ("direct", [0x96, 0x10]),
+    ("extended", [0xb6, 0x20, 0x00]),
+    ("indexed n5,X", [0xa6, 0x01]),
+    ("indexed ,X+", [0xa6, 0x80]),
+    ("indexed ,X++", [0xa6, 0x81]),
+    ("indexed ,-X", [0xa6, 0x82]),
+    ("indexed ,--X", [0xa6, 0x83]),
+    ("indexed ,X", [0xa6, 0x84]),
+    ("indexed B,X", [0xa6, 0x85]),
+    ("indexed A,X", [0xa6, 0x86]),
+    ("indexed n8,X", [0xa6, 0x88, 0x10]),
+    ("indexed n16,X", [0xa6, 0x89, 0x01, 0x00]),
+    ("indexed D,X", [0xa6, 0x8b]),
+    ("indexed n8,PCR", [0xa6, 0x8c, 0x00]),
+    ("indexed n16,PCR", [0xa6, 0x8d, 0x00, 0x00]),
+    ("indexed [,X]", [0xa6, 0x94]),
+    ("indexed [n16]", [0xa6, 0x9f, 0x20, 0x00]),
+)
+
+
+def new_cpu(cpu_class=CPU):
+    cfg = TestCfg(BaseCPUTestCase.UNITTEST_CFG_DICT)
+    memory = Memory(cfg)
+    return cpu_class(memory, cfg)
+
+
+def mean_variance(values):
+    """
+    >>> mean_variance([1, 2, 3, 4])
+    (2.5, 1.25)
+    """
+    mean = sum(values) / len(values)
+    variance = sum([(value - mean) ** 2 for value in values]) / len(values)
+    return mean, variance
+
+
+# Python 2 and 3 compatible base class for abstract classes
+_ABC = abc.ABCMeta("_ABC", (object,), {})
+
+
+class Workload(_ABC):
+    """
+    Base class for all benchmark workloads.
+
+    'family' is used to group the results, e.g. all ops with the
+    same op method (ADD8 for ADDA/ADDB) or "macro".
+    """
+    kind = None
+
+    def __init__(self, name, family):
+        self.name = name
+        self.family = family
+
+    def setup(self, cpu):
+        """ Called before every run, not timed. """
+        for name, value in INITIAL_REGISTERS.items():
+            getattr(cpu, name).set(value)
+        cpu.set_cc(0x00)
+
+    @abc.abstractmethod
+    def run(self, cpu):
+        """
+        Run the workload on the prepared cpu (timed).
+        Must be implemented by every workload class.
+        """
+
+
+class CodeWorkload(Workload):
+    """
+    Run straight code from 'start' to the end of the code.
+    """
+    def __init__(self, name, family, code, start=CODE_START, repeat=1):
+        super(CodeWorkload, self).__init__(name, family)
+        self.code = code * repeat
+        self.start = start
+        self.end = start + len(self.code)
+        self.max_ops = 1000000
+
+    def setup(self, cpu):
+        super(CodeWorkload, self).setup(cpu)
+        cpu.memory.load(self.start, self.code)
+
+    def run(self, cpu):
+        cpu.test_run(self.start, self.end, self.max_ops)
+
+
+class MicroWorkload(CodeWorkload):
+    kind = "micro"
+
+
+class MacroWorkload(CodeWorkload):
+    kind = "macro"
+
+    def __init__(self, name, code, start=CODE_START, setup_func=None):
+        super(MacroWorkload, self).__init__(name, "macro", code, start)
+        self.setup_func = setup_func
+
+    def setup(self, cpu):
+        super(MacroWorkload, self).setup(cpu)
+        if self.setup_func is not None:
+            self.setup_func(cpu)
+
+
+class TestProgramWorkload(Workload):
+    """
+    Run a program from the unittests, e.g.: Test6809_Program._crc16()
+    """
+    kind = "macro"
+
+    def __init__(self, name, test_class, method_name, *args):
+        super(TestProgramWorkload, self).__init__(name, "macro")
+        self.test_class = test_class
+        self.method_name = method_name
+        self.args = args
+
+    def run(self, cpu):
+        test_case = self.test_class()
+        test_case.cpu = cpu
+        getattr(test_case, self.method_name)(*self.args)
+
+
+def iter_micro_workloads(repeat):
+    """
+    Generate one micro benchmark per op code from MC6809OP_DATA_DICT
+    """
+    cpu = new_cpu()
+    for opcode, op_data in sorted(MC6809OP_DATA_DICT.items()):
+        mnemonic = op_data["mnemonic"]
+        if mnemonic in NOT_MICRO_BENCHMARKED:
+            continue
+
+        if opcode > 0xff:
+            code = [opcode >> 8, opcode & 0xff]
+        else:
+            code = [opcode]
+        code += MICRO_POSTBYTES.get(mnemonic, MICRO_OPERANDS[op_data["addr_mode"]])
+
+        family = cpu.instr_func_dict[opcode].__name__.replace("instruction_", "")
+        name = "$%02x %s %s" % (opcode, mnemonic, op_data["addr_mode"].lower())
+        yield MicroWorkload(name, family, code, repeat=repeat)
+
+
+def iter_addressing_workloads(repeat):
+    for name, code in ADDRESSING_MODES:
+        yield MicroWorkload("LDA %s" % name, "addressing", code, repeat=repeat)
+
+
+def _setup_memory_clear(cpu):
+    cpu.index_x.set(0x2000)
+
+def _setup_memory_copy(cpu):
+    cpu.memory.load(0x1000, list(range(0x100)) * 4)
+    cpu.index_x.set(0x1000) # source
+    cpu.index_y.set(0x2000) # destination
+
+
+def iter_macro_workloads():
+    txt = string.printable.encode("ASCII")
+    yield TestProgramWorkload("CRC16", Test6809_Program, "_crc16", txt)
+    yield TestProgramWorkload("CRC32", Test6809_Program, "_crc32", txt)
+    yield TestProgramWorkload("division", Test6809_Program_Division2, "_division", 0xfffffff, 0x8000)
+    yield MacroWorkload("memory clear", [
+        0xCC, 0x00, 0x00, #       LDD #$0000
+        0xED, 0x81, #       loop  STD ,X++
+        0x8C, 0x24, 0x00, #      CMPX #$2400 ; clear 1KB
+        0x26, 0xF9, #             BNE loop
+    ], setup_func=_setup_memory_clear)
+    yield MacroWorkload("memory copy", [
+        0xEC, 0x81, #       loop  LDD ,X++
+        0xED, 0xA1, #             STD ,Y++
+        0x8C, 0x14, 0x00, #      CMPX #$1400 ; copy 1KB
+        0x26, 0xF7, #             BNE loop
+    ], setup_func=_setup_memory_copy)
+    yield MacroWorkload("JSR/RTS", [
+        0x8E, 0x01, 0x00, #       LDX #256
+        0xBD, 0x40, 0x0C, # loop  JSR sub1
+        0x30, 0x1F, #             LEAX -1,X
+        0x26, 0xF9, #             BNE loop
+        0x20, 0x09, #             BRA end
+        0x34, 0x16, #       sub1  PSHS X,B,A
+        0x8D, 0x03, #             BSR sub2
+        0x35, 0x16, #             PULS A,B,X
+        0x39, #                   RTS
+        0x4C, #             sub2  INCA
+        0x39, #                   RTS
+        #                   end
+    ])
+
+
+class BenchmarkSuite(object):
+    def __init__(self, cpu_class=CPU):
+        self.cpu_class = cpu_class
+        self.workloads = []
+
+    def add(self, workload):
+        self.workloads.append(workload)
+
+    def add_default_workloads(self, micro_repeat=64):
+        for workload in iter_micro_workloads(micro_repeat):
+            self.add(workload)
+        for workload in iter_addressing_workloads(micro_repeat):
+            self.add(workload)
+        for workload in iter_macro_workloads():
+            self.add(workload)
+
+    def filter(self, pattern):
+        """ use only workloads with a matching name or family, e.g.: "*ADD*" """
+        self.workloads = [
+            workload for workload in self.workloads
+            if fnmatch.fnmatch(workload.name, pattern) or fnmatch.fnmatch(workload.family, pattern)
+        ]
+
+    def count_ops(self, workload):
+        """
+        Run the workload one time and count the executed ops (not timed).
+        Always counted with the interpreter CPU: e.g. get_and_call_next_op()
+        of the block cache CPU runs a whole block.
+        """
+        cpu = new_cpu(CPU)
+        op_count = [0]
+        get_and_call_next_op = cpu.get_and_call_next_op
+        def counting_get_and_call_next_op():
+            op_count[0] += 1
+            get_and_call_next_op()
+        cpu.get_and_call_next_op = counting_get_and_call_next_op
+        try:
+            workload.setup(cpu)
+            workload.run(cpu)
+        finally:
+            del cpu.get_and_call_next_op
+        return op_count[0]
+
+    def run_workload(self, workload, runs):
+        op_count = self.count_ops(workload)
+        cpu = new_cpu(self.cpu_class)
+
+        cycles_per_sec = []
+        ops_per_sec = []
+        cycles = 0
+        for __ in range(runs):
+            workload.setup(cpu)
+            start_cycles = cpu.cycles
+            start_time = timer()
+            workload.run(cpu)
+            duration = timer() - start_time
+            cycles = cpu.cycles - start_cycles
+            cycles_per_sec.append(cycles / duration)
+            ops_per_sec.append(op_count / duration)
+
+        cycles_mean, cycles_variance = mean_variance(cycles_per_sec)
+        ops_mean, ops_variance = mean_variance(ops_per_sec)
+        return {
+            "name": workload.name,
+            "family": workload.family,
+            "kind": workload.kind,
+            "runs": runs,
+            "cycles": cycles,
+            "ops": op_count,
+            "cycles_per_sec": cycles_mean,
+            "cycles_per_sec_variance": cycles_variance,
+            "ops_per_sec": ops_mean,
+            "ops_per_sec_variance": ops_variance,
+        }
+
+    def run(self, runs=5, verbose=False):
+        results = []
+        for workload in self.workloads:
+            result = self.run_workload(workload, runs)
+            if verbose:
+                print("%-30s %12.0f cycles/sec %12.0f ops/sec" % (
+                    workload.name, result["cycles_per_sec"], result["ops_per_sec"]
+                ))
+            results.append(result)
+
+        families = {}
+        for result in results:
+            families.setdefault(result["family"], []).append(result)
+        family_results = {}
+        for family, family_list in families.items():
+            cycles_mean, cycles_variance = mean_variance([r["cycles_per_sec"] for r in family_list])
+            ops_mean, ops_variance = mean_variance([r["ops_per_sec"] for r in family_list])
+            family_results[family] = {
+                "workloads": len(family_list),
+                "cycles_per_sec": cycles_mean,
+                "cycles_per_sec_variance": cycles_variance,
+                "ops_per_sec": ops_mean,
+                "ops_per_sec_variance": ops_variance,
+            }
+
+        return {
+            "info": {
+                "cpu_class": self.cpu_class.__name__,
+                "python": "%s %s" % (platform.python_implementation(), platform.python_version()),
+                "platform": platform.platform(),
+                "runs": runs,
+            },
+            "families": family_results,
+            "workloads": results,
+        }
+
+
+def run_benchmark_suite(runs=5, pattern=None, json_filename=None, cpu_class=CPU, verbose=True):
+    suite = BenchmarkSuite(cpu_class)
+    suite.add_default_workloads()
+    if pattern is not None:
+        suite.filter(pattern)
+    results = suite.run(runs, verbose=verbose)
+
+    if verbose:
+        print("-"*79)
+        for family, family_result in sorted(results["families"].items()):
+            print("%-20s %12.0f cycles/sec %12.0f ops/sec (%i workloads)" % (
+                family, family_result["cycles_per_sec"], family_result["ops_per_sec"],
+                family_result["workloads"],
+            ))
+
+    if json_filename is not None:
+        with open(json_filename, "w") as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+        if verbose:
+            print("\nResults written to %r" % json_filename)
+    return results
+
+
+if __name__ == '__main__':
+    from MC6809.utils.logging_utils import setup_logging
+
+    setup_logging(log,
+        level=50 # CRITICAL/FATAL
+    )
+    run_benchmark_suite(runs=3)
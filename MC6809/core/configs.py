@@ -15,6 +15,8 @@ import inspect
 import logging
 import sys
 
+from MC6809.utils.address_ranges import AddressRangeMap
+
 PY2 = sys.version_info[0] == 2
 if PY2:
     range = xrange
@@ -29,13 +31,23 @@ class DummyMemInfo(object):
         return ">>mem info not active<<"
 
 
-class AddressAreas(dict):
+class AddressAreas(AddressRangeMap):
     """
     Hold information about memory address areas which accessed via bus.
     e.g.:
         Interrupt vectors
         Text screen
         Serial/parallel devices
+
+    Stored as address ranges. The dict API of the old implementation
+    (one entry per address) is still available:
+
+    >>> areas = AddressAreas(((0x0400, 0x05ff, "Text screen"),))
+    >>> areas[0x0400], 0x0600 in areas, areas.get(0x0600, "-")
+    ('Text screen', False, '-')
+    >>> areas[0x0600] = "foo"
+    >>> len(areas), list(areas.items())[-1]
+    (513, (1536, 'foo'))
     """
     def __init__(self, areas):
         super(AddressAreas, self).__init__()
@@ -43,8 +55,25 @@ class AddressAreas(dict):
             self.add_area(start_addr, end_addr, txt)
 
     def add_area(self, start_addr, end_addr, txt):
-        for addr in range(start_addr, end_addr + 1):
-            dict.__setitem__(self, addr, txt)
+        self.add(txt, start_addr, end_addr)
+
+    # ---- dict compatibility ----
+
+    def __setitem__(self, address, txt):
+        self.add(txt, address)
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [txt for __, txt in self.items()]
+
+    def items(self):
+        return [
+            (address, txt)
+            for start, end, txt in self.iter_ranges()
+            for address in range(start, end + 1)
+        ]
 
 
 class BaseConfig(object):
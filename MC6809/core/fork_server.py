@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# encoding:utf8
+
+"""
+    MC6809 - 6809 CPU emulator in Python
+    =======================================
+
+    Fork server
+
+    Boot a machine one time and run many jobs from this warm state:
+
+     * with os.fork() (copy-on-write): A pool of forked child processes
+       wait for a job. Every child runs exactly one job and sends the
+       result back through a pipe.
+     * without os.fork() (or use_fork=False): One in-process clone of the
+       CPU will be reset from a snapshot before every job.
+
+    e.g.:
+
+        def job_func(cpu, data):
+            cpu.memory.load(0x5000, data)
+            cpu.test_run(0x4000, 0x4010)
+            return cpu.accu_d.value
+
+        with ForkServer(booted_cpu, job_func, pool_size=4) as server:
+            results = server.map(inputs)
+
+    In fork mode the children inherit the CPU, the job function, the
+    memory callbacks/middlewares and the cycle events via os.fork(): Only
+    the job inputs and the results are pickled, they must be picklable.
+    A clone has no memory callbacks/middlewares and cycle events, so the
+    clone mode refuses a CPU that has some.
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import os
+import pickle
+import struct
+import traceback
+
+from MC6809.components.memory import Memory
+
+
+log = logging.getLogger("MC6809")
+
+
+MESSAGE_HEADER = struct.Struct(">I")
+
+
+def write_message(fd, obj):
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    data = MESSAGE_HEADER.pack(len(data)) + data
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+
+
+def _read_bytes(fd, size):
+    chunks = []
+    while size:
+        chunk = os.read(fd, size)
+        if not chunk:
+            raise EOFError("Pipe closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_message(fd):
+    size, = MESSAGE_HEADER.unpack(_read_bytes(fd, MESSAGE_HEADER.size))
+    return pickle.loads(_read_bytes(fd, size))
+
+
+class ForkedChild(object):
+    def __init__(self, pid, job_fd, result_fd):
+        self.pid = pid
+        self.job_fd = job_fd
+        self.result_fd = result_fd
+
+    def close(self):
+        os.close(self.job_fd)
+        os.close(self.result_fd)
+        os.waitpid(self.pid, 0)
+
+
+class ForkServer(object):
+    def __init__(self, cpu, job_func, pool_size=4, use_fork=None):
+        """
+        cpu -- the booted CPU, it will not be changed by the jobs
+        job_func -- job_func(cpu, job_input) -> result
+        """
+        self.cpu = cpu
+        self.job_func = job_func
+        self.pool_size = pool_size
+        if use_fork is None:
+            use_fork = hasattr(os, "fork")
+        self.use_fork = use_fork
+        if not use_fork and (cpu.memory.has_callbacks() or len(cpu.scheduler)):
+            # The jobs would run different than in fork mode
+            raise ValueError(
+                "Without os.fork() the CPU will be cloned without memory callbacks/middlewares"
+                " and cycle events, but the CPU has some."
+            )
+
+        # The frozen state for all jobs:
+        self.snapshot = cpu.save_snapshot()
+
+        self._clone = None
+        self._children = [] # idle children, waiting for a job
+        self._running = [] # children with a job, in submit order
+        if self.use_fork:
+            self._fill_pool()
+
+    #---------------------------------------------------------------------------
+
+    def _fork(self):
+        # Reset to the frozen state, just in case the CPU was used in between:
+        self.cpu.load_snapshot(self.snapshot)
+
+        job_read_fd, job_write_fd = os.pipe()
+        result_read_fd, result_write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # child process
+            exit_code = 0
+            try:
+                os.close(job_write_fd)
+                os.close(result_read_fd)
+                # Close the pipes of all siblings, idle and running:
+                for child in self._children + self._running:
+                    os.close(child.job_fd)
+                    os.close(child.result_fd)
+                self._run_child(job_read_fd, result_write_fd)
+            except BaseException:
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+
+        os.close(job_read_fd)
+        os.close(result_write_fd)
+        return ForkedChild(pid, job_write_fd, result_read_fd)
+
+    def _run_child(self, job_fd, result_fd):
+        try:
+            job_input = read_message(job_fd)
+        except EOFError:
+            return # Server shutdown
+        try:
+            result = (True, self.job_func(self.cpu, job_input))
+        except Exception:
+            result = (False, traceback.format_exc())
+        write_message(result_fd, result)
+
+    def _fill_pool(self):
+        while len(self._children) < self.pool_size:
+            self._children.append(self._fork())
+
+    def _get_result(self, child):
+        try:
+            ok, result = read_message(child.result_fd)
+        finally:
+            child.close()
+        if not ok:
+            raise RuntimeError("Job failed in child process %i:\n%s" % (child.pid, result))
+        return result
+
+    #---------------------------------------------------------------------------
+
+    def get_clone(self):
+        """
+        returns the in-process clone, reset to the frozen state
+        """
+        if self._clone is None:
+            cfg = self.cpu.cfg
+            self._clone = self.cpu.__class__(Memory(cfg), cfg)
+        self._clone.load_snapshot(self.snapshot)
+        return self._clone
+
+    def run(self, job_input):
+        """ Run one job and returns the result """
+        return self.map([job_input])[0]
+
+    def map(self, job_inputs):
+        """
+        Run all jobs and returns the results in the same order.
+        In fork mode up to 'pool_size' jobs run in parallel.
+        """
+        if not self.use_fork:
+            return [self.job_func(self.get_clone(), job_input) for job_input in job_inputs]
+
+        results = []
+        running = self._running
+        try:
+            for job_input in job_inputs:
+                if not self._children:
+                    self._fill_pool()
+                child = self._children.pop(0)
+                running.append(child)
+                write_message(child.job_fd, job_input)
+                if len(running) >= self.pool_size:
+                    results.append(self._get_result(running.pop(0)))
+            while running:
+                results.append(self._get_result(running.pop(0)))
+        finally:
+            # e.g. a job failed: Don't leave the other children behind
+            while running:
+                running.pop(0).close()
+        self._fill_pool()
+        return results
+
+    def shutdown(self):
+        while self._children:
+            self._children.pop().close() # child will exit on EOF
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# encoding:utf8
+
+"""
+    MC6809 - 6809 CPU emulator in Python
+    =======================================
+
+    Deterministic record/replay of memory callbacks
+
+    Values from read callbacks/middlewares (devices) depend on the host
+    timing, so a run with devices is not reproducible. IORecorder logs every
+    hooked read and write into a append-only binary file. IOReplayer returns
+    the recorded values instead of calling the read callbacks, so a run can
+    be repeated (without a speed limit) as fast as the plain interpreter.
+
+    File format: magic (8 Bytes), version (word) and then records with:
+
+        delta cycles (8 Bytes), address (word), kind (byte), value (word)
+
+    All values are Big-Endian. The cycles are relative to the last record.
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import struct
+
+
+log = logging.getLogger("MC6809")
+
+
+IO_LOG_MAGIC = b"MC6809IO"
+IO_LOG_VERSION = 2
+
+HEADER = struct.Struct(">8sH")
+RECORD = struct.Struct(">QHBH")
+RECORD_V1 = struct.Struct(">IHBH") # version 1 used 32-Bit delta cycles
+
+READ_BYTE = 1
+READ_WORD = 2
+WRITE_BYTE = 3
+WRITE_WORD = 4
+KIND_NAMES = {
+    READ_BYTE: "read byte",
+    READ_WORD: "read word",
+    WRITE_BYTE: "write byte",
+    WRITE_WORD: "write word",
+}
+
+# Read records in chunks of this count:
+READ_CHUNK_RECORDS = 4096
+
+
+def iter_records(fileobj):
+    """
+    yield (cycles, address, kind, value) from a IO log file
+    """
+    header = fileobj.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise ValueError("No MC6809 IO log: file too short")
+    magic, version = HEADER.unpack(header)
+    if magic != IO_LOG_MAGIC:
+        raise ValueError("No MC6809 IO log (magic: %r)" % magic)
+    if version > IO_LOG_VERSION:
+        raise ValueError("Unsupported IO log version %i (max. %i)" % (version, IO_LOG_VERSION))
+    record = RECORD if version >= 2 else RECORD_V1
+
+    cycles = 0
+    rest = b""
+    while True:
+        data = fileobj.read(record.size * READ_CHUNK_RECORDS)
+        if not data:
+            break
+        data = rest + data
+        end = len(data) - len(data) % record.size
+        for offset in range(0, end, record.size):
+            delta_cycles, address, kind, value = record.unpack_from(data, offset)
+            cycles += delta_cycles
+            yield cycles, address, kind, value
+        rest = data[end:]
+    if rest:
+        raise ValueError("Truncated IO log: %i Bytes rest" % len(rest))
+
+
+class MemoryHooks(object):
+    """
+    Base class: Hook into the paths of memory accesses with
+    callbacks/middlewares, by overwriting the memory methods on the instance.
+    """
+    def __init__(self, memory):
+        self.memory = memory
+        self.cpu = memory.cpu
+        self._read_byte_hooked = memory._read_byte_hooked
+        self._read_word_hooked = memory._read_word_hooked
+        self._write_byte_hooked = memory._write_byte_hooked
+        self._write_word_hooked = memory._write_word_hooked
+        memory._read_byte_hooked = self.read_byte_hooked
+        memory._read_word_hooked = self.read_word_hooked
+        memory._write_byte_hooked = self.write_byte_hooked
+        memory._write_word_hooked = self.write_word_hooked
+
+    def uninstall(self):
+        for name in ("_read_byte_hooked", "_read_word_hooked", "_write_byte_hooked", "_write_word_hooked"):
+            delattr(self.memory, name)
+
+    def is_hooked_byte_read(self, address):
+        memory = self.memory
+        return (
+            memory._read_byte_callbacks.get(address) is not None
+            or memory._read_byte_middleware.get(address) is not None
+        )
+
+    def is_hooked_byte_write(self, address):
+        memory = self.memory
+        return (
+            memory._write_byte_callbacks.get(address) is not None
+            or memory._write_byte_middleware.get(address) is not None
+        )
+
+    def is_hooked_word_write(self, address):
+        memory = self.memory
+        return (
+            memory._write_word_callbacks.get(address) is not None
+            or memory._write_word_middleware.get(address) is not None
+        )
+
+
+class IORecorder(MemoryHooks):
+    """
+    Record every read/write with a callback or middleware into 'fileobj'
+    """
+    def __init__(self, memory, fileobj):
+        super(IORecorder, self).__init__(memory)
+        self.fileobj = fileobj
+        self.last_cycles = self.cpu.cycles
+        self.fileobj.write(HEADER.pack(IO_LOG_MAGIC, IO_LOG_VERSION))
+
+    def record(self, address, kind, value):
+        cycles = self.cpu.cycles
+        self.fileobj.write(RECORD.pack(cycles - self.last_cycles, address, kind, value))
+        self.last_cycles = cycles
+
+    def read_byte_hooked(self, address):
+        value = self._read_byte_hooked(address)
+        if self.is_hooked_byte_read(address):
+            self.record(address, READ_BYTE, value)
+        return value
+
+    def read_word_hooked(self, address):
+        if self.memory._read_word_callbacks.get(address) is None:
+            # Will be read via read_byte()
+            return self._read_word_hooked(address)
+        value = self._read_word_hooked(address)
+        self.record(address, READ_WORD, value)
+        return value
+
+    def write_byte_hooked(self, address, value):
+        if self.is_hooked_byte_write(address):
+            self.record(address, WRITE_BYTE, value)
+        return self._write_byte_hooked(address, value)
+
+    def write_word_hooked(self, address, word):
+        if self.is_hooked_word_write(address):
+            self.record(address, WRITE_WORD, word)
+        return self._write_word_hooked(address, word)
+
+    def close(self):
+        self.uninstall()
+        self.fileobj.flush()
+
+
+class IOReplayer(MemoryHooks):
+    """
+    Replace the values of hooked reads with the recorded values.
+    No callbacks/middlewares will be called: A hooked write goes to the
+    device in the recorded run, so it's dropped here. With only a middleware
+    the unchanged value is stored directly into RAM.
+
+    verify_writes -- raise RuntimeError if a hooked write doesn't match the record
+    """
+    def __init__(self, memory, fileobj, verify_writes=False):
+        super(IOReplayer, self).__init__(memory)
+        self.verify_writes = verify_writes
+        self.records = iter_records(fileobj)
+
+    def next_record(self, address, kind, value=None):
+        """
+        returns the recorded value for the next access
+        """
+        for record in self.records:
+            record_cycles, record_address, record_kind, record_value = record
+            if not self.verify_writes and record_kind in (WRITE_BYTE, WRITE_WORD):
+                continue
+            if record_address != address or record_kind != kind or record_cycles != self.cpu.cycles:
+                raise RuntimeError(
+                    "Replay diverged at cycle %i: %s $%04x != recorded %s $%04x at cycle %i" % (
+                        self.cpu.cycles, KIND_NAMES[kind], address,
+                        KIND_NAMES[record_kind], record_address, record_cycles
+                    )
+                )
+            if value is not None and value != record_value:
+                raise RuntimeError("Replay diverged at cycle %i: %s $%04x value $%x != recorded $%x" % (
+                    self.cpu.cycles, KIND_NAMES[kind], address, value, record_value
+                ))
+            return record_value
+        raise RuntimeError("Replay log ends at cycle %i: %s $%04x" % (
+            self.cpu.cycles, KIND_NAMES[kind], address
+        ))
+
+    def read_byte_hooked(self, address):
+        if self.is_hooked_byte_read(address):
+            return self.next_record(address, READ_BYTE)
+        return self._read_byte_hooked(address)
+
+    def read_word_hooked(self, address):
+        if self.memory._read_word_callbacks.get(address) is None:
+            return self._read_word_hooked(address)
+        return self.next_record(address, READ_WORD)
+
+    def write_byte_hooked(self, address, value):
+        if not self.is_hooked_byte_write(address):
+            return self._write_byte_hooked(address, value)
+        if self.verify_writes:
+            self.next_record(address, WRITE_BYTE, value)
+        if self.memory._write_byte_callbacks.get(address) is None:
+            # Only a middleware: store the unchanged value
+            self.memory._store_byte(address, value)
+
+    def write_word_hooked(self, address, word):
+        if not self.is_hooked_word_write(address):
+            return self._write_word_hooked(address, word)
+        if self.verify_writes:
+            self.next_record(address, WRITE_WORD, word)
+        if self.memory._write_word_callbacks.get(address) is None:
+            # Only a middleware: store the unchanged word as two bytes, like Memory
+            self.memory.write_byte(address, word >> 8)
+            self.memory.write_byte(address + 1, word & 0xff)
+
+    def close(self):
+        self.uninstall()
@@ -18,7 +18,11 @@ class BaseMemoryInfo(object):
     def __init__(self, out_func):
         self.out_func = out_func
 
-    def get_shortest(self, addr):
+    def get_shortest_area(self, addr):
+        """
+        Returns the (start, end, txt) tuple of the smallest area that
+        contains the address or None.
+        """
         shortest = None
         size = sys.maxsize
         for start, end, txt in self.MEM_INFO:
@@ -29,7 +33,10 @@ class BaseMemoryInfo(object):
             if current_size < size:
                 size = current_size
                 shortest = start, end, txt
+        return shortest
 
+    def get_shortest(self, addr):
+        shortest = self.get_shortest_area(addr)
         if shortest is None:
             return "$%x: UNKNOWN" % addr
 
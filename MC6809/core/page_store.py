@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# encoding:utf8
+
+"""
+    MC6809 - 6809 CPU emulator in Python
+    =======================================
+
+    Content-addressed page store
+
+    Store many machine states, that differ only in a few bytes: The
+    memory is split into 256 Bytes pages and every unique page is stored
+    only one time (with a reference count). A stored state is only a
+    vector of 256 page IDs plus a register snapshot.
+
+    If 'max_pages' is set, the least recently used pages will be moved
+    into a swap file and loaded back on demand.
+
+    e.g.:
+
+        store = PageStore(max_pages=10000)
+        state = store.save(cpu)
+        ...
+        store.restore(cpu, state)
+        store.release(state)
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import array
+import collections
+import hashlib
+import logging
+import tempfile
+
+
+log = logging.getLogger("MC6809")
+
+
+PAGE_SIZE = 0x100
+
+# Page IDs are stored as unsigned 16-Bit values
+PAGE_ID_TYPECODE = "H"
+MAX_PAGE_ID = 0xffff
+
+
+class StoredState(object):
+    """
+    pages -- array of 16-Bit page IDs, one per 256 Bytes memory page
+    registers -- register snapshot, see: SnapshotMixin.save_register_snapshot()
+    """
+    __slots__ = ("pages", "registers")
+
+    def __init__(self, pages, registers):
+        self.pages = pages
+        self.registers = registers
+
+    def __repr__(self):
+        return "<StoredState %i pages, %i Bytes registers>" % (
+            len(self.pages), len(self.registers)
+        )
+
+
+class PageStore(object):
+    def __init__(self, max_pages=None, swap_file=None):
+        """
+        max_pages -- max. number of pages hold in RAM, None: unlimited
+        swap_file -- binary file object for evicted pages (default: a temp file)
+        """
+        self.max_pages = max_pages
+        self._swap_file = swap_file
+
+        self._next_page_id = 0
+        self._free_page_ids = [] # IDs of released pages, used again
+        self._page_ids = {} # page hash -> page ID
+        self._page_hashes = {} # page ID -> page hash
+        self._refcounts = {} # page ID -> reference count
+
+        # page ID -> page data in least recently used order:
+        self._pages = collections.OrderedDict()
+
+        self._swap_slots = {} # page ID -> slot number in swap file
+        self._free_swap_slots = []
+        self._swap_slot_count = 0
+
+    def __len__(self):
+        """ number of stored unique pages """
+        return len(self._refcounts)
+
+    @property
+    def pages_in_memory(self):
+        return len(self._pages)
+
+    @property
+    def pages_swapped(self):
+        return len(self._swap_slots)
+
+    #---------------------------------------------------------------------------
+
+    def add_page(self, data):
+        """
+        Store one page and returns the page ID.
+        Every call increments the reference count.
+        """
+        page_hash = hashlib.sha1(data).digest()
+        try:
+            page_id = self._page_ids[page_hash]
+        except KeyError:
+            if self._free_page_ids:
+                page_id = self._free_page_ids.pop()
+            elif self._next_page_id > MAX_PAGE_ID:
+                raise RuntimeError("Page store is full: max. %i unique pages" % (MAX_PAGE_ID + 1))
+            else:
+                page_id = self._next_page_id
+                self._next_page_id += 1
+            self._page_ids[page_hash] = page_id
+            self._page_hashes[page_id] = page_hash
+            self._refcounts[page_id] = 1
+            self._pages[page_id] = bytes(data)
+            if self.max_pages is not None and len(self._pages) > self.max_pages:
+                self._evict()
+        else:
+            self._refcounts[page_id] += 1
+        return page_id
+
+    def get_page(self, page_id):
+        try:
+            data = self._pages.pop(page_id)
+        except KeyError:
+            data = self._swap_in(page_id)
+        self._pages[page_id] = data # most recently used
+        return data
+
+    def release_page(self, page_id):
+        """ Decrement the reference count and remove unused pages """
+        refcount = self._refcounts[page_id] - 1
+        if refcount:
+            self._refcounts[page_id] = refcount
+            return
+
+        del self._refcounts[page_id]
+        del self._page_ids[self._page_hashes.pop(page_id)]
+        if self._pages.pop(page_id, None) is None:
+            self._free_swap_slots.append(self._swap_slots.pop(page_id))
+        self._free_page_ids.append(page_id)
+
+    #---------------------------------------------------------------------------
+
+    def _get_swap_file(self):
+        if self._swap_file is None:
+            self._swap_file = tempfile.TemporaryFile(prefix="MC6809_pages_")
+        return self._swap_file
+
+    def _evict(self):
+        """ Move the least recently used pages into the swap file """
+        swap_file = self._get_swap_file()
+        while len(self._pages) > self.max_pages:
+            page_id, data = self._pages.popitem(last=False)
+            if self._free_swap_slots:
+                slot = self._free_swap_slots.pop()
+            else:
+                slot = self._swap_slot_count
+                self._swap_slot_count += 1
+            swap_file.seek(slot * PAGE_SIZE)
+            swap_file.write(data)
+            self._swap_slots[page_id] = slot
+
+    def _swap_in(self, page_id):
+        slot = self._swap_slots.pop(page_id)
+        self._free_swap_slots.append(slot)
+        swap_file = self._get_swap_file()
+        swap_file.seek(slot * PAGE_SIZE)
+        data = swap_file.read(PAGE_SIZE)
+        if self.max_pages is not None and len(self._pages) >= self.max_pages:
+            self.max_pages -= 1 # make room for the loaded page
+            try:
+                self._evict()
+            finally:
+                self.max_pages += 1
+        return data
+
+    #---------------------------------------------------------------------------
+
+    def save(self, cpu):
+        """ returns the state of the CPU and the memory as a StoredState """
+        image = cpu.memory.get_image()
+        add_page = self.add_page
+        pages = array.array(PAGE_ID_TYPECODE, [
+            add_page(image[start:start + PAGE_SIZE])
+            for start in range(0, len(image), PAGE_SIZE)
+        ])
+        return StoredState(pages, cpu.save_register_snapshot())
+
+    def restore(self, cpu, state):
+        get_page = self.get_page
+        cpu.memory.set_image(b"".join([get_page(page_id) for page_id in state.pages]))
+        cpu.load_register_snapshot(state.registers)
+
+    def release(self, state):
+        """ The state will not be used anymore: release all pages """
+        for page_id in state.pages:
+            self.release_page(page_id)
+        state.pages = array.array(PAGE_ID_TYPECODE)
+
+    def close(self):
+        if self._swap_file is not None:
+            self._swap_file.close()
+            self._swap_file = None
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the IRQ/FIRQ/NMI interrupt lines
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import unittest
+
+from MC6809.tests.test_base import BaseCPUTestCase
+
+
+log = logging.getLogger("MC6809")
+
+
+MAIN_LOOP = [
+    0x4C, #       loop INCA
+    0x20, 0xFD, #      BRA loop
+]
+
+HANDLER = [
+    0x5C, #             INCB
+    0x7C, 0x01, 0x00, # INC $0100 ; count the interrupts
+    0xF7, 0xFF, 0x80, # STB $FF80 ; acknowledge the interrupt
+    0x3B, #             RTI
+]
+
+
+class InterruptTestCase(BaseCPUTestCase):
+    def setUp(self):
+        super(InterruptTestCase, self).setUp()
+        memory = self.cpu.memory
+        memory.load(0x4000, MAIN_LOOP)
+        memory.load(0x5000, HANDLER)
+        for vector in (self.cpu.IRQ_VECTOR, self.cpu.FIRQ_VECTOR, self.cpu.NMI_VECTOR):
+            memory.load(vector, [0x50, 0x00])
+        memory.add_write_byte_callback(self.acknowledge, 0xff80)
+
+        self.cpu.program_counter.set(0x4000)
+        self.cpu.system_stack_pointer.set(0x6000)
+        self.cpu.user_stack_pointer.set(0x1234)
+        self.cpu.index_x.set(0x2345)
+        self.cpu.index_y.set(0x3456)
+        self.cpu.direct_page.set(0x12)
+        self.cpu.accu_a.set(0x01)
+        self.cpu.accu_b.set(0x02)
+        self.cpu.set_cc(0x00)
+        self.acknowledged = 0
+
+    def acknowledge(self, cycles, last_op_address, address, value):
+        self.acknowledged += 1
+        self.cpu.clear_irq()
+        self.cpu.clear_firq()
+
+    def stack_bytes(self, count):
+        start = self.cpu.system_stack_pointer.value
+        return list(self.cpu.memory._mem[start:start + count])
+
+    def test_irq_frame(self):
+        self.cpu.assert_irq()
+        self.assertTrue(self.cpu.check_interrupts())
+        self.assertEqualHex(self.cpu.system_stack_pointer.value, 0x6000 - 12)
+        self.assertHexList(self.stack_bytes(12), [
+            0x80, # CC with E set
+            0x01, 0x02, 0x12, # A, B, DP
+            0x23, 0x45, 0x34, 0x56, 0x12, 0x34, # X, Y, U
+            0x40, 0x00, # PC
+        ])
+        self.assertEqualHex(self.cpu.program_counter.value, 0x5000)
+        self.assertEqual((self.cpu.E, self.cpu.F, self.cpu.I), (1, 0, 1))
+
+        # IRQ is still asserted, but masked now:
+        self.assertFalse(self.cpu.check_interrupts())
+
+    def test_firq_frame(self):
+        self.cpu.E = 1
+        self.cpu.assert_firq()
+        self.cpu.assert_irq()
+        self.assertTrue(self.cpu.check_interrupts())
+        self.assertEqualHex(self.cpu.system_stack_pointer.value, 0x6000 - 3)
+        self.assertHexList(self.stack_bytes(3), [
+            0x00, # CC with E cleared
+            0x40, 0x00, # PC
+        ])
+        self.assertEqual((self.cpu.E, self.cpu.F, self.cpu.I), (0, 1, 1))
+
+        self.cpu.test_run(0x5000, 0x4000) # handler -> RTI
+        self.assertEqual(self.acknowledged, 1)
+        self.assertEqualHex(self.cpu.system_stack_pointer.value, 0x6000)
+        self.assertEqualHex(self.cpu.accu_b.value, 0x03)
+
+    def test_nmi(self):
+        self.cpu.set_cc(0xff) # IRQ and FIRQ masked
+        self.cpu.trigger_nmi()
+        self.assertTrue(self.cpu.check_interrupts())
+        self.assertEqualHex(self.cpu.system_stack_pointer.value, 0x6000 - 12)
+        self.assertEqual(self.cpu.interrupt_lines, 0)
+        self.assertFalse(self.cpu.check_interrupts())
+
+    def test_unmask_with_andcc(self):
+        self.cpu.memory.load(0x4100, [
+            0x1C, 0xEF, # ANDCC #$EF
+        ])
+        self.cpu.set_cc(0x10) # IRQ masked
+        self.cpu.assert_irq()
+        self.cpu.test_run(0x4100, 0x5000)
+        self.assertHexList(self.stack_bytes(12)[-2:], [0x41, 0x02]) # PC after ANDCC
+
+    def test_rti_reenters(self):
+        # The line is level-triggered: RTI services it again
+        self.cpu.memory.load(0x5000, [0x3B]) # RTI without acknowledge
+        self.cpu.assert_irq()
+        self.cpu.check_interrupts()
+        self.cpu.get_and_call_next_op()
+        self.assertEqualHex(self.cpu.program_counter.value, 0x5000)
+        self.assertEqualHex(self.cpu.system_stack_pointer.value, 0x6000 - 12)
+
+    def test_burst_run(self):
+        self.cpu.add_sync_callback(1000, lambda cycles: self.cpu.assert_irq())
+        self.cpu.outer_burst_op_count = 10
+        self.cpu.burst_run()
+        self.assertEqual(self.acknowledged, self.cpu.cycles // 1000)
+        self.assertEqual(self.cpu.memory._mem[0x0100], self.acknowledged)
+        self.assertEqualHex(self.cpu.accu_b.value, 0x02) # restored by RTI
+        self.assertEqualHex(self.cpu.system_stack_pointer.value, 0x6000)
+
+
+class WaitStateTestCase(InterruptTestCase):
+    def setUp(self):
+        super(WaitStateTestCase, self).setUp()
+        self.ack_cycles = []
+
+    def acknowledge(self, cycles, last_op_address, address, value):
+        self.ack_cycles.append(cycles)
+        super(WaitStateTestCase, self).acknowledge(cycles, last_op_address, address, value)
+
+    def load_main(self, wait_op):
+        self.cpu.memory.load(0x4000, wait_op + [
+            0x4C, #            INCA
+            0x20, 0xFE, # done BRA done
+        ])
+        return 0x4000 + len(wait_op)
+
+    def test_cwai(self):
+        after_cwai = self.load_main([0x3C, 0xEF]) # CWAI #$EF -> enable IRQ
+        self.cpu.set_cc(0x50) # IRQ and FIRQ masked
+        self.cpu.add_cycle_event(10000, lambda cycles: self.cpu.assert_irq())
+        self.cpu.burst_run()
+
+        self.assertEqual(len(self.ack_cycles), 1)
+        self.assertGreater(self.ack_cycles[0], 10000)
+        self.assertLess(self.ack_cycles[0], 10000 + 30)
+        self.assertEqual(self.cpu.waiting, None)
+        # RTI has restored the entire state:
+        self.assertEqualHex(self.cpu.system_stack_pointer.value, 0x6000)
+        self.assertEqualHex(self.cpu.accu_a.value, 0x02)
+        self.assertEqualHex(self.cpu.accu_b.value, 0x02)
+        self.assertEqualHex(self.cpu.get_cc_value() & 0xd0, 0xc0) # E, F set, I cleared by CWAI
+        self.assertEqualHex(self.cpu.program_counter.value, after_cwai + 1)
+
+    def test_cwai_firq(self):
+        self.load_main([0x3C, 0xAF]) # CWAI #$AF -> enable IRQ and FIRQ
+        self.cpu.add_cycle_event(1000, lambda cycles: self.cpu.assert_firq())
+        self.cpu.test_run(0x4000, 0x5000)
+
+        # FIRQ enters with the entire state, stacked by CWAI:
+        self.assertEqualHex(self.cpu.system_stack_pointer.value, 0x6000 - 12)
+        self.assertEqualHex(self.stack_bytes(1)[0], 0x80) # stacked CC with E set
+        self.assertEqual((self.cpu.F, self.cpu.I), (1, 1))
+        self.assertGreaterEqual(self.cpu.cycles, 1000)
+
+    def test_sync(self):
+        after_sync = self.load_main([0x13]) # SYNC
+        self.cpu.add_cycle_event(5000, lambda cycles: self.cpu.assert_irq())
+        self.cpu.test_run(0x4000, 0x5000)
+        self.assertEqualHex(self.cpu.system_stack_pointer.value, 0x6000 - 12)
+        self.assertHexList(self.stack_bytes(12)[-2:], [after_sync >> 8, after_sync & 0xff])
+        self.assertEqual(self.cpu.cycles, 5000 + 1 + 12 + 2) # + IRQ frame and vector
+
+    def test_sync_masked(self):
+        after_sync = self.load_main([0x13]) # SYNC
+        self.cpu.set_cc(0x50) # IRQ and FIRQ masked
+        self.cpu.add_cycle_event(5000, lambda cycles: self.cpu.assert_irq())
+        self.cpu.test_run(0x4000, after_sync)
+        self.assertEqual(self.cpu.waiting, None)
+        self.assertEqual(self.cpu.cycles, 5000)
+        self.assertEqualHex(self.cpu.system_stack_pointer.value, 0x6000) # not serviced
+
+    def test_wait_without_event(self):
+        self.load_main([0x13]) # SYNC
+        self.assertRaises(RuntimeError, self.cpu.test_run, 0x4000, 0x5000)
+
+        # A burst ends, the CPU is still waiting:
+        self.cpu.burst_run()
+        self.assertEqual(self.cpu.waiting, 1)
+        self.assertEqualHex(self.cpu.accu_a.value, 0x01)
+        self.cpu.assert_irq()
+        self.cpu.burst_run()
+        self.assertEqual(self.cpu.waiting, None)
+        self.assertEqual(self.acknowledged, 1)
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""
+    MC6809 unittests
+    ~~~~~~~~~~~~~~~~
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import random
+import unittest
+
+from MC6809.utils.address_ranges import AddressRangeMap, PAGE_EMPTY, PAGE_FULL, PAGE_MIXED
+from MC6809.tests.test_base import BaseCPUTestCase
+
+
+class TestAddressRangeMap(unittest.TestCase):
+    def assertSameAsDict(self, range_map, reference):
+        for address in range(0x10000):
+            self.assertEqual(range_map.get(address), reference.get(address),
+                "$%04x: %r != %r" % (address, range_map.get(address), reference.get(address))
+            )
+        self.assertEqual(len(range_map), len(reference))
+        self.assertEqual(sorted(range_map), sorted(reference))
+
+    def test_random_against_dict(self):
+        rnd = random.Random(6809)
+        range_map = AddressRangeMap()
+        reference = {}
+        for no in range(200):
+            start = rnd.randint(0, 0xffff)
+            end = min(start + rnd.choice((0, 1, 0xff, 0x100, 0x1000)), 0xffff)
+            value = rnd.choice("abc") # merge neighbours with the same value
+            range_map.add(value, start, end)
+            for address in range(start, end + 1):
+                reference[address] = value
+        self.assertSameAsDict(range_map, reference)
+
+        # no overlapping intervals:
+        last_end = -1
+        for start, end, value in range_map.iter_ranges():
+            self.assertGreater(start, last_end)
+            self.assertLessEqual(start, end)
+            last_end = end
+
+    def test_page_states(self):
+        range_map = AddressRangeMap()
+        range_map.add("a", 0x1000, 0x1fff)
+        range_map.add("b", 0x1180)
+        self.assertEqual(range_map.pages[0x0f], PAGE_EMPTY)
+        self.assertEqual(range_map.pages[0x10], PAGE_FULL)
+        self.assertEqual(range_map.pages[0x11], PAGE_MIXED)
+        self.assertEqual(range_map.pages[0x1f], PAGE_FULL)
+        self.assertEqual(range_map.pages[0x20], PAGE_EMPTY)
+
+        range_map.add("a", 0x1180)
+        self.assertEqual(range_map.pages[0x11], PAGE_FULL)
+        self.assertEqual(list(range_map.iter_ranges()), [(0x1000, 0x1fff, "a")])
+
+    def test_getitem(self):
+        range_map = AddressRangeMap()
+        range_map.add("a", 0x8000, 0xffff)
+        self.assertEqual(range_map[0xffff], "a")
+        self.assertRaises(KeyError, range_map.__getitem__, 0x7fff)
+        self.assertIn(0x8000, range_map)
+        self.assertNotIn(0x7fff, range_map)
+        self.assertTrue(range_map)
+        self.assertFalse(AddressRangeMap())
+
+
+class TestMemoryRangeCallbacks(BaseCPUTestCase):
+    def test_wide_range(self):
+        def read_callback(cycles, last_op_address, address):
+            return address & 0xff
+
+        memory = self.cpu.memory
+        memory.add_read_byte_callback(read_callback, 0x0000, 0x7fff)
+        self.assertEqual(len(list(memory._read_byte_callbacks.iter_ranges())), 1)
+        self.assertEqualHex(memory.read_byte(0x1234), 0x34)
+        self.assertEqualHex(memory.read_byte(0x7fff), 0xff)
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
@@ -97,10 +97,11 @@ class BaseCPUTestCase(BaseTestCase):
         "max_ops":None,
         "use_bus":False,
     }
+    CPU_CLASS = CPU
     def setUp(self):
         cfg = TestCfg(self.UNITTEST_CFG_DICT)
         memory = Memory(cfg)
-        self.cpu = CPU(memory, cfg)
+        self.cpu = self.CPU_CLASS(memory, cfg)
 
     def cpu_test_run(self, start, end, mem):
         for cell in mem:
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the process pool batch runner
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import unittest
+
+from MC6809.core.batch_runner import BatchJob, BatchMachine, BatchRunner, ProcessPoolExecutor, \
+    STOP_CYCLES, STOP_PC, STOP_WAIT
+from MC6809.tests.test_config import TestCfg
+
+
+SUM_PROGRAM = [
+    0x4F, #             CLRA
+    0xE6, 0x80, # loop  LDB ,X+    ; sum the bytes from X until a $00
+    0x27, 0x07, #       BEQ end
+    0xAB, 0x1F, #       ADDA -1,X
+    0xBB, 0x80, 0x00, # ADDA $8000 ; + value from ROM
+    0x20, 0xF5, #       BRA loop
+    0xA7, 0x84, # end   STA ,X
+]
+
+
+def sum_job(data, job_id=None):
+    return BatchJob(SUM_PROGRAM, 0x4000, stop_pc=0x4000 + len(SUM_PROGRAM),
+        registers={"X": 0x5000}, data=[(0x5000, data)], regions=[(0x5000, 0x5000 + len(data))],
+        job_id=job_id,
+    )
+
+
+class BatchMachineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.machine = BatchMachine(TestCfg, roms=[(0x8000, [0x02])])
+
+    def test_run(self):
+        result = self.machine.run(sum_job([1, 2, 3, 0]))
+        self.assertEqual(result.stop_reason, STOP_PC)
+        self.assertEqual(result.registers["A"], 1 + 2 + 3 + 3 * 2)
+        self.assertEqual(result.registers["X"], 0x5004)
+        self.assertEqual(result.regions, {(0x5000, 0x5004): b"\x01\x02\x03\x00\x0c"})
+        self.assertEqual(result.ops, 1 + 3 * 5 + 2 + 1)
+
+    def test_memory_reset_between_jobs(self):
+        self.machine.run(sum_job([1, 2, 3, 4, 0]))
+        result = self.machine.run(sum_job([5, 0]))
+        self.assertEqual(result.regions, {(0x5000, 0x5002): b"\x05\x00\x07"})
+        self.assertEqual(self.machine.cpu.memory._mem[0x5005], 0x00)
+
+    def test_cycle_budget(self):
+        result = self.machine.run(BatchJob([0x20, 0xfe], 0x4000, max_cycles=100)) # BRA *
+        self.assertEqual(result.stop_reason, STOP_CYCLES)
+        self.assertGreaterEqual(result.cycles, 100)
+        self.assertLess(result.cycles, 105)
+
+    def test_wait_for_interrupt(self):
+        result = self.machine.run(BatchJob([0x13, 0x12], 0x4000, stop_pc=0x4002)) # SYNC, NOP
+        self.assertEqual(result.stop_reason, STOP_WAIT)
+        self.assertEqual(result.registers["PC"], 0x4001)
+        self.assertEqual(result.ops, 1)
+
+        # The next job doesn't start in the wait state:
+        result = self.machine.run(BatchJob([0x12, 0x12], 0x4000, stop_pc=0x4002)) # NOP, NOP
+        self.assertEqual(result.stop_reason, STOP_PC)
+
+    def test_job_needs_a_stop_condition(self):
+        self.assertRaises(ValueError, BatchJob, [0x12], 0x4000)
+
+
+@unittest.skipIf(ProcessPoolExecutor is None, "Batch runner needs Python 3.7 or newer")
+class BatchRunnerTestCase(unittest.TestCase):
+    def test_process_pool(self):
+        jobs = [sum_job([i, i, 0], job_id=i) for i in range(1, 20)]
+        with BatchRunner(TestCfg, roms=[(0x8000, [0x01])], max_workers=2) as runner:
+            results = list(runner.map(jobs))
+            future = runner.submit(sum_job([0x10, 0]))
+            self.assertEqual(future.result().registers["A"], 0x10 + 0x01)
+
+        self.assertEqual([result.job_id for result in results], list(range(1, 20)))
+        for i, result in enumerate(results, 1):
+            self.assertEqual(result.registers["A"], (i + 1) * 2)
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
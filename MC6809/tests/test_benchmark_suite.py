@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the benchmark suite
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import tempfile
+import unittest
+
+from MC6809.components.MC6809data.MC6809_data_utils import MC6809OP_DATA_DICT
+from MC6809.components.cpu6809 import CPUBlockCache
+from MC6809.core.benchmark_suite import BenchmarkSuite, MicroWorkload, NOT_MICRO_BENCHMARKED, \
+    Workload, iter_micro_workloads, run_benchmark_suite
+
+
+class BenchmarkSuiteTestCase(unittest.TestCase):
+    def test_all_ops_generated(self):
+        workloads = list(iter_micro_workloads(repeat=1))
+        expected = [
+            opcode for opcode, op_data in MC6809OP_DATA_DICT.items()
+            if op_data["mnemonic"] not in NOT_MICRO_BENCHMARKED
+        ]
+        self.assertEqual(len(workloads), len(expected))
+
+    def test_run_all_workloads(self):
+        suite = BenchmarkSuite()
+        suite.add_default_workloads(micro_repeat=2)
+        results = suite.run(runs=1)
+        for result in results["workloads"]:
+            self.assertGreater(result["ops"], 0, result["name"])
+            self.assertGreater(result["cycles"], 0, result["name"])
+        self.assertIn("ADD8", results["families"])
+        self.assertIn("macro", results["families"])
+
+    def test_micro_workload(self):
+        suite = BenchmarkSuite()
+        suite.add(MicroWorkload("NOP", "NOP", [0x12], repeat=10))
+        results = suite.run(runs=2)
+        result = results["workloads"][0]
+        self.assertEqual(result["ops"], 10)
+        self.assertEqual(result["cycles"], 10 * 3) # fetch + 2 cycles
+        self.assertEqual(result["runs"], 2)
+        self.assertEqual(results["families"]["NOP"]["workloads"], 1)
+
+    def test_abstract_workload(self):
+        self.assertRaises(TypeError, Workload, "name", "family")
+
+    def test_block_cache_op_count(self):
+        # The block cache CPU runs a whole block per get_and_call_next_op()
+        suite = BenchmarkSuite(CPUBlockCache)
+        suite.add(MicroWorkload("NOP", "NOP", [0x12], repeat=10))
+        result = suite.run(runs=1)["workloads"][0]
+        self.assertEqual(result["ops"], 10)
+
+    def test_filter_and_json(self):
+        fd, filename = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            run_benchmark_suite(runs=1, pattern="ADD8", json_filename=filename, verbose=False)
+            with open(filename) as f:
+                results = json.load(f)
+        finally:
+            os.remove(filename)
+        self.assertEqual(list(results["families"]), ["ADD8"])
+        self.assertEqual(len(results["workloads"]), 8) # ADDA/ADDB with 4 addressing modes
+        self.assertEqual(results["info"]["runs"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
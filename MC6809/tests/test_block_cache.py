@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the basic block translation cache
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import unittest
+
+from MC6809.components.cpu6809 import CPU, CPUBlockCache
+from MC6809.components.memory import Memory
+from MC6809.tests import test_6809_address_modes, test_6809_branch_instructions, \
+    test_6809_program, test_6809_register_changes, test_6809_StoreLoad
+from MC6809.tests.test_base import BaseCPUTestCase
+from MC6809.tests.test_config import TestCfg
+
+
+log = logging.getLogger("MC6809")
+
+
+LOOP_PROGRAM = [
+    0x8E, 0x50, 0x00, #       LDX #$5000
+    0xC6, 0x10, #             LDB #$10
+    0xA6, 0x80, #       loop  LDA ,X+
+    0xAB, 0x01, #             ADDA 1,X
+    0xA7, 0x84, #             STA ,X
+    0x5A, #                   DECB
+    0x26, 0xF7, #             BNE loop
+    0x10, 0xAE, 0x89, 0xF0, 0x00, # LDY -$1000,X
+]
+
+
+class TestBlockCache(BaseCPUTestCase):
+    CPU_CLASS = CPUBlockCache
+
+    def test_compare_with_interpreter(self):
+        cfg = TestCfg(self.UNITTEST_CFG_DICT)
+        cpu = CPU(Memory(cfg), cfg)
+        for cpu in (cpu, self.cpu):
+            cpu.memory.load(0x5000, range(0x20))
+            cpu.memory.load(0x4000, LOOP_PROGRAM)
+            cpu.cycles = 0
+            cpu.test_run(0x4000, 0x4000 + len(LOOP_PROGRAM))
+
+        self.assertEqual(self.cpu.get_state(), cpu.get_state())
+        self.assertIn(0x4005, self.cpu.block_cache)
+        self.assertIsNotNone(self.cpu.block_cache[0x4005])
+
+    def test_self_modifying_code(self):
+        self.cpu_test_run(start=0x4000, end=None, mem=[
+            0x86, 0x01, #       LDA #$01
+            0xB7, 0x40, 0x06, # STA $4006 ; change operand of next op
+            0xC6, 0x00, #       LDB #$00 -> LDB #$01
+        ])
+        self.assertEqualHex(self.cpu.accu_b.value, 0x01)
+
+    def test_reload_code(self):
+        self.cpu_test_run(start=0x4000, end=None, mem=[
+            0x86, 0x12, # LDA #$12
+        ])
+        self.assertEqualHex(self.cpu.accu_a.value, 0x12)
+        self.cpu_test_run(start=0x4000, end=None, mem=[
+            0x86, 0x34, # LDA #$34
+        ])
+        self.assertEqualHex(self.cpu.accu_a.value, 0x34)
+
+    def test_hooked_code_not_translated(self):
+        def read_callback(cycles, last_op_address, address):
+            return {0x4000: 0x86, 0x4001: 0x12}[address] # LDA #$12
+        self.cpu.memory.add_read_byte_callback(read_callback, 0x4000, 0x4001)
+        self.cpu.test_run(0x4000, 0x4002)
+        self.assertEqualHex(self.cpu.accu_a.value, 0x12)
+        self.assertIsNone(self.cpu.block_cache[0x4000])
+
+
+# Run existing tests with the block cache:
+
+class TestBlockCache_Program(test_6809_program.Test6809_Program):
+    CPU_CLASS = CPUBlockCache
+
+
+class TestBlockCache_BranchInstructions(test_6809_branch_instructions.Test6809_BranchInstructions):
+    CPU_CLASS = CPUBlockCache
+
+
+class TestBlockCache_AddressModes(test_6809_address_modes.Test6809_AddressModes_Indexed):
+    CPU_CLASS = CPUBlockCache
+
+
+class TestBlockCache_TFR(test_6809_register_changes.Test6809_TFR):
+    CPU_CLASS = CPUBlockCache
+
+
+class TestBlockCache_Store(test_6809_StoreLoad.Test6809_Store):
+    CPU_CLASS = CPUBlockCache
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
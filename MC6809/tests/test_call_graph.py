@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the call graph profiler
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import unittest
+
+from MC6809.components.cpu6809 import CPUBlockCache, CPUDecodeCache, change_cpu
+from MC6809.components.mc6809_sampling_profiler import SymbolTable
+from MC6809.tests.test_base import BaseCPUTestCase
+
+
+log = logging.getLogger("MC6809")
+
+
+MAIN = [
+    0x8D, 0x0E, #        main BSR sub1
+    0x20, 0xFC, #             BRA main
+]
+SUB1 = [
+    0x8D, 0x0E, #        sub1 BSR sub2
+    0x86, 0x03, #             LDA #$03
+    0x39, #                   RTS
+]
+SUB2 = [
+    0x12, #              sub2 NOP
+    0x39, #                   RTS
+]
+
+
+class CallGraphTestCase(BaseCPUTestCase):
+    def setUp(self):
+        super(CallGraphTestCase, self).setUp()
+        memory = self.cpu.memory
+        memory.load(0x4000, MAIN)
+        memory.load(0x4010, SUB1)
+        memory.load(0x4020, SUB2)
+        self.cpu.program_counter.set(0x4000)
+        self.cpu.system_stack_pointer.set(0x6000)
+        self.cpu.set_cc(0x50) # IRQ and FIRQ masked
+        self.cpu.outer_burst_op_count = 10 # 1000 ops
+        self.profiler = self.cpu.enable_call_graph_profiler()
+
+    def tearDown(self):
+        self.cpu.disable_call_graph_profiler()
+        super(CallGraphTestCase, self).tearDown()
+
+    def test_cycles(self):
+        self.cpu.test_run(0x4000, 0x4002) # one call of sub1
+        functions = self.profiler.functions
+        self.assertEqual(sorted(functions), [0x4010, 0x4020])
+
+        calls, inclusive, exclusive = functions[0x4020]
+        # NOP: 2 + 1 fetch cycles, RTS: 5 + 1 fetch + 2 pull cycles
+        self.assertEqual((calls, inclusive, exclusive), (1, 3 + 8, 3 + 8))
+
+        calls, inclusive, exclusive = functions[0x4010]
+        self.assertEqual(calls, 1)
+        self.assertEqual(inclusive, exclusive + functions[0x4020][1])
+        # Only the BSR in main isn't in sub1:
+        bsr_cycles = self.cpu.cycles - inclusive
+        self.assertEqual(exclusive, bsr_cycles + 4 + 8) # BSR + LDA #$03 + RTS
+
+        self.assertEqual(self.profiler.edges, {
+            None: {0x4010: [1, functions[0x4010][1]]},
+            0x4010: {0x4020: [1, functions[0x4020][1]]},
+        })
+
+    def test_burst_run(self):
+        self.cpu.burst_run()
+        self.cpu.disable_call_graph_profiler() # ends the open frames
+        functions = self.profiler.functions
+        self.assertGreater(functions[0x4010][0], 100)
+        self.assertIn(functions[0x4020][0] - functions[0x4010][0], (0, 1))
+        self.assertEqual(self.profiler.frames, [])
+
+    def test_skipped_rts(self):
+        self.cpu.memory.load(0x4010, [
+            0x32, 0x62, # sub1 LEAS 2,S ; drop the return address
+            0x20, 0xEC, #      BRA main
+        ])
+        self.cpu.burst_run()
+        self.assertLessEqual(len(self.profiler.frames), 1)
+        calls = self.profiler.functions[0x4010][0]
+        self.assertGreater(calls, 100)
+        self.assertEqual(self.profiler.edges[None][0x4010][0], calls)
+
+    def test_interrupt(self):
+        self.cpu.memory.load(0x5000, [
+            0x12, # NOP
+            0x3B, # RTI
+        ])
+        self.cpu.memory.load(self.cpu.IRQ_VECTOR, [0x50, 0x00])
+        self.cpu.set_cc(0x00)
+
+        def irq(cycles):
+            self.cpu.assert_irq()
+            self.cpu.add_cycle_event(10, lambda cycles: self.cpu.clear_irq())
+        self.cpu.add_sync_callback(1000, irq)
+
+        self.cpu.burst_run()
+        calls, inclusive, exclusive = self.profiler.functions[0x5000]
+        self.assertEqual(calls, self.cpu.cycles // 1000)
+        self.assertEqual(inclusive, exclusive)
+        self.assertLessEqual(len(self.profiler.frames), 3) # sub1, sub2, IRQ handler
+
+    def test_report(self):
+        self.profiler.symbol_table = SymbolTable({0x4000: "MAIN", 0x4010: "SUB1", 0x4020: "SUB2"})
+        self.cpu.test_run(0x4000, 0x4002)
+        report = self.profiler.get_report()
+        self.assertEqual([entry["name"] for entry in report], ["SUB1", "SUB2"])
+        self.assertEqual(report[0]["callers"], [
+            {"caller": "<root>", "calls": 1, "inclusive": report[0]["inclusive"]}
+        ])
+        self.assertEqual(report[0]["callees"], [
+            {"callee": "SUB2", "calls": 1, "inclusive": report[1]["inclusive"]}
+        ])
+        report = self.profiler.get_report(key="exclusive")
+        self.assertEqual(report[0]["entry"], "$4010")
+
+    def test_disable(self):
+        profiler = self.cpu.disable_call_graph_profiler()
+        self.assertIs(profiler, self.profiler)
+        self.assertNotIn("_service_interrupt", self.cpu.__dict__)
+        self.assertEqual(self.cpu.op_funcs[0x39].__name__, "inherent")
+        self.cpu.burst_run()
+        self.assertEqual(profiler.functions, {})
+
+    def test_with_sampling_profiler(self):
+        self.cpu.enable_sampling_profiler()
+        self.assertRaises(RuntimeError, self.cpu.disable_call_graph_profiler)
+        self.assertIn("_service_interrupt", self.cpu.__dict__)
+
+        # Disable in reverse order:
+        self.cpu.disable_sampling_profiler()
+        self.cpu.disable_call_graph_profiler()
+        self.assertNotIn("_service_interrupt", self.cpu.__dict__)
+        self.assertEqual(self.cpu.op_funcs[0x39].__name__, "inherent")
+
+    def test_cache_cpus(self):
+        for cpu_class in (CPUBlockCache, CPUDecodeCache):
+            cpu = change_cpu(self.cpu, cpu_class)
+            self.assertRaises(RuntimeError, cpu.enable_call_graph_profiler)
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
@@ -18,6 +18,7 @@ PY2 = sys.version_info[0] == 2
 if PY2:
     range = xrange
 
+from MC6809.components import mc6809_cc_register as cc
 from MC6809.tests.test_base import BaseCPUTestCase
 from MC6809.utils.byte_word_values import signed8
 
@@ -126,6 +127,60 @@ class CCTestCase(BaseCPUTestCase):
         self.assertEqual(self.cpu.V, 0)
 
 
+class FlagTablesTestCase(BaseCPUTestCase):
+    """
+    The precomputed tables must match the eager bit tests.
+    """
+    def eager_flags(self, clear_func, update_func, *args):
+        self.cpu.set_cc(0x00)
+        clear_func()
+        update_func(*args)
+        return self.cpu.get_cc_value()
+
+    def test_add8(self):
+        cpu = self.cpu
+        for carry in (0, 1):
+            for a in range(0x100):
+                for b in range(0, 0x100, 3):
+                    self.assertEqual(
+                        cc.ADD8_TABLE[carry << 16 | a << 8 | b],
+                        self.eager_flags(cpu.clear_HNZVC, cpu.update_HNZVC_8, a, b, a + b + carry)
+                    )
+
+    def test_sub8(self):
+        cpu = self.cpu
+        for carry in (0, 1):
+            for a in range(0x100):
+                for b in range(0, 0x100, 3):
+                    self.assertEqual(
+                        cc.SUB8_TABLE[carry << 16 | a << 8 | b],
+                        self.eager_flags(cpu.clear_NZVC, cpu.update_NZVC_8, a, b, a - b - carry)
+                    )
+
+    def test_8bit_tables(self):
+        cpu = self.cpu
+        for a in range(0x100):
+            self.assertEqual(cc.NZ8_TABLE[a], self.eager_flags(cpu.clear_NZ, cpu.update_NZ_8, a))
+            self.assertEqual(cc.LSL8_TABLE[a],
+                self.eager_flags(cpu.clear_NZVC, cpu.update_NZVC_8, a, a, a << 1)
+            )
+            self.assertEqual(cc.INC8_TABLE[a] & ~cc.CC_V, cc.NZ8_TABLE[(a + 1) & 0xff])
+            self.assertEqual(cc.DEC8_TABLE[a] & ~cc.CC_V, cc.NZ8_TABLE[(a - 1) & 0xff])
+            for carry in (0, 1):
+                self.assertEqual(cc.ROR8_TABLE[carry << 8 | a],
+                    cc.NZ8_TABLE[a >> 1 | carry << 7] | a & 1
+                )
+        self.assertEqual(cc.INC8_TABLE[0x7f], cc.CC_N | cc.CC_V)
+        self.assertEqual(cc.DEC8_TABLE[0x80], cc.CC_V)
+
+    def test_assign(self):
+        self.cpu.set_cc(0xff)
+        self.cpu.assign_NZVC(cc.CC_Z | cc.CC_C)
+        self.assertEqual(self.cpu.get_cc_info(), "EFHI.Z.C")
+        self.cpu.assign_HNZVC(cc.CC_N)
+        self.assertEqual(self.cpu.get_cc_info(), "EF.IN...")
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
 
@@ -660,6 +660,36 @@ class Test6809_Code(BaseCPUTestCase):
         self.assertEqualHex(self.cpu.get_cc_value(), 0x33)
 
 
+class Test6809_DispatchTables(BaseCPUTestCase):
+    def test_tables_match_opcode_dict(self):
+        for opcode, (cycles, func) in self.cpu.opcode_dict.items():
+            if opcode > 0xff:
+                funcs, cycles_array = self.cpu.paged_dispatch_tables[opcode >> 8]
+            else:
+                funcs, cycles_array = self.cpu.op_funcs, self.cpu.op_cycles
+            self.assertEqual(funcs[opcode & 0xff], func)
+            self.assertEqual(cycles_array[opcode & 0xff], cycles)
+
+    def test_paged_op_cycles(self):
+        self.cpu.cycles = 0
+        self.cpu_test_run(start=0x4000, end=None, mem=[
+            0x10, 0x8E, 0x12, 0x34, # LDY #$1234
+        ])
+        self.assertEqualHex(self.cpu.index_y.value, 0x1234)
+        # 4 fetched bytes + 1 cycle for page op + 4 cycles for LDY
+        self.assertEqual(self.cpu.cycles, 9)
+        self.assertEqualHex(self.cpu.last_op_address, 0x4000)
+
+    def test_unknown_op(self):
+        self.cpu.memory.load(0x4000, [0x01]) # $01 is not a 6809 op
+        self.cpu.program_counter.set(0x4000)
+        self.assertRaises(SystemExit, self.cpu.get_and_call_next_op)
+
+    def test_unknown_paged_op(self):
+        self.cpu.memory.load(0x4000, [0x10, 0x00]) # $1000 is not a 6809 op
+        self.cpu.program_counter.set(0x4000)
+        self.assertRaises(SystemExit, self.cpu.get_and_call_next_op)
+
 
 class TestSimple6809ROM(BaseCPUTestCase):
     """
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the pre-decoded instruction cache
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import unittest
+
+from MC6809.components.cpu6809 import CPU, CPUDecodeCache
+from MC6809.components.memory import Memory
+from MC6809.tests import test_6809_address_modes, test_6809_arithmetic, \
+    test_6809_program, test_6809_register_changes, test_6809_StoreLoad
+from MC6809.tests.test_base import BaseCPUTestCase
+from MC6809.tests.test_block_cache import LOOP_PROGRAM
+from MC6809.tests.test_config import TestCfg
+
+
+log = logging.getLogger("MC6809")
+
+
+class TestDecodeCache(BaseCPUTestCase):
+    CPU_CLASS = CPUDecodeCache
+
+    def test_compare_with_interpreter(self):
+        cfg = TestCfg(self.UNITTEST_CFG_DICT)
+        cpu = CPU(Memory(cfg), cfg)
+        for cpu in (cpu, self.cpu):
+            cpu.memory.load(0x5000, range(0x20))
+            cpu.memory.load(0x4000, LOOP_PROGRAM)
+            cpu.cycles = 0
+            cpu.test_run(0x4000, 0x4000 + len(LOOP_PROGRAM))
+
+        self.assertEqual(self.cpu.get_state(), cpu.get_state())
+
+    def test_decoded_record(self):
+        self.cpu.memory.load(0x4000, LOOP_PROGRAM)
+        self.cpu.test_run(0x4000, 0x4000 + len(LOOP_PROGRAM))
+
+        record = self.cpu.decode_cache[0x4007] # ADDA 1,X
+        self.assertEqual(record.mnemonic, "ADDA")
+        self.assertEqual(record.length, 2)
+        self.assertIs(record.register, self.cpu.accu_a)
+        self.assertIs(record.index_register, self.cpu.index_x)
+        self.assertEqual(record.index_offset, 1)
+
+        record = self.cpu.decode_cache[0x400e] # LDY -$1000,X
+        self.assertEqual(record.opcode, 0x10ae)
+        self.assertEqual(record.length, 5)
+        self.assertEqual(record.index_mode, 0x9)
+        self.assertEqual(record.index_offset, -0x1000)
+        self.assertFalse(hasattr(record, "__dict__"))
+
+    def test_self_modifying_code(self):
+        self.cpu_test_run(start=0x4000, end=None, mem=[
+            0x86, 0x01, #       LDA #$01
+            0xB7, 0x40, 0x06, # STA $4006 ; change operand of next op
+            0xC6, 0x00, #       LDB #$00 -> LDB #$01
+        ])
+        self.assertEqualHex(self.cpu.accu_b.value, 0x01)
+        self.assertEqualHex(self.cpu.decode_cache[0x4005].operand, 0x01)
+
+    def test_invalidate(self):
+        self.cpu_test_run(start=0x4000, end=None, mem=[
+            0x10, 0x8E, 0x12, 0x34, # LDY #$1234
+            0x12, #                   NOP
+        ])
+        self.assertEqual(sorted(self.cpu.decode_cache), [0x4000, 0x4004])
+        self.cpu.memory.write_byte(0x4003, 0x56)
+        self.assertEqual(sorted(self.cpu.decode_cache), [0x4004])
+
+    def test_not_decodable(self):
+        reads = []
+        def read_callback(cycles, last_op_address, address):
+            reads.append(address)
+            return 0x12 # NOP
+        self.cpu.memory.add_read_byte_callback(read_callback, 0x5000)
+        self.cpu.memory.load(0x5001, [0x12])
+        self.cpu.test_run(0x5000, 0x5002)
+        self.assertIs(self.cpu.decode_cache[0x5000], None) # hooked page
+        self.cpu.test_run(0x5000, 0x5002)
+        self.assertEqual(reads, [0x5000, 0x5000])
+
+        # The marker is dropped on code writes, like decoded ops:
+        self.cpu.memory.load(0x5001, [0x12])
+        self.assertNotIn(0x5000, self.cpu.decode_cache)
+
+
+# Run existing tests with the decode cache:
+
+class TestDecodeCache_Program(test_6809_program.Test6809_Program):
+    CPU_CLASS = CPUDecodeCache
+
+
+class TestDecodeCache_Arithmetic(test_6809_arithmetic.Test6809_Arithmetic):
+    CPU_CLASS = CPUDecodeCache
+
+
+class TestDecodeCache_AddressModes(test_6809_address_modes.Test6809_AddressModes_Indexed):
+    CPU_CLASS = CPUDecodeCache
+
+
+class TestDecodeCache_EXG(test_6809_register_changes.Test6809_EXG):
+    CPU_CLASS = CPUDecodeCache
+
+
+class TestDecodeCache_Load(test_6809_StoreLoad.Test6809_Load):
+    CPU_CLASS = CPUDecodeCache
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
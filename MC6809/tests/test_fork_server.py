@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the fork server
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import os
+import unittest
+
+from MC6809.components.memory import Memory
+from MC6809.core.fork_server import ForkServer
+from MC6809.tests.test_base import BaseCPUTestCase
+
+
+log = logging.getLogger("MC6809")
+
+
+def add_job(cpu, value):
+    """ ADDA the value to the booted accu A and store it """
+    if value is None:
+        raise ValueError("No value!")
+    cpu.memory.load(0x4000, [
+        0x8B, value, #      ADDA #value
+        0xB7, 0x50, 0x00, # STA $5000
+    ])
+    cpu.test_run(0x4000, 0x4005)
+    return cpu.memory._mem[0x5000], cpu.memory._mem[0x5001], os.getpid()
+
+
+class ForkServerTestCase(BaseCPUTestCase):
+    USE_FORK = True
+
+    def setUp(self):
+        super(ForkServerTestCase, self).setUp()
+        if self.USE_FORK and not hasattr(os, "fork"):
+            raise unittest.SkipTest("os.fork() not available")
+        # "boot" the machine:
+        self.cpu_test_run(start=0x4000, end=None, mem=[
+            0x86, 0x10, #       LDA #$10
+            0xC6, 0x20, #       LDB #$20
+            0xF7, 0x50, 0x01, # STB $5001
+        ])
+        self.server = ForkServer(self.cpu, add_job, pool_size=2, use_fork=self.USE_FORK)
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_map(self):
+        results = self.server.map(range(5))
+        self.assertEqual([result[:2] for result in results], [
+            (0x10, 0x20), (0x11, 0x20), (0x12, 0x20), (0x13, 0x20), (0x14, 0x20),
+        ])
+        pids = set([result[2] for result in results])
+        if self.USE_FORK:
+            self.assertEqual(len(pids), 5)
+            self.assertNotIn(os.getpid(), pids)
+        else:
+            self.assertEqual(pids, set([os.getpid()]))
+
+        # the booted machine is unchanged:
+        self.assertEqualHex(self.cpu.accu_a.value, 0x10)
+        self.assertEqualHex(self.cpu.memory._mem[0x5000], 0x00)
+
+    def test_run(self):
+        self.assertEqual(self.server.run(0x05)[:2], (0x15, 0x20))
+
+    def test_error(self):
+        error = RuntimeError if self.USE_FORK else ValueError
+        self.assertRaises(error, self.server.run, None)
+        self.assertEqual(self.server.run(0x01)[:2], (0x11, 0x20))
+
+    def test_failed_job_reaps_children(self):
+        pids = [child.pid for child in self.server._children]
+        self.assertEqual(len(pids), 2)
+        self.assertRaises(RuntimeError, self.server.map, [None, 0x01])
+        for pid in pids:
+            # Both children are closed and waited for:
+            self.assertRaises(OSError, os.waitpid, pid, os.WNOHANG)
+
+        self.assertEqual(self.server.run(0x01)[:2], (0x11, 0x20))
+
+    def test_sibling_pipes_closed(self):
+        servers = [] # The copy from the fork() time in the children
+
+        def open_sibling_fds(cpu, job_input):
+            fds = []
+            for server in servers:
+                for child in server._children + server._running:
+                    for fd in (child.job_fd, child.result_fd):
+                        try:
+                            os.fstat(fd)
+                        except OSError:
+                            continue
+                        fds.append(fd)
+            return fds
+
+        with ForkServer(self.cpu, open_sibling_fds, pool_size=2) as server:
+            servers.append(server)
+            # The 3rd and 4th job run in children forked while the 2nd job is running:
+            self.assertEqual(server.map(range(6)), [[]] * 6)
+
+    def test_callbacks(self):
+        self.cpu.memory.add_read_byte_callback(lambda *args: 0x42, 0x6000)
+        self.cpu.add_cycle_event(1000, lambda cycles: None)
+        with ForkServer(self.cpu, add_job, pool_size=1) as server:
+            self.assertEqual(server.run(0x01)[:2], (0x11, 0x20))
+
+
+class CloneServerTestCase(ForkServerTestCase):
+    USE_FORK = False
+
+    def test_failed_job_reaps_children(self):
+        pass # no children
+
+    def test_sibling_pipes_closed(self):
+        pass # no children
+
+    def test_callbacks(self):
+        self.cpu.memory.add_read_byte_callback(lambda *args: 0x42, 0x6000)
+        self.assertRaises(ValueError, ForkServer, self.cpu, add_job, use_fork=False)
+
+        cpu = self.new_cpu()
+        cpu.add_cycle_event(1000, lambda cycles: None)
+        self.assertRaises(ValueError, ForkServer, cpu, add_job, use_fork=False)
+
+    def new_cpu(self):
+        cfg = self.cpu.cfg
+        return self.cpu.__class__(Memory(cfg), cfg)
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
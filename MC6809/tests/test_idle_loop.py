@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the idle loop detection
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import time
+import unittest
+
+from MC6809.components.cpu6809 import CPUSpeedLimit
+from MC6809.components.memory import Memory
+from MC6809.tests.test_base import BaseCPUTestCase
+
+
+log = logging.getLogger("MC6809")
+
+
+WAIT_FLAG_PROGRAM = [
+    0xB6, 0x01, 0x00, # loop LDA $0100 ; wait for the flag
+    0x27, 0xFB, #            BEQ loop
+    0x5C, #             done INCB
+    0x20, 0xFD, #            BRA done
+]
+
+
+class IdleLoopTestCase(BaseCPUTestCase):
+    def setUp(self):
+        super(IdleLoopTestCase, self).setUp()
+        self.call_cycles = []
+
+    def new_cpu(self, program, idle_loop_detection, status_addresses=()):
+        cfg = self.cpu.cfg
+        cpu = self.CPU_CLASS(Memory(cfg), cfg)
+        cpu.memory.load(0x4000, program)
+        cpu.program_counter.set(0x4000)
+        if idle_loop_detection:
+            cpu.enable_idle_loop_detection(status_addresses)
+        return cpu
+
+    def set_flag(self, cpu):
+        def callback(cycles):
+            self.call_cycles.append(cpu.cycles)
+            cpu.memory._mem[0x0100] = 1
+        return callback
+
+    def run_cpu(self, cpu, outer_burst_op_count=1000):
+        cpu.outer_burst_op_count = outer_burst_op_count
+        cpu.burst_run()
+
+    def test_same_result(self):
+        states = []
+        for idle_loop_detection in (False, True):
+            cpu = self.new_cpu(WAIT_FLAG_PROGRAM, idle_loop_detection)
+            cpu.add_cycle_event(100003, self.set_flag(cpu))
+            self.run_cpu(cpu, outer_burst_op_count=300)
+            states.append(cpu.get_state())
+
+        self.assertEqual(states[0], states[1])
+        self.assertEqual(self.call_cycles[0], self.call_cycles[1])
+        self.assertGreater(cpu.idle_loop_detector.idle_cycles, 80000)
+        self.assertGreater(cpu.accu_b.value, 0)
+
+    def test_no_deadline(self):
+        cpu = self.new_cpu([0x20, 0xFE], True) # BRA *
+        self.run_cpu(cpu)
+        self.assertEqual(cpu.cycles, 1000 * 100 * 5)
+        self.assertGreater(cpu.idle_loop_detector.idle_ops, 1000 * 100 * 0.9)
+
+    def test_writes_memory(self):
+        cpu = self.new_cpu([
+            0x7F, 0x01, 0x00, # loop CLR $0100
+            0x20, 0xFB, #            BRA loop
+        ], True)
+        self.run_cpu(cpu, outer_burst_op_count=100)
+        self.assertEqual(cpu.idle_loop_detector.idle_cycles, 0)
+        self.assertGreater(cpu.idle_loop_detector.backoff, 1) # probes are rarer
+
+    def test_changes_registers(self):
+        cpu = self.new_cpu([
+            0x4C, #       loop INCA
+            0x20, 0xFD, #      BRA loop
+        ], True)
+        self.run_cpu(cpu, outer_burst_op_count=100)
+        self.assertEqual(cpu.idle_loop_detector.idle_cycles, 0)
+
+    def test_status_address(self):
+        program = [
+            0xB6, 0xFF, 0x00, # loop LDA $FF00
+            0x27, 0xFB, #            BEQ loop
+        ]
+        status_calls = []
+        def read_status(cycles, last_op_address, address):
+            status_calls.append(cycles)
+            return 0
+
+        cpu = self.new_cpu(program, True)
+        cpu.memory.add_read_byte_callback(read_status, 0xff00)
+        self.run_cpu(cpu, outer_burst_op_count=100)
+        self.assertEqual(cpu.idle_loop_detector.idle_cycles, 0)
+        self.assertEqual(len(status_calls), 100 * 100 // 2)
+
+        cpu = self.new_cpu(program, True, status_addresses=[0xff00])
+        cpu.memory.add_read_byte_callback(read_status, 0xff00)
+        self.run_cpu(cpu, outer_burst_op_count=100)
+        self.assertGreater(cpu.idle_loop_detector.idle_cycles, 0)
+
+        # All page tables are restored after the probes:
+        self.assertEqual(cpu.memory._read_byte_pages[0x01], 0)
+        self.assertNotIn("_read_byte_hooked", cpu.memory.__dict__)
+
+    def test_interrupt(self):
+        cpu = self.new_cpu([0x20, 0xFE], True) # BRA *
+        cpu.memory.load(0x5000, [0x20, 0xFE]) # IRQ handler: BRA *
+        cpu.memory.load(cpu.IRQ_VECTOR, [0x50, 0x00])
+        cpu.system_stack_pointer.set(0x6000)
+        cpu.add_cycle_event(50000, lambda cycles: cpu.assert_irq())
+        self.run_cpu(cpu)
+        self.assertEqualHex(cpu.program_counter.value, 0x5000)
+        self.assertEqualHex(cpu.system_stack_pointer.value, 0x6000 - 12)
+
+
+class SpeedLimitIdleLoopTestCase(BaseCPUTestCase):
+    CPU_CLASS = CPUSpeedLimit
+
+    def test_sleep(self):
+        self.cpu.memory.load(0x4000, [0x20, 0xFE]) # BRA *
+        self.cpu.program_counter.set(0x4000)
+        self.cpu.enable_idle_loop_detection()
+        self.cpu.outer_burst_op_count = 100
+
+        start_time = time.time()
+        self.cpu.delayed_burst_run(target_cycles_per_sec=1000000)
+        duration = time.time() - start_time
+
+        # 10000 ops * 5 cycles in real time are 0.05 sec:
+        self.assertEqual(self.cpu.cycles, 100 * 100 * 5)
+        self.assertGreater(duration, 0.04)
+        self.assertGreater(self.cpu.idle_loop_detector.idle_cycles, 0)
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test record/replay of hooked memory I/O
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import io
+import logging
+import random
+import unittest
+
+from MC6809.components.memory import Memory
+from MC6809.core.io_replay import (
+    HEADER, IO_LOG_MAGIC, RECORD_V1, IORecorder, IOReplayer, iter_records, READ_BYTE, READ_WORD, WRITE_BYTE
+)
+from MC6809.tests.test_base import BaseCPUTestCase
+
+
+log = logging.getLogger("MC6809")
+
+
+IO_PROGRAM = [
+    0x8E, 0x50, 0x00, # LDX #$5000
+    0xB6, 0xFF, 0x00, # loop LDA $FF00  ; read "device" byte
+    0xFC, 0xFF, 0x10, #      LDD $FF10  ; read "device" word
+    0xA7, 0x80, #            STA ,X+
+    0xB7, 0xFF, 0x20, #      STA $FF20  ; write to "device"
+    0x8C, 0x50, 0x20, #      CMPX #$5020
+    0x26, 0xF0, #            BNE loop
+]
+IO_PROGRAM_END = 0x4000 + len(IO_PROGRAM)
+
+
+class IOReplayTestCase(BaseCPUTestCase):
+    def setUp(self):
+        super(IOReplayTestCase, self).setUp()
+        self.writes = []
+        self.random = random.Random(1234)
+
+    def add_devices(self, memory, read_byte, read_word, write_byte):
+        memory.add_read_byte_callback(read_byte, 0xff00)
+        memory.add_read_word_callback(read_word, 0xff10)
+        memory.add_write_byte_callback(write_byte, 0xff20)
+
+    def random_byte(self, cycles, last_op_address, address):
+        return self.random.randint(0, 0xff)
+
+    def random_word(self, cycles, last_op_address, address):
+        return self.random.randint(0, 0xffff)
+
+    def device_called(self, cycles, last_op_address, address):
+        self.fail("Device called at $%04x" % address)
+
+    def device_written(self, cycles, last_op_address, address, value):
+        self.fail("Device written at $%04x" % address)
+
+    def write_byte(self, cycles, last_op_address, address, value):
+        self.writes.append(value)
+
+    def record(self):
+        self.add_devices(self.cpu.memory, self.random_byte, self.random_word, self.write_byte)
+        io_log = io.BytesIO()
+        recorder = IORecorder(self.cpu.memory, io_log)
+        self.cpu_test_run(start=0x4000, end=IO_PROGRAM_END, mem=IO_PROGRAM)
+        recorder.close()
+        io_log.seek(0)
+        return io_log
+
+    def new_cpu(self):
+        cfg = self.cpu.cfg
+        cpu = self.CPU_CLASS(Memory(cfg), cfg)
+        self.add_devices(cpu.memory, self.device_called, self.device_called, self.device_written)
+        return cpu
+
+    def test_records(self):
+        records = list(iter_records(self.record()))
+        self.assertEqual(len(records), 0x20 * 3)
+        self.assertEqual([record[1:3] for record in records[:3]], [
+            (0xff00, READ_BYTE), (0xff10, READ_WORD), (0xff20, WRITE_BYTE),
+        ])
+        cycles = [record[0] for record in records]
+        self.assertEqual(cycles, sorted(cycles))
+        self.assertLess(cycles[-1], self.cpu.cycles)
+
+    def test_replay(self):
+        io_log = self.record()
+        recorded_state = self.cpu.get_state()
+        recorded_ram = self.cpu.memory.get(0x5000, 0x5020)
+
+        cpu = self.new_cpu() # all device callbacks will fail
+        replayer = IOReplayer(cpu.memory, io_log, verify_writes=True)
+        cpu.memory.load(0x4000, IO_PROGRAM)
+        cpu.test_run(0x4000, IO_PROGRAM_END)
+        replayer.close()
+
+        self.assertEqual(cpu.get_state(), recorded_state)
+        self.assertEqual(cpu.memory.get(0x5000, 0x5020), recorded_ram)
+
+    def test_replay_write_middleware(self):
+        io_log = self.record()
+        cpu = self.new_cpu()
+        cpu.memory.add_write_byte_middleware(self.device_written, 0x5000, 0x501f)
+        replayer = IOReplayer(cpu.memory, io_log)
+        cpu.memory.load(0x4000, IO_PROGRAM)
+        cpu.test_run(0x4000, IO_PROGRAM_END)
+        replayer.close()
+
+        # STA ,X+ stored the recorded device bytes without the middleware:
+        self.assertEqual(cpu.memory.get(0x5000, 0x5020), self.cpu.memory.get(0x5000, 0x5020))
+
+    def test_verify_writes(self):
+        io_log = self.record()
+        cpu = self.new_cpu()
+        IOReplayer(cpu.memory, io_log, verify_writes=True)
+        cpu.memory.load(0x4000, IO_PROGRAM)
+        cpu.memory.load(0x400B, [0xB7, 0xFF, 0x21]) # STA $FF21 -> Write to other address
+        cpu.memory.add_write_byte_callback(self.write_byte, 0xff21)
+        self.assertRaises(RuntimeError, cpu.test_run, 0x4000, IO_PROGRAM_END)
+
+    def test_large_cycle_delta(self):
+        io_log = io.BytesIO()
+        recorder = IORecorder(self.cpu.memory, io_log)
+        recorder.record(0xff00, READ_BYTE, 0x12)
+        self.cpu.cycles += 2 ** 32 + 5
+        recorder.record(0xff00, READ_BYTE, 0x34)
+        recorder.close()
+        io_log.seek(0)
+        records = list(iter_records(io_log))
+        self.assertEqual(records[1][0] - records[0][0], 2 ** 32 + 5)
+
+    def test_version1(self):
+        io_log = io.BytesIO(
+            HEADER.pack(IO_LOG_MAGIC, 1)
+            + RECORD_V1.pack(10, 0xff00, READ_BYTE, 0x12)
+            + RECORD_V1.pack(5, 0xff10, READ_WORD, 0x3456)
+        )
+        self.assertEqual(list(iter_records(io_log)), [
+            (10, 0xff00, READ_BYTE, 0x12), (15, 0xff10, READ_WORD, 0x3456),
+        ])
+
+    def test_wrong_magic(self):
+        self.assertRaises(ValueError, list, iter_records(io.BytesIO(b"MC6809XX\x00\x01")))
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
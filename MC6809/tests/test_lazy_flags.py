@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the lazy condition code flags against the eager implementation.
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import random
+import unittest
+
+from MC6809.components.MC6809data.MC6809_data_utils import MC6809OP_DATA_DICT
+from MC6809.components.cpu6809 import CPU, CPULazyFlags
+from MC6809.components.memory import Memory
+from MC6809.tests import test_6809_arithmetic, test_6809_arithmetic_shift, \
+    test_6809_branch_instructions, test_6809_program, test_6809_register_changes, \
+    test_accumulators, test_condition_code_register
+from MC6809.tests.test_base import BaseCPUTestCase
+from MC6809.tests.test_config import TestCfg
+
+
+log = logging.getLogger("MC6809")
+
+
+# Ops that only change registers and the CC register:
+ALU_MNEMONICS = (
+    "ABX", "ADCA", "ADCB", "ADDA", "ADDB", "ADDD", "ANDA", "ANDB", "ANDCC",
+    "ASR", "ASRA", "ASRB", "BITA", "BITB", "CLRA", "CLRB", "CMPA", "CMPB",
+    "CMPD", "CMPS", "CMPU", "CMPX", "CMPY", "COMA", "COMB", "DAA", "DECA",
+    "DECB", "EORA", "EORB", "INCA", "INCB", "LDA", "LDB", "LDD", "LDX", "LDY",
+    "LSLA", "LSLB", "LSRA", "LSRB", "MUL", "NEGA", "NEGB", "ORA", "ORB", "ORCC",
+    "ROLA", "ROLB", "RORA", "RORB", "SBCA", "SBCB", "SEX", "SUBA", "SUBB",
+    "SUBD", "TSTA", "TSTB",
+)
+ALU_OPCODES = sorted([
+    opcode for opcode, op_data in MC6809OP_DATA_DICT.items()
+    if op_data["mnemonic"] in ALU_MNEMONICS
+    and op_data["addr_mode"] in ("INHERENT", "IMMEDIATE", "IMMEDIATE_WORD")
+])
+
+
+class TestLazyFlagsDifferential(BaseCPUTestCase):
+    """
+    Run random ALU op sequences on the eager and the lazy CPU and compare
+    the registers and the CC register after every op.
+    """
+    CPU_CLASS = CPULazyFlags
+
+    def setUp(self):
+        super(TestLazyFlagsDifferential, self).setUp()
+        cfg = TestCfg(self.UNITTEST_CFG_DICT)
+        self.eager_cpu = CPU(Memory(cfg), cfg)
+
+    def random_program(self, rnd, count):
+        program = []
+        for __ in range(count):
+            opcode = rnd.choice(ALU_OPCODES)
+            if opcode > 0xff:
+                program.append(opcode >> 8)
+            program.append(opcode & 0xff)
+            addr_mode = MC6809OP_DATA_DICT[opcode]["addr_mode"]
+            if addr_mode == "IMMEDIATE":
+                program.append(rnd.randint(0, 0xff))
+            elif addr_mode == "IMMEDIATE_WORD":
+                program += [rnd.randint(0, 0xff), rnd.randint(0, 0xff)]
+        return program
+
+    def assertSameState(self, lazy_cpu, eager_cpu, msg):
+        for cpu in (lazy_cpu, eager_cpu):
+            cpu.get_cc_value() # calculate all flags
+        lazy_state = lazy_cpu.get_state()
+        eager_state = eager_cpu.get_state()
+        del lazy_state["RAM"]
+        del eager_state["RAM"]
+        self.assertEqual(lazy_state, eager_state, msg)
+
+    def test_random_alu_ops(self):
+        rnd = random.Random(6809)
+        for no in range(20):
+            program = self.random_program(rnd, count=100)
+            cc = rnd.randint(0, 0xff)
+            for cpu in (self.cpu, self.eager_cpu):
+                cpu.memory.load(0x4000, program)
+                cpu.program_counter.set(0x4000)
+                cpu.set_cc(cc)
+
+            end = 0x4000 + len(program)
+            while self.eager_cpu.program_counter.value < end:
+                op_address = self.eager_cpu.program_counter.value
+                self.eager_cpu.get_and_call_next_op()
+                self.cpu.get_and_call_next_op()
+
+                # Read flags not after every op:
+                if rnd.randint(0, 3) == 0:
+                    op_data = MC6809OP_DATA_DICT[self.eager_cpu.memory._mem[op_address]]
+                    self.assertSameState(self.cpu, self.eager_cpu,
+                        "Program %i - after $%04x: %s" % (no, op_address, op_data["mnemonic"])
+                    )
+            self.assertSameState(self.cpu, self.eager_cpu, "Program %i" % no)
+
+    def test_pending_flags_pushed(self):
+        self.cpu.set_cc(0x00)
+        self.cpu_test_run(start=0x4000, end=None, mem=[
+            0x10, 0xCE, 0x10, 0x00, # LDS #$1000
+            0x86, 0x7f, # LDA #$7f
+            0x8B, 0x01, # ADDA #$01 ; H=1, N=1, V=1
+            0x34, 0x01, # PSHS CC
+            0x35, 0x02, # PULS A
+        ])
+        self.assertEqualHex(self.cpu.accu_a.value, 0x2a) # H=1, N=1, V=1
+
+
+# Run existing tests with the lazy flags:
+
+class TestLazyFlags_Accumulators(test_accumulators.CC_AccumulatorTestCase):
+    CPU_CLASS = CPULazyFlags
+
+
+class TestLazyFlags_Arithmetic(test_6809_arithmetic.Test6809_Arithmetic):
+    CPU_CLASS = CPULazyFlags
+
+
+class TestLazyFlags_LogicalShift(test_6809_arithmetic_shift.Test6809_LogicalShift):
+    CPU_CLASS = CPULazyFlags
+
+
+class TestLazyFlags_Rotate(test_6809_arithmetic_shift.Test6809_Rotate):
+    CPU_CLASS = CPULazyFlags
+
+
+class TestLazyFlags_BranchInstructions(test_6809_branch_instructions.Test6809_BranchInstructions):
+    CPU_CLASS = CPULazyFlags
+
+
+class TestLazyFlags_CCRegister(test_condition_code_register.CCTestCase):
+    CPU_CLASS = CPULazyFlags
+
+
+class TestLazyFlags_Program(test_6809_program.Test6809_Program):
+    CPU_CLASS = CPULazyFlags
+
+
+class TestLazyFlags_TFR(test_6809_register_changes.Test6809_TFR):
+    CPU_CLASS = CPULazyFlags
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
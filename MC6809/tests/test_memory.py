@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the memory and the page tables for the fast path
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import unittest
+
+from MC6809.components.memory import PAGE_CODE, PAGE_HOOKED, PAGE_RAM, PAGE_ROM, PAGE_TRACK
+from MC6809.tests.test_base import BaseCPUTestCase
+
+
+log = logging.getLogger("MC6809")
+
+
+class TestMemoryPageTables(BaseCPUTestCase):
+    def setUp(self):
+        super(TestMemoryPageTables, self).setUp()
+        self.memory = self.cpu.memory
+
+    def test_initial_pages(self):
+        self.assertEqual(self.memory._read_byte_pages[0x00], PAGE_RAM)
+        self.assertEqual(self.memory._write_byte_pages[0x7f], PAGE_RAM)
+        self.assertEqual(self.memory._write_byte_pages[0x80], PAGE_ROM)
+        self.assertEqual(self.memory._write_byte_pages[0xff], PAGE_ROM)
+
+        # a word at $7fff touches the ROM page $80
+        self.assertEqual(self.memory._write_word_pages[0x7e], PAGE_RAM)
+        self.assertEqual(self.memory._write_word_pages[0x7f], PAGE_ROM)
+
+    def test_plain_ram(self):
+        self.cpu.cycles = 0
+        self.memory.write_byte(0x1234, 0x56)
+        self.memory.write_word(0x2000, 0xabcd)
+        self.assertEqualHex(self.memory.read_byte(0x1234), 0x56)
+        self.assertEqualHex(self.memory.read_word(0x2000), 0xabcd)
+        self.assertEqualHex(self.memory.read_byte(0x2001), 0xcd)
+        self.assertEqual(self.cpu.cycles, 1 + 2 + 1 + 2 + 1)
+
+    def test_write_out_of_range(self):
+        self.assertRaises(OverflowError, self.memory.write_byte, 0x1000, 0x100)
+        self.assertRaises(OverflowError, self.memory.write_byte, 0x1000, -1)
+
+    def test_write_into_rom_ignored(self):
+        self.memory.load(0x8000, [0x12, 0x34])
+        self.memory.write_byte(0x8000, 0xff)
+        self.memory.write_word(0x7fff, 0xffff)
+        self.assertEqualHex(self.memory.read_byte(0x8000), 0x12)
+        self.assertEqualHex(self.memory.read_byte(0x7fff), 0xff)
+
+    def test_read_byte_callback(self):
+        def read_callback(cycles, last_op_address, address):
+            return 0x42
+
+        self.memory.add_read_byte_callback(read_callback, 0x1010, 0x1020)
+        self.assertEqual(self.memory._read_byte_pages[0x10], PAGE_HOOKED)
+        self.assertEqual(self.memory._read_word_pages[0x0f], PAGE_HOOKED)
+        self.assertEqual(self.memory._read_word_pages[0x10], PAGE_HOOKED)
+        self.assertEqual(self.memory._read_word_pages[0x11], PAGE_RAM)
+        self.assertEqual(self.memory._write_byte_pages[0x10], PAGE_RAM)
+
+        self.assertEqualHex(self.memory.read_byte(0x1010), 0x42)
+        self.assertEqualHex(self.memory.read_byte(0x1021), 0x00)
+        self.assertEqualHex(self.memory.read_word(0x100f), 0x0042)
+
+    def test_write_byte_middleware(self):
+        def write_middleware(cycles, last_op_address, address, value):
+            return value ^ 0xff
+
+        self.memory.add_write_byte_middleware(write_middleware, 0x2000)
+        self.assertEqual(self.memory._write_byte_pages[0x20], PAGE_HOOKED)
+        self.assertEqual(self.memory._write_word_pages[0x1f], PAGE_HOOKED)
+
+        self.memory.write_byte(0x2000, 0x0f)
+        self.memory.write_byte(0x2001, 0x0f)
+        self.assertEqualHex(self.memory.read_byte(0x2000), 0xf0)
+        self.assertEqualHex(self.memory.read_byte(0x2001), 0x0f)
+
+        self.memory.write_word(0x1fff, 0x1234)
+        self.assertEqualHex(self.memory.read_word(0x1fff), 0x12cb)
+
+
+class TestMemoryCodePages(BaseCPUTestCase):
+    def setUp(self):
+        super(TestMemoryCodePages, self).setUp()
+        self.memory = self.cpu.memory
+        self.memory.add_code_pages(0x40, 0x40)
+        self.written = []
+        self.memory.add_code_write_listener(
+            lambda start, end: self.written.append((start, end)),
+            0x4010, 0x401f
+        )
+
+    def test_code_pages(self):
+        self.assertEqual(self.memory._write_byte_pages[0x40], PAGE_CODE)
+        self.assertEqual(self.memory._write_word_pages[0x3f], PAGE_CODE)
+        self.assertEqual(self.memory._write_byte_pages[0x41], PAGE_RAM)
+        self.assertEqual(self.memory._read_byte_pages[0x40], PAGE_RAM)
+
+    def test_generation(self):
+        self.memory.write_byte(0x3fff, 0x01) # data page
+        self.memory.write_word(0x4100, 0x0102) # data page
+        self.assertEqual(self.memory.code_generation, 0)
+        self.memory.write_byte(0x4000, 0x01)
+        self.assertEqual(self.memory.code_generation, 1)
+        self.memory.write_word(0x3fff, 0x0102) # one byte in code page
+        self.assertEqual(self.memory.code_generation, 2)
+        self.memory.load(0x4080, [0x12, 0x12])
+        self.assertEqual(self.memory.code_generation, 3)
+        self.assertEqual(self.written, [])
+
+    def test_unchanged_write(self):
+        self.memory.write_byte(0x4000, 0x01)
+        self.assertEqual(self.memory.code_generation, 1)
+        self.memory.write_byte(0x4000, 0x01) # same value: code is unchanged
+        self.memory.write_word(0x3fff, 0x0001)
+        self.assertEqual(self.memory.code_generation, 1)
+
+    def test_listener_range(self):
+        self.memory.write_byte(0x400f, 0x01)
+        self.memory.write_word(0x401f, 0x0102)
+        self.memory.load(0x4000, [0x12] * 0x11)
+        self.assertEqual(self.written, [(0x401f, 0x401f), (0x4000, 0x4010)])
+        self.assertEqualHex(self.memory.read_word(0x401f), 0x0102)
+
+
+class TestMemoryDirtyPages(BaseCPUTestCase):
+    def setUp(self):
+        super(TestMemoryDirtyPages, self).setUp()
+        self.memory = self.cpu.memory
+        self.memory.start_dirty_tracking()
+
+    def get_dirty_pages(self):
+        return [page for page, dirty in enumerate(self.memory.get_dirty_pages()) if dirty]
+
+    def test_first_write_leaves_fast_path(self):
+        self.assertEqual(self.memory._write_byte_pages[0x20], PAGE_TRACK)
+        self.memory.write_byte(0x2010, 0x01)
+        self.assertEqual(self.memory._write_byte_pages[0x20], PAGE_RAM)
+        self.assertEqual(self.memory._write_word_pages[0x20], PAGE_TRACK) # $20ff+$2100
+        self.assertEqual(self.memory._write_word_pages[0x1f], PAGE_TRACK)
+        self.memory.write_byte(0x2011, 0x02)
+        self.assertEqual(self.get_dirty_pages(), [0x20])
+
+    def test_dirty_pages(self):
+        self.memory.write_word(0x10ff, 0x0102) # two pages
+        self.memory.load(0x3000, [0x12] * 0x101)
+        self.memory.write_byte(0x8000, 0x01) # ROM: ignored
+        self.assertEqual(self.get_dirty_pages(), [0x10, 0x11, 0x30, 0x31])
+
+        bitmap = self.memory.reset_dirty_pages()
+        self.assertEqual(bitmap[0x10], 1)
+        self.assertEqual(self.get_dirty_pages(), [])
+        self.assertEqual(self.memory._write_byte_pages[0x10], PAGE_TRACK)
+        self.assertEqual(self.memory._write_word_pages[0x10], PAGE_TRACK)
+
+        self.memory.write_word(0x1000, 0x0102)
+        self.assertEqual(self.get_dirty_pages(), [0x10])
+
+    def test_stop_tracking(self):
+        self.memory.stop_dirty_tracking()
+        self.assertEqual(self.memory._write_byte_pages[0x20], PAGE_RAM)
+        self.memory.write_byte(0x2010, 0x01)
+        self.assertEqual(self.get_dirty_pages(), [])
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the per opcode profiler
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import csv
+import io
+import json
+import logging
+import unittest
+
+from MC6809.components.cpu6809 import CPUBlockCache, CPUDecodeCache, change_cpu
+from MC6809.tests.test_base import BaseCPUTestCase
+
+
+log = logging.getLogger("MC6809")
+
+
+PROGRAM = [
+    0x10, 0x8E, 0x12, 0x34, # LDY #$1234
+    0x86, 0x05, #             LDA #$05
+    0x4A, #              loop DECA
+    0x26, 0xFD, #             BNE loop
+    0x12, #                   NOP
+]
+
+
+class OpProfilerTestCase(BaseCPUTestCase):
+    def setUp(self):
+        super(OpProfilerTestCase, self).setUp()
+        self.cpu.memory.load(0x4000, PROGRAM)
+        self.profiler = self.cpu.enable_op_profiler()
+
+    def tearDown(self):
+        self.cpu.disable_op_profiler()
+        super(OpProfilerTestCase, self).tearDown()
+
+    def run_program(self):
+        self.cpu.cycles = 0
+        self.cpu.test_run(0x4000, 0x4000 + len(PROGRAM))
+
+    def test_counts(self):
+        self.run_program()
+        self.assertEqual(self.profiler.counts[0x4a], 5) # DECA
+        self.assertEqual(self.profiler.counts[0x26], 5) # BNE
+        self.assertEqual(self.profiler.counts[0x108e], 1) # LDY
+        self.assertEqual(self.profiler.counts[0x10], 0) # PAGE prefix isn't wrapped
+        self.assertEqual(self.profiler.cycles[0x4a], 5 * (2 + 1)) # + opcode fetch
+        self.assertGreater(self.profiler.host_ns[0x4a], 0)
+
+        # All cycles are recorded:
+        self.assertEqual(sum(self.profiler.cycles), self.cpu.cycles)
+
+    def test_as_dict(self):
+        self.run_program()
+        data = self.profiler.as_dict()
+        self.assertEqual(sorted(data), ["BNE", "DECA", "LDA", "LDY", "NOP"])
+        self.assertEqual(data["DECA"]["INHERENT"]["count"], 5)
+        self.assertEqual(data["LDY"]["IMMEDIATE_WORD"]["opcode"], "$108e")
+
+    def test_export(self):
+        self.run_program()
+        f = io.StringIO()
+        self.profiler.export_json(f)
+        self.assertEqual(json.loads(f.getvalue()), self.profiler.as_dict())
+
+        f = io.StringIO()
+        self.profiler.export_csv(f)
+        f.seek(0)
+        rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(
+            dict((row["opcode"], int(row["count"])) for row in rows),
+            {"$108e": 1, "$86": 1, "$4a": 5, "$26": 5, "$12": 1}
+        )
+
+    def test_reset(self):
+        self.run_program()
+        self.profiler.reset()
+        self.assertEqual(self.profiler.get_stats(), [])
+
+    def test_disable(self):
+        profiler = self.cpu.disable_op_profiler()
+        self.assertIs(profiler, self.profiler)
+        origin_funcs = list(self.cpu.op_funcs)
+
+        self.cpu.enable_op_profiler()
+        self.assertNotEqual(self.cpu.op_funcs[0x4a], origin_funcs[0x4a])
+        self.cpu.disable_op_profiler()
+        self.assertEqual(self.cpu.op_funcs, origin_funcs)
+
+        self.run_program()
+        self.assertEqual(profiler.counts[0x4a], 0)
+
+    def test_out_of_order_uninstall(self):
+        origin_entry = self.profiler.installed_ops[0x12][0]
+        profiled_entry = self.cpu.opcode_dict[0x12]
+        cycles, func = profiled_entry
+        wrapped_entry = (cycles, lambda opcode: func(opcode)) # e.g. a other profiler
+        self.cpu.opcode_dict[0x12] = wrapped_entry
+        self.assertRaises(RuntimeError, self.cpu.disable_op_profiler)
+        self.assertIs(self.cpu.op_profiler, self.profiler)
+        self.assertIs(self.cpu.opcode_dict[0x12], wrapped_entry)
+
+        self.cpu.opcode_dict[0x12] = profiled_entry
+        self.assertIs(self.cpu.disable_op_profiler(), self.profiler)
+        self.assertIs(self.cpu.opcode_dict[0x12], origin_entry)
+
+    def test_cache_cpus(self):
+        for cpu_class in (CPUBlockCache, CPUDecodeCache):
+            cpu = change_cpu(self.cpu, cpu_class)
+            self.assertRaises(RuntimeError, cpu.enable_op_profiler)
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the content-addressed page store
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import unittest
+
+from MC6809.core.page_store import MAX_PAGE_ID, PageStore
+from MC6809.tests.test_base import BaseCPUTestCase
+
+
+log = logging.getLogger("MC6809")
+
+
+class PageStoreTestCase(BaseCPUTestCase):
+    def save_states(self, store, count):
+        states = []
+        expected = []
+        for value in range(count):
+            self.cpu.memory.write_byte(0x1000 + value * 0x100, value + 1)
+            self.cpu.accu_a.set(value)
+            states.append(store.save(self.cpu))
+            expected.append(self.cpu.get_state())
+        return states, expected
+
+    def test_deduplication(self):
+        store = PageStore()
+        states, expected = self.save_states(store, 4)
+        # a zero page + 4 changed pages:
+        self.assertEqual(len(store), 1 + 4)
+        self.assertEqual(len(states[0].pages), 0x100)
+
+        for state, expected_state in reversed(list(zip(states, expected))):
+            store.restore(self.cpu, state)
+            self.assertEqual(self.cpu.get_state(), expected_state)
+
+    def test_refcounts(self):
+        store = PageStore()
+        states, __ = self.save_states(store, 3)
+        store.release(states[0])
+        self.assertEqual(len(store), 1 + 3) # page $10 is changed in all states
+        store.release(states[2])
+        self.assertEqual(len(store), 1 + 2) # page $12 is only used in the last state
+        store.release(states[1])
+        self.assertEqual(len(store), 0)
+
+    def test_page_ids(self):
+        store = PageStore()
+        states, __ = self.save_states(store, 2)
+        self.assertEqual(states[0].pages.itemsize, 2)
+        page_id = states[1].pages[0x11]
+        store.release(states[1])
+        # The ID of the released page will be used again:
+        self.assertEqual(store.add_page(b"\x01" * 0x100), page_id)
+
+    def test_page_store_full(self):
+        store = PageStore()
+        store._next_page_id = MAX_PAGE_ID
+        store.add_page(b"\x00" * 0x100)
+        self.assertRaises(RuntimeError, store.add_page, b"\x01" * 0x100)
+
+    def test_swap_file(self):
+        store = PageStore(max_pages=3)
+        states, expected = self.save_states(store, 6)
+        self.assertEqual(len(store), 1 + 6)
+        self.assertEqual(store.pages_in_memory, 3)
+        self.assertEqual(store.pages_swapped, 4)
+
+        for state, expected_state in zip(states, expected):
+            store.restore(self.cpu, state)
+            self.assertEqual(self.cpu.get_state(), expected_state)
+        self.assertEqual(store.pages_in_memory, 3)
+
+        for state in states:
+            store.release(state)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.pages_swapped, 0)
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
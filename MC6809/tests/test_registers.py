@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the slotted register classes
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import unittest
+
+from MC6809.components.cpu6809 import CPUSlottedRegisters
+from MC6809.components.cpu_utils.MC6809_registers import SlottedRegister16Bit
+from MC6809.tests import test_6809_arithmetic, test_6809_program, \
+    test_6809_register_changes, test_accumulators
+from MC6809.tests.test_base import BaseCPUTestCase
+
+
+log = logging.getLogger("MC6809")
+
+
+class TestSlottedRegisters(BaseCPUTestCase):
+    CPU_CLASS = CPUSlottedRegisters
+
+    def test_accumulators_coherent(self):
+        cpu = self.cpu
+        cpu.accu_d.set(0x1234)
+        self.assertEqualHex(cpu.accu_a.value, 0x12)
+        self.assertEqualHex(cpu.accu_b.value, 0x34)
+
+        cpu.accu_a.set(0x100) # wrap around
+        self.assertEqualHex(cpu.accu_d.value, 0x0034)
+        cpu.accu_b.decrement(0x35)
+        self.assertEqualHex(cpu.accu_d.value, 0x00ff)
+        cpu.accu_a.increment()
+        self.assertEqualHex(cpu.accu_d.value, 0x01ff)
+
+    def test_no_instance_dict(self):
+        self.assertIsInstance(self.cpu.index_x, SlottedRegister16Bit)
+        for register in self.cpu.register_str2object.values():
+            if register is not self.cpu.cc_register and register.name != "undefined!":
+                self.assertFalse(hasattr(register, "__dict__"), register)
+
+    def test_state(self):
+        self.cpu_test_run(start=0x4000, end=None, mem=[
+            0xCC, 0x12, 0x34, # LDD #$1234
+            0x1F, 0x01, #       TFR D,X
+        ])
+        state = self.cpu.get_state()
+        self.assertEqualHex(state["X"], 0x1234)
+        self.assertEqualHex(state["A"], 0x12)
+
+        self.cpu.accu_d.set(0)
+        self.cpu.set_state(state)
+        self.assertEqualHex(self.cpu.accu_d.value, 0x1234)
+
+
+# Run existing tests with the slotted registers:
+
+class TestSlottedRegisters_Accumulators(test_accumulators.CC_AccumulatorTestCase):
+    CPU_CLASS = CPUSlottedRegisters
+
+
+class TestSlottedRegisters_Arithmetic(test_6809_arithmetic.Test6809_Arithmetic):
+    CPU_CLASS = CPUSlottedRegisters
+
+
+class TestSlottedRegisters_Program(test_6809_program.Test6809_Program):
+    CPU_CLASS = CPUSlottedRegisters
+
+
+class TestSlottedRegisters_TFR(test_6809_register_changes.Test6809_TFR):
+    CPU_CLASS = CPUSlottedRegisters
+
+
+class TestSlottedRegisters_EXG(test_6809_register_changes.Test6809_EXG):
+    CPU_CLASS = CPUSlottedRegisters
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the guest PC sampling profiler
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import io
+import logging
+import os
+import tempfile
+import unittest
+
+from MC6809.components.cpu6809 import CPUBlockCache, CPUDecodeCache, change_cpu
+from MC6809.tests.test_base import BaseCPUTestCase
+
+
+log = logging.getLogger("MC6809")
+
+
+PROGRAM = [
+    0x8D, 0x0E, #        main BSR sub
+    0x20, 0xFC, #             BRA main
+]
+SUB = [
+    0x86, 0x50, #         sub LDA #$50
+    0x4A, #              loop DECA
+    0x26, 0xFD, #             BNE loop
+    0x39, #                   RTS
+]
+
+SYMBOLS = """
+; test program
+$4000 MAIN
+$4010 SUB
+"""
+
+
+class SamplingProfilerTestCase(BaseCPUTestCase):
+    def setUp(self):
+        super(SamplingProfilerTestCase, self).setUp()
+        self.cpu.memory.load(0x4000, PROGRAM)
+        self.cpu.memory.load(0x4010, SUB)
+        self.cpu.program_counter.set(0x4000)
+        self.cpu.system_stack_pointer.set(0x6000)
+        self.cpu.outer_burst_op_count = 50 # 5000 ops
+
+    def tearDown(self):
+        self.cpu.disable_sampling_profiler()
+        super(SamplingProfilerTestCase, self).tearDown()
+
+    def enable(self, **kwargs):
+        fd, self.symbol_file = tempfile.mkstemp(suffix=".sym")
+        with os.fdopen(fd, "w") as f:
+            f.write(SYMBOLS)
+        self.addCleanup(os.remove, self.symbol_file)
+        return self.cpu.enable_sampling_profiler(symbol_file=self.symbol_file, **kwargs)
+
+    def test_collapsed_stacks(self):
+        profiler = self.enable(interval_cycles=97)
+        self.cpu.burst_run()
+        # The periodic event doesn't drift:
+        self.assertEqual(profiler.sample_count, self.cpu.cycles // 97)
+
+        stacks = profiler.get_collapsed_stacks()
+        self.assertEqual(sorted(stacks), ["MAIN", "MAIN;SUB"])
+        self.assertGreater(stacks["MAIN;SUB"], stacks["MAIN"] * 10)
+
+        f = io.StringIO()
+        profiler.write_collapsed(f)
+        lines = f.getvalue().splitlines()
+        self.assertEqual(lines[0], "MAIN %i" % stacks["MAIN"])
+        self.assertEqual(lines[1], "MAIN;SUB %i" % stacks["MAIN;SUB"])
+
+    def test_stack_tricks(self):
+        self.cpu.memory.load(0x4010, [
+            0x32, 0x62, # sub LEAS 2,S ; drop the return address
+            0x20, 0xEC, #     BRA main
+        ])
+        profiler = self.enable(interval_cycles=13)
+        self.cpu.burst_run()
+        # The frame is dropped with the return address, no endless nesting:
+        stacks = set(profiler.get_collapsed_stacks())
+        self.assertIn("MAIN;SUB", stacks)
+        self.assertLessEqual(stacks, set(["MAIN", "MAIN;SUB", "SUB"]))
+        self.assertLessEqual(len(profiler.frames), 1)
+
+    def test_without_symbols(self):
+        profiler = self.cpu.enable_sampling_profiler(interval_cycles=97)
+        self.cpu.burst_run()
+        for stack in profiler.get_collapsed_stacks():
+            frames = stack.split(";")
+            if len(frames) == 1:
+                self.assertIn(frames[0], ("$4000", "$4002"))
+            else:
+                self.assertEqual(frames[0], "$4000") # the BSR op
+                self.assertIn(frames[1], ("$4010", "$4012", "$4013", "$4015"))
+
+    def test_disable(self):
+        profiler = self.enable()
+        self.assertEqual(len(self.cpu.scheduler), 1)
+        self.assertIs(self.cpu.disable_sampling_profiler(), profiler)
+        self.assertEqual(len(self.cpu.scheduler), 0)
+        self.assertEqual(self.cpu.op_funcs[0x39].__name__, "inherent")
+        self.cpu.burst_run()
+        self.assertEqual(profiler.sample_count, 0)
+
+    def test_with_op_profiler(self):
+        self.cpu.enable_sampling_profiler()
+        self.cpu.enable_op_profiler() # wraps the wrapped call ops
+        self.assertRaises(RuntimeError, self.cpu.disable_sampling_profiler)
+        self.assertEqual(len(self.cpu.scheduler), 1) # still sampling
+
+        # Disable in reverse order:
+        self.cpu.disable_op_profiler()
+        self.cpu.disable_sampling_profiler()
+        self.assertEqual(self.cpu.op_funcs[0x39].__name__, "inherent")
+
+    def test_cache_cpus(self):
+        for cpu_class in (CPUBlockCache, CPUDecodeCache):
+            cpu = change_cpu(self.cpu, cpu_class)
+            self.assertRaises(RuntimeError, cpu.enable_sampling_profiler)
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the cycle event scheduler
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import unittest
+
+from MC6809.components.cpu6809 import CPU, CPUSpeedLimit, change_cpu
+from MC6809.components.memory import Memory
+from MC6809.components.mc6809_scheduler import CycleScheduler, NO_DEADLINE
+from MC6809.tests.test_base import BaseCPUTestCase
+
+
+log = logging.getLogger("MC6809")
+
+
+class CycleSchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = CycleScheduler()
+        self.calls = []
+
+    def callback(self, name):
+        def func(cycles):
+            self.calls.append((name, cycles))
+        func.__name__ = name
+        return func
+
+    def test_order(self):
+        self.scheduler.add(30, self.callback("c"))
+        self.scheduler.add(10, self.callback("a"))
+        self.scheduler.add(20, self.callback("b"))
+        self.assertEqual(self.scheduler.next_deadline, 10)
+
+        self.scheduler.run_due(9)
+        self.assertEqual(self.calls, [])
+
+        self.scheduler.run_due(25)
+        self.assertEqual(self.calls, [("a", 15), ("b", 5)])
+        self.assertEqual(self.scheduler.next_deadline, 30)
+        self.assertEqual(len(self.scheduler), 1)
+
+        self.scheduler.run_due(30)
+        self.assertEqual(self.scheduler.next_deadline, NO_DEADLINE)
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_interval(self):
+        event = self.scheduler.add(10, self.callback("timer"), interval=10)
+        for cycles in range(0, 45, 3):
+            self.scheduler.run_due(cycles)
+        # Rescheduled from the due cycles, without drift:
+        self.assertEqual(self.calls, [("timer", 12), ("timer", 9), ("timer", 9), ("timer", 12)])
+        self.assertEqual(event.due_cycles, 50)
+        self.assertRaises(ValueError, self.scheduler.add, 10, self.callback("x"), interval=0)
+
+    def test_missed_periods(self):
+        event = self.scheduler.add(10, self.callback("timer"), interval=10, start_cycles=0)
+        self.scheduler.run_due(35)
+        self.assertEqual(self.calls, [("timer", 35)])
+        self.assertEqual(event.due_cycles, 40)
+
+    def test_reschedule_into_the_past(self):
+        def callback(cycles):
+            event.reschedule(20)
+        event = self.scheduler.add(20, callback)
+        self.assertRaises(ValueError, self.scheduler.run_due, 20)
+
+        # Outside of run_due() the deadline can be in the past:
+        event.reschedule(10)
+        self.assertEqual(self.scheduler.next_deadline, 10)
+
+    def test_compact(self):
+        keep = self.scheduler.add(1000, self.callback("keep"))
+        for due_cycles in range(10):
+            self.scheduler.add(100 + due_cycles, self.callback("x")).cancel()
+        self.assertLessEqual(len(self.scheduler._heap), 2 * len(self.scheduler))
+        self.assertEqual(len(self.scheduler), 1)
+        for due_cycles in range(10):
+            keep.reschedule(1000 + due_cycles)
+        self.assertLessEqual(len(self.scheduler._heap), 2)
+        self.scheduler.run_due(2000)
+        self.assertEqual(self.calls, [("keep", 1000)])
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_cancel(self):
+        event = self.scheduler.add(10, self.callback("a"))
+        self.scheduler.add(20, self.callback("b"))
+        event.cancel()
+        self.assertFalse(event.scheduled)
+        self.scheduler.run_due(100)
+        self.assertEqual(self.calls, [("b", 80)])
+
+    def test_reschedule(self):
+        def callback(cycles):
+            self.calls.append(cycles)
+            if len(self.calls) < 3:
+                event.reschedule(event.last_cycles + 5)
+            else:
+                event.cancel()
+
+        event = self.scheduler.add(10, callback, interval=100, start_cycles=0)
+        for cycles in range(10, 300):
+            self.scheduler.run_due(cycles)
+        self.assertEqual(self.calls, [10, 5, 5])
+        self.assertEqual(self.scheduler.next_deadline, NO_DEADLINE)
+
+
+BRA_LOOP = [0x20, 0xFE] # BRA * -> 5 cycles
+
+
+class CPUSchedulerTestCase(BaseCPUTestCase):
+    def setUp(self):
+        super(CPUSchedulerTestCase, self).setUp()
+        self.cpu.memory.load(0x4000, BRA_LOOP)
+        self.cpu.program_counter.set(0x4000)
+        self.calls = []
+
+    def callback(self, cycles):
+        self.calls.append(cycles)
+
+    def test_sync_callback(self):
+        event = self.cpu.add_sync_callback(1000, self.callback)
+        self.cpu.outer_burst_op_count = 10
+        self.cpu.burst_run() # 10 * 100 ops * 5 cycles
+        self.assertEqual(self.cpu.cycles, 5000)
+        self.assertEqual(self.calls, [1000] * 5)
+        self.assertEqual(sum(self.calls), event.last_cycles)
+
+    def test_cycle_event(self):
+        self.cpu.add_cycle_event(10, self.callback)
+        self.cpu.outer_burst_op_count = 5
+        self.cpu.burst_run()
+        self.assertEqual(self.calls, [10])
+
+    def test_cycle_exact(self):
+        # Called at the first op boundary at/after the due cycle:
+        call_cycles = []
+        def callback(cycles):
+            call_cycles.append(self.cpu.cycles)
+        self.cpu.add_sync_callback(333, callback)
+        self.cpu.add_cycle_event(1003, callback)
+        self.cpu.outer_burst_op_count = 10
+        self.cpu.burst_run()
+        self.assertEqual(self.cpu.cycles, 5000)
+        self.assertEqual(call_cycles[:5], [335, 670, 1000, 1005, 1335])
+        self.assertEqual(len(call_cycles), 5000 // 333 + 1)
+
+    def test_deadline_after_long_ops(self):
+        # CWAI with a pending IRQ is the longest op (38 cycles):
+        memory = self.cpu.memory
+        memory.load(0x4000, [
+            0x34, 0x7F, # loop PSHS CC,A,B,DP,X,Y,U
+            0x35, 0x7F, #      PULS CC,A,B,DP,X,Y,U
+            0x3C, 0xEF, #      CWAI #$EF
+            0x20, 0xF8, #      BRA loop
+        ])
+        memory.load(0x5000, [0x3B]) # RTI
+        memory.load(self.cpu.IRQ_VECTOR, [0x50, 0x00])
+        self.cpu.system_stack_pointer.set(0x6000)
+        self.cpu.assert_irq()
+
+        late_cycles = []
+        def callback(cycles):
+            late_cycles.append(self.cpu.cycles - 10000)
+        self.cpu.add_cycle_event(10000, callback)
+        self.cpu.burst_run()
+        self.assertEqual(len(late_cycles), 1)
+        self.assertLess(late_cycles[0], 38)
+        self.assertLessEqual(38, self.cpu.max_op_cycles)
+
+    def test_per_instance(self):
+        cfg = self.cpu.cfg
+        other_cpu = CPU(Memory(cfg), cfg)
+        self.cpu.add_sync_callback(100, self.callback)
+        self.assertEqual(len(self.cpu.scheduler), 1)
+        self.assertEqual(len(other_cpu.scheduler), 0)
+
+    def test_change_cpu(self):
+        self.cpu.add_sync_callback(1000, self.callback)
+        cpu = change_cpu(self.cpu, CPUSpeedLimit)
+        cpu.outer_burst_op_count = 10
+        cpu.burst_run()
+        self.assertEqual(len(self.calls), 5)
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
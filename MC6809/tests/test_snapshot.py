@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test the binary machine snapshots
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import io
+import logging
+import unittest
+
+from MC6809.components.cpu6809 import CPUDecodeCache, CPUSpeedLimit, change_cpu
+from MC6809.components.mc6809_interrupt import FIRQ_LINE, NMI_LINE, WAIT_CWAI
+from MC6809.components.mc6809_snapshot import HEADER, MEMORY_OFFSET, PAGE_BITMAP_SIZE, \
+    REGISTERS, SNAPSHOT_VERSION, WAITING_INDEX, diff, merge_delta_snapshots
+from MC6809.tests.test_base import BaseCPUTestCase
+
+
+log = logging.getLogger("MC6809")
+
+
+class DummyDevice(object):
+    def __init__(self):
+        self.state = b""
+
+    def get_snapshot_state(self):
+        return self.state
+
+    def set_snapshot_state(self, data):
+        self.state = data
+
+
+class SnapshotTestCase(BaseCPUTestCase):
+    def setUp(self):
+        super(SnapshotTestCase, self).setUp()
+        self.cpu_test_run(start=0x4000, end=None, mem=[
+            0xCC, 0x12, 0x34, # LDD #$1234
+            0x8E, 0x56, 0x78, # LDX #$5678
+            0x10, 0x8E, 0x9A, 0xBC, # LDY #$9ABC
+            0x1A, 0x05, #       ORCC #$05
+        ])
+        self.state = self.cpu.get_state()
+
+    def clear_cpu(self):
+        self.cpu.set_state({
+            "X": 0, "Y": 0, "U": 0, "S": 0, "PC": 0, "A": 0, "B": 0, "DP": 0, "CC": 0,
+            "cycles": 0, "RAM": bytes(0x10000),
+        })
+
+    def test_save_and_load(self):
+        snapshot = self.cpu.save_snapshot()
+        self.assertEqual(len(snapshot), MEMORY_OFFSET + 0x10000)
+        self.clear_cpu()
+        self.assertNotEqual(self.cpu.get_state(), self.state)
+
+        self.cpu.load_snapshot(snapshot)
+        self.assertEqual(self.cpu.get_state(), self.state)
+
+    def test_file_stream(self):
+        device = DummyDevice()
+        device.state = b"device state"
+        self.cpu.add_snapshot_device("test", device)
+
+        f = io.BytesIO()
+        self.cpu.write_snapshot(f)
+        self.assertEqual(f.getvalue(), bytes(self.cpu.save_snapshot()))
+
+        self.clear_cpu()
+        device.state = b""
+        f.seek(0)
+        self.cpu.read_snapshot(f)
+        self.assertEqual(self.cpu.get_state(), self.state)
+        self.assertEqual(device.state, b"device state")
+
+    def test_invalid_snapshots(self):
+        snapshot = self.cpu.save_snapshot()
+        self.assertRaises(ValueError, self.cpu.load_snapshot, b"x" * len(snapshot))
+
+        HEADER.pack_into(snapshot, 0, b"MC6809SS", SNAPSHOT_VERSION + 1)
+        self.assertRaises(ValueError, self.cpu.load_snapshot, snapshot)
+
+        f = io.BytesIO(bytes(self.cpu.save_snapshot())[:-1])
+        self.assertRaises(ValueError, self.cpu.read_snapshot, f)
+
+    def test_interrupt_state(self):
+        self.cpu.trigger_nmi()
+        self.cpu.assert_firq()
+        self.cpu.waiting = WAIT_CWAI
+        snapshot = self.cpu.save_snapshot()
+        self.cpu.interrupt_lines = 0
+        self.cpu.waiting = None
+
+        self.cpu.load_snapshot(snapshot)
+        self.assertEqual(self.cpu.interrupt_lines, NMI_LINE | FIRQ_LINE)
+        self.assertEqual(self.cpu.waiting, WAIT_CWAI)
+
+    def test_cycle_events(self):
+        calls = []
+        timer = self.cpu.add_sync_callback(100, calls.append)
+        event = self.cpu.add_cycle_event(50, calls.append)
+        snapshot = self.cpu.save_snapshot()
+
+        timer.reschedule(self.cpu.cycles + 10)
+        event.cancel()
+        later = self.cpu.add_cycle_event(10, calls.append)
+
+        self.cpu.load_snapshot(snapshot)
+        self.assertEqual(timer.due_cycles, self.state["cycles"] + 100)
+        self.assertEqual(event.due_cycles, self.state["cycles"] + 50)
+        self.assertFalse(later.scheduled) # not in the snapshot
+        self.assertEqual(self.cpu.scheduler.next_deadline, self.state["cycles"] + 50)
+
+        self.cpu.scheduler.run_due(self.state["cycles"] + 100)
+        self.assertEqual(calls, [100, 100]) # cycles since the add_*() call
+        self.assertEqual(timer.interval, 100)
+
+    def test_invalid_body_keeps_state(self):
+        snapshot = self.cpu.save_snapshot()
+        self.clear_cpu()
+        state = self.cpu.get_state()
+        self.assertRaises(ValueError, self.cpu.load_snapshot, snapshot[:-1])
+        self.assertRaises(ValueError, self.cpu.load_snapshot, snapshot + b"\x00")
+        self.assertEqual(self.cpu.get_state(), state)
+
+        registers = list(REGISTERS.unpack_from(snapshot, HEADER.size))
+        registers[WAITING_INDEX] = 0xff
+        REGISTERS.pack_into(snapshot, HEADER.size, *registers)
+        self.assertRaises(ValueError, self.cpu.load_snapshot, snapshot)
+        self.assertEqual(self.cpu.get_state(), state)
+
+    def test_decoded_code_invalidated(self):
+        cpu = change_cpu(self.cpu, CPUDecodeCache)
+        cpu.test_run(0x4000, 0x400C)
+        self.assertIn(0x4000, cpu.decode_cache)
+        snapshot = cpu.save_snapshot()
+        snapshot[MEMORY_OFFSET + 0x4001] = 0x43 # LDD #$4334
+        cpu.load_snapshot(snapshot)
+        self.assertNotIn(0x4000, cpu.decode_cache)
+        cpu.test_run(0x4000, 0x4003)
+        self.assertEqualHex(cpu.accu_d.value, 0x4334)
+
+    def test_change_cpu(self):
+        cpu = change_cpu(self.cpu, CPUSpeedLimit)
+        self.assertIsInstance(cpu, CPUSpeedLimit)
+        self.assertIs(cpu.memory, self.cpu.memory)
+        self.assertEqual(cpu.get_state(), self.state)
+
+
+class DeltaSnapshotTestCase(BaseCPUTestCase):
+    def setUp(self):
+        super(DeltaSnapshotTestCase, self).setUp()
+        self.cpu.memory.start_dirty_tracking()
+        self.cpu.system_stack_pointer.set(0x1000)
+        self.cpu.index_x.set(0x2000)
+        self.base = self.cpu.save_snapshot()
+
+    def run_code(self, value):
+        self.cpu_test_run(start=0x4000, end=None, mem=[
+            0x86, value, #      LDA #value
+            0xA7, 0x80, #       STA ,X+
+            0x34, 0x02, #       PSHS A
+        ])
+
+    def test_delta_snapshots(self):
+        deltas = []
+        states = []
+        for value in range(1, 4):
+            self.run_code(value)
+            deltas.append(self.cpu.save_delta_snapshot())
+            states.append(self.cpu.get_state())
+
+        # only the stack, data and code page:
+        for delta in deltas:
+            self.assertEqual(len(delta), MEMORY_OFFSET + PAGE_BITMAP_SIZE + 3 * 0x100)
+
+        for count in range(4):
+            self.cpu.load_snapshot_chain(self.base, deltas[:count])
+            if count:
+                self.assertEqual(self.cpu.get_state(), states[count - 1])
+            merged = merge_delta_snapshots(self.base, deltas[:count])
+            self.assertEqual(merged, self.cpu.save_snapshot())
+
+    def test_delta_needs_tracking(self):
+        self.cpu.memory.stop_dirty_tracking()
+        self.assertRaises(RuntimeError, self.cpu.save_delta_snapshot)
+
+    def test_diff(self):
+        self.assertEqual(diff(self.base, self.base), [])
+        self.run_code(0x12)
+        snapshot = self.cpu.save_snapshot()
+        self.assertEqual(diff(self.base, snapshot), [
+            (0x0fff, 0x0fff), # PSHS A
+            (0x2000, 0x2000), # STA ,X+
+            (0x4000, 0x4005), # the code
+        ])
+        self.cpu.memory.load(0x40ff, [0xff, 0xff])
+        self.assertEqual(diff(self.base, self.cpu.save_snapshot())[-2:], [
+            (0x4000, 0x4005), (0x40ff, 0x4100),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+"""
+    6809 unittests
+    ~~~~~~~~~~~~~~
+
+    Test seek() and step_back() of the time travel CPU
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import unittest
+
+from MC6809.components.cpu6809 import CPUTimeTravel
+from MC6809.components.mc6809_scheduler import NO_DEADLINE
+from MC6809.tests import test_6809_program
+from MC6809.tests.test_base import BaseCPUTestCase
+
+
+log = logging.getLogger("MC6809")
+
+
+FILL_PROGRAM = [
+    0x8E, 0x50, 0x00, # LDX #$5000
+    0x4F, #             CLRA
+    0xA7, 0x80, # loop  STA ,X+
+    0x4C, #             INCA
+    0x81, 0x40, #       CMPA #$40
+    0x26, 0xF9, #       BNE loop
+]
+
+
+class TimeTravelTestCase(BaseCPUTestCase):
+    CPU_CLASS = CPUTimeTravel
+
+    def setUp(self):
+        super(TimeTravelTestCase, self).setUp()
+        self.cpu.checkpoint_interval = 50
+        self.cpu.memory.load(0x4000, FILL_PROGRAM)
+        self.cpu.program_counter.set(0x4000)
+        self.cpu.add_checkpoint()
+
+        # execute the program and save every state:
+        self.states = [self.cpu.get_state()]
+        while self.cpu.program_counter.value != 0x4000 + len(FILL_PROGRAM):
+            self.cpu.get_and_call_next_op()
+            self.states.append(self.cpu.get_state())
+        self.assertEqual(self.cpu.op_count, len(self.states) - 1)
+
+    def test_checkpoints(self):
+        self.assertGreater(len(self.cpu.checkpoints), 10)
+        self.assertEqual(len(self.cpu.memory.journal_addresses), len(FILL_PROGRAM) + 0x40)
+
+    def test_seek(self):
+        for state in (self.states[0], self.states[100], self.states[-1], self.states[17]):
+            self.cpu.seek(state["cycles"])
+            self.assertEqual(self.cpu.get_state(), state)
+
+        # between two ops:
+        self.cpu.seek(self.states[20]["cycles"] + 1)
+        self.assertEqual(self.cpu.get_state(), self.states[21])
+
+    def test_step_back(self):
+        self.cpu.step_back()
+        self.assertEqual(self.cpu.get_state(), self.states[-2])
+        self.cpu.step_back(100)
+        self.assertEqual(self.cpu.get_state(), self.states[-102])
+        self.assertEqual(self.cpu.op_count, len(self.states) - 102)
+
+        # run again, after going back:
+        self.cpu.seek(self.states[-1]["cycles"])
+        self.assertEqual(self.cpu.get_state(), self.states[-1])
+
+    def test_bounded_memory(self):
+        self.cpu.max_checkpoints = 3
+        self.cpu.add_checkpoint()
+        self.assertEqual(len(self.cpu.checkpoints), 3)
+        oldest = self.cpu.checkpoints[0]
+        self.assertLess(len(self.cpu.memory.journal_addresses), 0x40)
+        self.assertRaises(ValueError, self.cpu.seek, oldest.cycles - 1)
+
+        self.cpu.seek(oldest.cycles)
+        self.assertEqual(self.cpu.get_state(), self.states[oldest.op_count])
+
+
+class TimeTravelWaitTestCase(BaseCPUTestCase):
+    CPU_CLASS = CPUTimeTravel
+
+    def setUp(self):
+        super(TimeTravelWaitTestCase, self).setUp()
+        self.cpu.memory.load(0x4000, [
+            0x12, # NOP
+            0x13, # SYNC
+            0x12, # NOP
+            0x12, # NOP
+        ])
+        self.cpu.program_counter.set(0x4000)
+        self.cpu.set_cc(0x10) # IRQ masked: a IRQ ends SYNC without service
+        self.cpu.add_checkpoint()
+
+    def test_replay_sync(self):
+        self.cpu.assert_irq()
+        self.cpu.add_checkpoint()
+        self.cpu.test_run(start=0x4000, end=0x4004)
+        state = self.cpu.get_state()
+
+        self.cpu.step_back(1)
+        self.assertEqual(self.cpu.program_counter.value, 0x4003)
+        self.cpu.seek(state["cycles"])
+        self.assertEqual(self.cpu.get_state(), state)
+
+    def test_replay_event(self):
+        calls = []
+        def callback(cycles):
+            calls.append(self.cpu.cycles)
+            self.cpu.assert_irq()
+        self.cpu.add_cycle_event(20, callback)
+        self.cpu.add_checkpoint()
+        self.cpu.test_run(start=0x4000, end=0x4004)
+        state = self.cpu.get_state()
+        self.assertEqual(calls, [20])
+
+        self.cpu.seek(0)
+        self.assertEqual(self.cpu.interrupt_lines, 0)
+        self.assertEqual(self.cpu.scheduler.next_deadline, 20)
+        self.cpu.seek(state["cycles"])
+        self.assertEqual(self.cpu.get_state(), state)
+        self.assertEqual(calls, [20, 20])
+
+    def test_drop_future_events(self):
+        self.cpu.test_run(start=0x4000, end=0x4001)
+        event = self.cpu.add_cycle_event(100, lambda cycles: None)
+        self.cpu.seek(0)
+        self.assertFalse(event.scheduled)
+        self.assertEqual(self.cpu.scheduler.next_deadline, NO_DEADLINE)
+
+    def test_replay_endless_wait(self):
+        self.cpu.assert_irq() # not in the checkpoint
+        self.cpu.test_run(start=0x4000, end=0x4004)
+        self.assertRaises(RuntimeError, self.cpu.step_back, 1)
+
+    def test_set_image_drops_checkpoints(self):
+        self.cpu.test_run(start=0x4000, end=0x4001)
+        self.cpu.memory.set_image(self.cpu.memory.get_image().tobytes())
+        self.assertEqual(self.cpu.checkpoints, [])
+        self.assertEqual(len(self.cpu.memory.journal_addresses), 0)
+        # The past is lost, the oldest checkpoint is now:
+        self.assertRaises(ValueError, self.cpu.step_back, 1)
+        self.assertEqual(len(self.cpu.checkpoints), 1)
+        self.assertEqual(self.cpu.checkpoints[0].op_count, 1)
+
+
+# Run existing tests with the time travel CPU:
+
+class TestTimeTravel_Program(test_6809_program.Test6809_Program):
+    CPU_CLASS = CPUTimeTravel
+
+
+if __name__ == '__main__':
+    unittest.main(
+        verbosity=2,
+        # failfast=True,
+    )
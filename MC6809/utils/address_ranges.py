@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+    Map address ranges to values
+    ============================
+
+    Used for memory callbacks/middlewares and for address area infos.
+    Mapping a wide address range costs the same as mapping a single address.
+
+    :copyleft: 2015 by the MC6809 team, see AUTHORS for more details.
+    :license: GNU GPL v3 or above, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import bisect
+
+
+# Page states in AddressRangeMap.pages
+PAGE_EMPTY = 0x00 # no address in this page is mapped
+PAGE_FULL = 0x01 # the complete page is mapped to one value
+PAGE_MIXED = 0x02 # a part of the page is mapped: lookup via bisect
+
+
+class AddressRangeMap(object):
+    """
+    Map address ranges to values, a later mapping overwrites overlapped
+    parts of older mappings (like a dict with one entry per address).
+
+    Stored as sorted, non overlapping intervals. Every 256 Bytes page of
+    the 64KB address space has a state in self.pages, so most lookups are
+    answered without a bisect search.
+
+    >>> m = AddressRangeMap()
+    >>> m.add("foo", 0x0100, 0x02ff)
+    >>> m.add("bar", 0x0180)
+    >>> m[0x0100], m[0x0180], m[0x0181], m[0x02ff]
+    ('foo', 'bar', 'foo', 'foo')
+    >>> 0x0300 in m, m.get(0x0300)
+    (False, None)
+    >>> for start, end, value in m.iter_ranges():
+    ...     print("$%04x-$%04x: %s" % (start, end, value))
+    $0100-$017f: foo
+    $0180-$0180: bar
+    $0181-$02ff: foo
+    >>> m.pages[0x01], m.pages[0x02], m.pages[0x03]
+    (2, 1, 0)
+    >>> len(m)
+    512
+    """
+    def __init__(self):
+        self._starts = []
+        self._ends = []
+        self._values = []
+
+        self.pages = bytearray(256)
+        self._page_values = [None] * 256
+
+    def add(self, value, start, end=None):
+        if end is None:
+            end = start
+        assert start <= end, "Start $%x is greater than end $%x" % (start, end)
+
+        starts, ends, values = self._starts, self._ends, self._values
+
+        # All intervals in [first:last] overlaps the new one:
+        first = bisect.bisect_left(ends, start)
+        last = bisect.bisect_right(starts, end)
+
+        new_starts = []
+        new_ends = []
+        new_values = []
+        if first < last and starts[first] < start:
+            # keep the left part of the first overlapped interval
+            new_starts.append(starts[first])
+            new_ends.append(start - 1)
+            new_values.append(values[first])
+        new_starts.append(start)
+        new_ends.append(end)
+        new_values.append(value)
+        if first < last and ends[last - 1] > end:
+            # keep the right part of the last overlapped interval
+            new_starts.append(end + 1)
+            new_ends.append(ends[last - 1])
+            new_values.append(values[last - 1])
+
+        # merge with direct neighbours that have the same value:
+        if first > 0 and ends[first - 1] == new_starts[0] - 1 \
+                and values[first - 1] is new_values[0]:
+            first -= 1
+            new_starts[0] = starts[first]
+        if last < len(starts) and starts[last] == new_ends[-1] + 1 \
+                and values[last] is new_values[-1]:
+            new_ends[-1] = ends[last]
+            last += 1
+
+        starts[first:last] = new_starts
+        ends[first:last] = new_ends
+        values[first:last] = new_values
+
+        for page in range(start >> 8, min(end >> 8, 0xff) + 1):
+            self._update_page(page)
+
+    def _update_page(self, page):
+        page_start = page << 8
+        page_end = page_start + 0xff
+
+        index = bisect.bisect_left(self._ends, page_start)
+        if index >= len(self._starts) or self._starts[index] > page_end:
+            self.pages[page] = PAGE_EMPTY
+            self._page_values[page] = None
+        elif self._starts[index] <= page_start and self._ends[index] >= page_end:
+            self.pages[page] = PAGE_FULL
+            self._page_values[page] = self._values[index]
+        else:
+            self.pages[page] = PAGE_MIXED
+            self._page_values[page] = None
+
+    def get(self, address, default=None):
+        page = address >> 8
+        if page < 0x100:
+            state = self.pages[page]
+            if state == PAGE_EMPTY:
+                return default
+            elif state == PAGE_FULL:
+                return self._page_values[page]
+
+        index = bisect.bisect_left(self._ends, address)
+        if index < len(self._starts) and self._starts[index] <= address:
+            return self._values[index]
+        return default
+
+    def __getitem__(self, address):
+        value = self.get(address, self)
+        if value is self:
+            raise KeyError(address)
+        return value
+
+    def __contains__(self, address):
+        return self.get(address, self) is not self
+
+    def iter_ranges(self):
+        """ yield all mapped (start, end, value) intervals """
+        return zip(self._starts, self._ends, self._values)
+
+    def __iter__(self):
+        """ yield all mapped addresses, like a dict """
+        for start, end in zip(self._starts, self._ends):
+            for address in range(start, end + 1):
+                yield address
+
+    def __len__(self):
+        """ number of mapped addresses, like a dict """
+        return sum([end - start + 1 for start, end in zip(self._starts, self._ends)])
+
+    def __bool__(self):
+        return bool(self._starts)
+    __nonzero__ = __bool__ # Python 2
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod(
+        verbose=False
+        # verbose=True
+    ))